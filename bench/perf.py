@@ -0,0 +1,496 @@
+"""Throughput and tail-latency benchmarks on synthetic corpora.
+
+Micro-benchmarks cover ingest (BM25 build + vector insert), ``BM25Index.search``,
+BM25L scoring over raw vs block-compressed postings, ``VectorStore.search``,
+``HybridRetriever.retrieve`` and ``rerank``; the
+end-to-end run drives ``POST /query`` over HTTP with concurrent clients and the
+stub LLM backend (``--llm-latency-ms`` / ``--llm-tokens-per-s`` simulate a model).
+The JSON report holds p50/p95/p99 latency, QPS and peak RSS per corpus size and
+can be compared against a stored baseline.
+
+With ``--models stub`` (the default) the embedding model and cross-encoder are
+replaced by cheap deterministic stand-ins, so runs need no network or GPU and
+measure the retrieval machinery rather than model inference.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import structlog
+
+from src.rag import embeddings, llm, reranker
+from src.rag.bm25_index import BM25Index
+from src.rag.codec import CompressedPostings
+from src.rag.generations import IndexGeneration
+from src.rag.hybrid_retriever import HybridRetriever
+from src.rag.models import Chunk
+from src.rag.pipeline import RAGPipeline
+from src.rag.postings import bm25l_scores
+from src.rag.reranker import rerank
+from src.rag.vector_store import VectorStore
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BENCHMARKS = (
+    "ingest",
+    "bm25_search",
+    "postings",
+    "vector_search",
+    "retrieve",
+    "rerank",
+    "query_load",
+)
+
+# Metric -> True if higher is better
+_METRIC_DIRECTION = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "mean_ms": False,
+    "seconds": False,
+    "peak_rss_mb": False,
+    "qps": True,
+    "chunks_per_s": True,
+}
+
+_SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+_STUB_DIM = 384
+
+
+@dataclass
+class BenchConfig:
+    chunks: int
+    queries: int = 200
+    seed: int = 0
+    words_per_chunk: int = 80
+    vocab_size: int = 30_000
+    models: Literal["stub", "real"] = "stub"
+    load_concurrency: int = 8
+    load_requests: int = 400
+    rerank_candidates: int = 25
+    llm_latency_ms: float = 0.0
+    llm_tokens_per_s: float = 0.0
+    skip: list[str] = field(default_factory=list)
+
+
+# --- Synthetic data ---------------------------------------------------------
+
+
+def _vocabulary(size: int, rng: np.random.Generator) -> list[str]:
+    words: set[str] = set()
+    while len(words) < size:
+        n = int(rng.integers(1, 5))
+        words.add("".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), n)))
+    return sorted(words)
+
+
+def synthetic_corpus(
+    n: int, seed: int = 0, words_per_chunk: int = 80, vocab_size: int = 30_000
+) -> list[Chunk]:
+    """``n`` chunks of Zipf-distributed pseudo-words spread over ``n / 20`` files."""
+    rng = np.random.default_rng(seed)
+    vocab = np.asarray(_vocabulary(vocab_size, rng))
+    ids = np.minimum(rng.zipf(1.15, size=(n, words_per_chunk)), vocab_size) - 1
+    files = max(1, n // 20)
+    chunks = []
+    for i in range(n):
+        f = i % files
+        chunks.append(
+            Chunk(
+                chunk_id=f"syn-{i}",
+                text=" ".join(vocab[ids[i]]),
+                source=f"synthetic/dir{f % 50}/doc{f}.{'pdf' if f % 3 == 0 else 'md'}",
+                title=f"Document {f}",
+                page=(i // files) + 1,
+                ingested_at=1_700_000_000 + f * 3600,
+            )
+        )
+    return chunks
+
+
+def synthetic_queries(chunks: Sequence[Chunk], n: int, seed: int = 0) -> list[str]:
+    """Queries of 2-8 words sampled from random chunks, so most have matches."""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for i in rng.integers(0, len(chunks), n):
+        words = chunks[int(i)].text.split()
+        k = int(rng.integers(2, 9))
+        start = int(rng.integers(0, max(1, len(words) - k)))
+        queries.append(" ".join(words[start : start + k]))
+    return queries
+
+
+# --- Model stand-ins --------------------------------------------------------
+
+
+def stub_embed(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Signed feature hashing of tokens, L2-normalized."""
+    out = np.zeros((len(texts), _STUB_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in text.lower().split():
+            h = zlib.crc32(token.encode())
+            out[row, h % _STUB_DIM] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.where(norms == 0, 1.0, norms)
+
+
+def stub_score(pairs: Sequence[Sequence[str]]) -> np.ndarray:
+    """Token-overlap score standing in for the cross-encoder."""
+    scores = []
+    for query, passage in pairs:
+        q = set(query.lower().split())
+        scores.append(len(q & set(passage.lower().split())) / (len(q) or 1))
+    return np.asarray(scores, dtype=np.float32)
+
+
+@contextmanager
+def _patched(target: Any, name: str, value: Any) -> Iterator[None]:
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+@contextmanager
+def model_mode(models: str) -> Iterator[None]:
+    """Swap in the stub models (``stub``) or leave the real ones (``real``)."""
+    if models == "real":
+        yield
+        return
+    with (
+        _patched(embeddings, "embed_texts_local", stub_embed),
+        _patched(reranker, "score_pairs_local", stub_score),
+    ):
+        yield
+
+
+# --- Measurement ------------------------------------------------------------
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def summarize(latencies_s: Sequence[float], wall_s: float) -> dict[str, float]:
+    lat = np.asarray(latencies_s, dtype=np.float64) * 1000
+    return {
+        "n": len(lat),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "mean_ms": round(float(lat.mean()), 3),
+        "qps": round(len(lat) / wall_s, 1) if wall_s > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def time_calls(
+    fn: Callable[[str], Any], inputs: Sequence[str], warmup: int = 5
+) -> dict[str, float]:
+    for q in inputs[:warmup]:
+        fn(q)
+    latencies = []
+    started = time.perf_counter()
+    for q in inputs:
+        t = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def run_query_load(
+    pipe: RAGPipeline, queries: Sequence[str], concurrency: int, requests: int
+) -> dict[str, float]:
+    """Drive ``POST /query`` over HTTP from ``concurrency`` client threads.
+
+    Generation goes through whatever LLM backend is active; ``run`` installs
+    the stub backend.
+    """
+    import httpx
+    import uvicorn
+
+    from src.rag import api
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(api.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def client() -> None:
+        nonlocal errors
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as http:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                t = time.perf_counter()
+                resp = http.post("/query", json={"query": queries[i % len(queries)]})
+                elapsed = time.perf_counter() - t
+                with lock:
+                    latencies.append(elapsed)
+                    errors += resp.status_code != 200
+
+    with _patched(api, "pipeline", pipe):
+        api.startup.reset()
+        api.startup.advance("ready")
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=client) for _ in range(concurrency)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            wall = time.perf_counter() - started
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    return {**summarize(latencies, wall), "concurrency": concurrency, "errors": errors}
+
+
+def run_postings(bm25: BM25Index, queries: Sequence[str]) -> dict[str, dict[str, Any]]:
+    """BM25L scoring over raw CSR postings vs block-compressed ones, plus their sizes."""
+    raw = bm25.to_postings()
+    started = time.perf_counter()
+    packed = CompressedPostings.from_postings(raw)
+    encode_s = time.perf_counter() - started
+    started = time.perf_counter()
+    packed.decode()
+    decode_s = time.perf_counter() - started
+    raw_mb = (raw.indptr.nbytes + raw.doc_ids.nbytes + raw.tfs.nbytes + raw.doc_len.nbytes) / 2**20
+    analyzed = {q: bm25.analyzer(q) for q in queries}
+    return {
+        "postings_raw": {
+            **time_calls(lambda q: bm25l_scores(raw, analyzed[q]), queries),
+            "postings": len(raw.doc_ids),
+            "memory_mb": round(raw_mb, 2),
+        },
+        "postings_vbyte": {
+            **time_calls(lambda q: bm25l_scores(packed, analyzed[q]), queries),
+            "memory_mb": round(packed.nbytes / 2**20, 2),
+            "encode_s": round(encode_s, 3),
+            "full_decode_s": round(decode_s, 3),
+        },
+    }
+
+
+def run_size(config: BenchConfig, workdir: Path) -> dict[str, dict[str, Any]]:
+    """All benchmarks for one corpus size."""
+    results: dict[str, dict[str, Any]] = {}
+    skip = set(config.skip)
+    chunks = synthetic_corpus(config.chunks, config.seed, config.words_per_chunk, config.vocab_size)
+    queries = synthetic_queries(chunks, config.queries, config.seed)
+
+    started = time.perf_counter()
+    bm25 = BM25Index()
+    bm25.build(chunks)
+    bm25_s = time.perf_counter() - started
+    vector = VectorStore(persist_dir=str(workdir / "chroma"), collection_name="bench")
+    vector.reset()
+    started = time.perf_counter()
+    vector.add_chunks(chunks, batch_size=512)
+    vector_s = time.perf_counter() - started
+    if "ingest" not in skip:
+        total = bm25_s + vector_s
+        results["ingest"] = {
+            "n": len(chunks),
+            "bm25_build_s": round(bm25_s, 3),
+            "bm25_terms": bm25.vocab_size,
+            "bm25_memory_mb": round(bm25.memory_bytes / 2**20, 2),
+            "vector_add_s": round(vector_s, 3),
+            "seconds": round(total, 3),
+            "chunks_per_s": round(len(chunks) / total, 1),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    retriever = HybridRetriever(bm25, vector)
+    if "bm25_search" not in skip:
+        results["bm25_search"] = time_calls(bm25.search, queries)
+    if "postings" not in skip:
+        results.update(run_postings(bm25, queries))
+    if "vector_search" not in skip:
+        results["vector_search"] = time_calls(vector.search, queries)
+    if "retrieve" not in skip:
+        results["retrieve"] = time_calls(retriever.retrieve, queries)
+    if "rerank" not in skip:
+        candidates = {q: retriever.retrieve(q)[: config.rerank_candidates] for q in queries}
+        results["rerank"] = time_calls(lambda q: rerank(q, candidates[q]), queries)
+    if "query_load" not in skip:
+        pipe = RAGPipeline(docs_dir=workdir / "docs", bm25_path=workdir / "bm25.json")
+        pipe._generations.publish(IndexGeneration(1, bm25, vector))
+        results["query_load"] = run_query_load(
+            pipe, queries, config.load_concurrency, config.load_requests
+        )
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        )
+        return out.stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(sizes: Sequence[int], base: BenchConfig) -> dict[str, Any]:
+    report: dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count() or 1,
+            "created_at": int(time.time()),
+            "config": {k: v for k, v in asdict(base).items() if k != "chunks"},
+        },
+        "runs": {},
+    }
+    llm.set_backend(llm.StubBackend(base.llm_latency_ms, base.llm_tokens_per_s))
+    try:
+        with model_mode(base.models):
+            for n in sizes:
+                workdir = Path(tempfile.mkdtemp(prefix=f"documind-bench-{n}-"))
+                try:
+                    config = BenchConfig(**{**asdict(base), "chunks": n})
+                    report["runs"][str(n)] = run_size(config, workdir)
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        llm.set_backend(None)
+    return report
+
+
+# --- Baseline comparison ----------------------------------------------------
+
+
+def compare(
+    report: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.10
+) -> list[dict[str, Any]]:
+    """Per-metric relative change versus ``baseline``; ``regression`` marks the bad ones.
+
+    A metric regresses when it moves in the wrong direction by more than
+    ``threshold`` (a fraction, e.g. 0.10 for 10%).
+    """
+    rows = []
+    for size, benches in report.get("runs", {}).items():
+        for bench, metrics in benches.items():
+            base = baseline.get("runs", {}).get(size, {}).get(bench)
+            if base is None:
+                continue
+            for metric, higher_better in _METRIC_DIRECTION.items():
+                if metric not in metrics or metric not in base or not base[metric]:
+                    continue
+                change = (metrics[metric] - base[metric]) / base[metric]
+                worse = -change if higher_better else change
+                rows.append(
+                    {
+                        "size": size,
+                        "bench": bench,
+                        "metric": metric,
+                        "baseline": base[metric],
+                        "current": metrics[metric],
+                        "change_pct": round(change * 100, 1),
+                        "regression": worse > threshold,
+                    }
+                )
+    return rows
+
+
+def format_comparison(rows: list[dict[str, Any]]) -> str:
+    lines = [
+        f"{'size':>8} {'bench':<14} {'metric':<13} {'baseline':>10} {'current':>10} {'change':>8}"
+    ]
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        lines.append(
+            f"{r['size']:>8} {r['bench']:<14} {r['metric']:<13} {r['baseline']:>10} "
+            f"{r['current']:>10} {r['change_pct']:>+7.1f}%{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="DocuMind throughput / tail-latency benchmarks")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models", choices=["stub", "real"], default="stub")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=0.0, help="0 = instant")
+    parser.add_argument("--skip", nargs="*", default=[], choices=BENCHMARKS)
+    parser.add_argument("--out", type=Path, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, help="compare against a stored report")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument(
+        "--fail-on-regression", action="store_true", help="exit 1 if any metric regressed"
+    )
+    args = parser.parse_args(argv)
+
+    # Per-query info logs would dominate the measurement
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    config = BenchConfig(
+        chunks=0,
+        queries=args.queries,
+        seed=args.seed,
+        models=args.models,
+        load_concurrency=args.concurrency,
+        load_requests=args.requests,
+        llm_latency_ms=args.llm_latency_ms,
+        llm_tokens_per_s=args.llm_tokens_per_s,
+        skip=list(args.skip),
+    )
+    report = run(args.chunks, config)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        rows = compare(report, baseline, args.threshold)
+        print(format_comparison(rows))
+        if args.fail_on_regression and any(r["regression"] for r in rows):
+            return 1
+    return 0
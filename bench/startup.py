@@ -0,0 +1,93 @@
+"""Startup benchmark: module import time and time-to-ready of the API server."""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import src.rag.api; print(time.perf_counter() - t)"
+)
+
+
+def measure_import_time(runs: int = 3) -> float:
+    """Best-of-N wall time to import ``src.rag.api`` in a fresh interpreter."""
+    best = float("inf")
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SNIPPET],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        best = min(best, float(out.stdout.strip().splitlines()[-1]))
+    return best
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _get_health(port: int) -> dict[str, str] | None:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as r:
+            return json.loads(r.read())  # type: ignore[no-any-return]
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def measure_time_to_ready(timeout_s: float = 300.0, mode: str = "background") -> dict[str, float]:
+    """Launch uvicorn and poll /health until the server answers, then until ready."""
+    port = _free_port()
+    env = {**os.environ, "RAG_STARTUP_MODE": mode}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.rag.api:app", "--port", str(port)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    first_response: float | None = None
+    try:
+        while time.perf_counter() - start < timeout_s:
+            health = _get_health(port)
+            if health is not None:
+                if first_response is None:
+                    first_response = time.perf_counter() - start
+                if health.get("startup") in ("ready", "failed"):
+                    return {
+                        "time_to_first_response_s": round(first_response, 3),
+                        "time_to_ready_s": round(time.perf_counter() - start, 3),
+                        "ready": float(health.get("startup") == "ready"),
+                    }
+            time.sleep(0.05)
+        raise TimeoutError(f"server not ready after {timeout_s}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    report = {
+        "import_time_s": round(measure_import_time(), 3),
+        "background": measure_time_to_ready(mode="background"),
+        "blocking": measure_time_to_ready(mode="blocking"),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import re
+import threading
+from pathlib import Path
 
-from google import genai
-from google.genai import types
 from pydantic import BaseModel
 
 from src.rag.citations import extract_citation_ids
+from src.rag.config import settings
+from src.rag.llm import LLMRequest, get_backend
 from src.rag.models import RAGResponse
+from src.rag.resilience import complete_resilient
 
 from .dataset import GoldenExample
 
@@ -22,32 +28,100 @@ class EvalScores(BaseModel):
     source_recall: float  # Did we retrieve the expected sources?
 
 
+JUDGE_SYSTEM_PROMPT = (
+    "You are an evaluation judge. Score the following on a scale of 0.0 to 1.0. "
+    "Return ONLY a decimal number, nothing else."
+)
+
+
+class JudgeCache:
+    """Judge scores keyed by (prompt hash, judge model), persisted as one JSON file.
+
+    The prompt embeds the answer and references being judged, so an
+    unchanged answer is never sent to the judge twice.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path
+        self._scores: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and path.exists():
+            self._scores = json.loads(path.read_text(encoding="utf-8"))
+
+    @staticmethod
+    def key(prompt: str, model: str) -> str:
+        digest = hashlib.sha256(f"{JUDGE_SYSTEM_PROMPT}\n{prompt}".encode()).hexdigest()
+        return f"{digest}:{model}"
+
+    def get(self, prompt: str, model: str) -> float | None:
+        with self._lock:
+            score = self._scores.get(self.key(prompt, model))
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return score
+
+    def put(self, prompt: str, model: str, score: float) -> None:
+        with self._lock:
+            self._scores[self.key(prompt, model)] = score
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self._scores, sort_keys=True)
+        tmp = self.path.with_suffix(f".tmp-{os.getpid()}")
+        tmp.write_text(data, encoding="utf-8")
+        tmp.replace(self.path)
+
+
 def _llm_judge(
     prompt: str,
     api_key: str,
     model: str = "gemini-2.5-flash",
+    cache: JudgeCache | None = None,
 ) -> float:
     """Use an LLM to score on a 0-1 scale."""
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
+    if cache is not None:
+        cached = cache.get(prompt, model)
+        if cached is not None:
+            return cached
+    request = LLMRequest(
         model=model,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            system_instruction=(
-                "You are an evaluation judge. Score the following on a scale of 0.0 to 1.0. "
-                "Return ONLY a decimal number, nothing else."
-            ),
-            temperature=0.0,
-        ),
+        prompt=prompt,
+        system=JUDGE_SYSTEM_PROMPT,
+        temperature=0.0,
     )
-    raw = (response.text or "0").strip()
+    backend = get_backend(api_key)
+    # Scores are cached per judge model, so only that model may answer
+    raw = complete_resilient(
+        backend,
+        request,
+        max_retries=settings.eval_max_retries,
+        retry_delay_s=settings.eval_retry_base_delay_s,
+        hedge=False,
+        fallback=False,
+    )
+    raw = (raw or "0").strip()
     # Extract first float from response and clamp to [0, 1]
     match = re.search(r"(\d+\.?\d*)", raw)
     score = float(match.group(1)) if match else 0.0
-    return max(0.0, min(1.0, score))
+    score = max(0.0, min(1.0, score))
+    if cache is not None:
+        cache.put(prompt, model, score)
+    return score
 
 
-def score_faithfulness(response: RAGResponse, api_key: str) -> float:
+def score_faithfulness(
+    response: RAGResponse, api_key: str, cache: JudgeCache | None = None
+) -> float:
     """Score whether the answer is grounded in the provided chunks."""
     chunks_text = "\n---\n".join(sc.chunk.text for sc in response.chunks_used)
     prompt = (
@@ -56,10 +130,10 @@ def score_faithfulness(response: RAGResponse, api_key: str) -> float:
         "Score how well the answer is grounded in the references (0.0 = not grounded, "
         "1.0 = fully grounded). Penalize claims not in the references."
     )
-    return _llm_judge(prompt, api_key)
+    return _llm_judge(prompt, api_key, cache=cache)
 
 
-def score_relevance(response: RAGResponse, api_key: str) -> float:
+def score_relevance(response: RAGResponse, api_key: str, cache: JudgeCache | None = None) -> float:
     """Score whether the answer actually addresses the question."""
     prompt = (
         f"Question: {response.query}\n\n"
@@ -67,7 +141,7 @@ def score_relevance(response: RAGResponse, api_key: str) -> float:
         "Score how well the answer addresses the question (0.0 = completely irrelevant, "
         "1.0 = perfectly relevant and complete)."
     )
-    return _llm_judge(prompt, api_key)
+    return _llm_judge(prompt, api_key, cache=cache)
 
 
 def score_citation_accuracy(response: RAGResponse) -> float:
@@ -112,12 +186,13 @@ def evaluate_example(
     response: RAGResponse,
     golden: GoldenExample,
     api_key: str,
+    cache: JudgeCache | None = None,
 ) -> EvalScores:
     """Run all metrics on a single example."""
     return EvalScores(
         question=golden.question,
-        faithfulness=score_faithfulness(response, api_key),
-        relevance=score_relevance(response, api_key),
+        faithfulness=score_faithfulness(response, api_key, cache),
+        relevance=score_relevance(response, api_key, cache),
         citation_accuracy=score_citation_accuracy(response),
         source_recall=score_source_recall(response, golden.expected_sources),
     )
@@ -0,0 +1,249 @@
+"""Retrieval-only evaluation: recall@k, MRR and nDCG without generation or judging.
+
+Scores are computed at the source-document level against
+``GoldenExample.expected_sources``: the ranked chunks are collapsed to their
+distinct sources (first occurrence wins) and a source is relevant when it
+matches an expected source, as in ``score_source_recall``. All questions of
+a configuration are retrieved in one batch (one embedding call, one
+cross-encoder call), so a sweep over retrieval settings costs seconds.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+import sys
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import structlog
+from pydantic import TypeAdapter
+
+from src.rag.config import Settings, settings
+from src.rag.metrics import trace
+from src.rag.models import ScoredChunk
+from src.rag.pipeline import RAGPipeline
+
+from .dataset import GoldenExample
+
+log = structlog.get_logger()
+
+DEFAULT_KS = (1, 3, 5, 10)
+
+# Settings that change the index itself; sweeping them re-ingests into a temp store
+REINDEX_FIELDS = frozenset(
+    {
+        "chunk_size",
+        "chunk_overlap",
+        "bm25_stopwords",
+        "bm25_stemming",
+        "bm25_unicode_normalize",
+        "embedding_model",
+    }
+)
+
+
+def _normalize(source: str) -> str:
+    return source.replace("\\", "/")
+
+
+def ranked_sources(chunks: list[ScoredChunk]) -> list[str]:
+    """Distinct sources in rank order."""
+    return list(dict.fromkeys(_normalize(sc.chunk.source) for sc in chunks))
+
+
+def relevant_ranks(expected: list[str], sources: list[str]) -> list[int]:
+    """1-based ranks of the sources that match an expected source (each counted once)."""
+    ranks: list[int] = []
+    remaining = [_normalize(e) for e in expected]
+    for rank, source in enumerate(sources, start=1):
+        for e in remaining:
+            if e in source:
+                ranks.append(rank)
+                remaining.remove(e)
+                break
+    return ranks
+
+
+def recall_at_k(ranks: list[int], n_expected: int, k: int) -> float:
+    return sum(1 for r in ranks if r <= k) / n_expected if n_expected else 0.0
+
+
+def reciprocal_rank(ranks: list[int]) -> float:
+    return 1.0 / ranks[0] if ranks else 0.0
+
+
+def ndcg_at_k(ranks: list[int], n_expected: int, k: int) -> float:
+    """Binary-relevance nDCG@k."""
+    dcg = sum(1.0 / math.log2(r + 1) for r in ranks if r <= k)
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(n_expected, k)))
+    return dcg / ideal if ideal else 0.0
+
+
+@dataclass
+class RetrievalScores:
+    question: str
+    ranks: list[int]
+    n_expected: int
+    n_sources: int
+
+    def recall(self, k: int) -> float:
+        return recall_at_k(self.ranks, self.n_expected, k)
+
+    def ndcg(self, k: int) -> float:
+        return ndcg_at_k(self.ranks, self.n_expected, k)
+
+    @property
+    def mrr(self) -> float:
+        return reciprocal_rank(self.ranks)
+
+    @property
+    def candidate_recall(self) -> float:
+        """Recall over every retrieved candidate: the ceiling reranking can reach."""
+        return recall_at_k(self.ranks, self.n_expected, self.n_sources)
+
+
+@dataclass
+class RetrievalReport:
+    config: dict[str, Any] = field(default_factory=dict)
+    ks: tuple[int, ...] = DEFAULT_KS
+    scores: list[RetrievalScores] = field(default_factory=list)
+    stage_ms: dict[str, float] = field(default_factory=dict)  # mean per question
+    wall_clock_s: float = 0.0
+
+    @staticmethod
+    def _mean(values: Iterable[float]) -> float:
+        vals = list(values)
+        return sum(vals) / len(vals) if vals else 0.0
+
+    def summary(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"config": self.config, "num_examples": len(self.scores)}
+        for k in self.ks:
+            out[f"recall@{k}"] = round(self._mean(s.recall(k) for s in self.scores), 4)
+        out["mrr"] = round(self._mean(s.mrr for s in self.scores), 4)
+        for k in self.ks:
+            out[f"ndcg@{k}"] = round(self._mean(s.ndcg(k) for s in self.scores), 4)
+        out["candidate_recall"] = round(self._mean(s.candidate_recall for s in self.scores), 4)
+        out["stage_ms"] = {stage: round(ms, 3) for stage, ms in self.stage_ms.items()}
+        out["wall_clock_s"] = round(self.wall_clock_s, 3)
+        out["qps"] = round(len(self.scores) / self.wall_clock_s, 1) if self.wall_clock_s else 0.0
+        return out
+
+
+@contextmanager
+def override_settings(overrides: dict[str, Any]) -> Iterator[None]:
+    """Temporarily set ``Settings`` fields, validating names and values."""
+    fields = Settings.model_fields
+    unknown = set(overrides) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    values = {
+        name: TypeAdapter(fields[name].annotation).validate_python(value)
+        for name, value in overrides.items()
+    }
+    previous = {name: getattr(settings, name) for name in values}
+    try:
+        for name, value in values.items():
+            setattr(settings, name, value)
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+def expand_grid(grid: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    """Cartesian product of a ``{setting: [values]}`` grid."""
+    if not grid:
+        return [{}]
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*grid.values())]
+
+
+def evaluate_retrieval(
+    pipeline: RAGPipeline,
+    golden: list[GoldenExample],
+    ks: tuple[int, ...] = DEFAULT_KS,
+    use_reranker: bool = True,
+    config: dict[str, Any] | None = None,
+) -> RetrievalReport:
+    """Score retrieval for every golden example that lists expected sources."""
+    examples = [e for e in golden if e.expected_sources]
+    report = RetrievalReport(config=dict(config or {}), ks=tuple(sorted(ks)))
+    if not examples:
+        return report
+
+    questions = [e.question for e in examples]
+    started = time.perf_counter()
+    with trace() as t:
+        # Keep every candidate: cutoffs are applied per metric
+        results = pipeline.retrieve_many(questions, top_k=sys.maxsize, use_reranker=use_reranker)
+    report.wall_clock_s = time.perf_counter() - started
+    report.stage_ms = {stage: ms / len(questions) for stage, ms in t.timings_ms().items()}
+
+    for example, chunks in zip(examples, results):
+        sources = ranked_sources(chunks)
+        report.scores.append(
+            RetrievalScores(
+                question=example.question,
+                ranks=relevant_ranks(example.expected_sources, sources),
+                n_expected=len(example.expected_sources),
+                n_sources=len(sources),
+            )
+        )
+    return report
+
+
+def run_sweep(
+    pipeline: RAGPipeline,
+    golden: list[GoldenExample],
+    configs: list[dict[str, Any]],
+    ks: tuple[int, ...] = DEFAULT_KS,
+    use_reranker: bool = True,
+) -> list[RetrievalReport]:
+    """Evaluate retrieval once per settings override.
+
+    Query-time knobs (``bm25_top_k``, ``rrf_k``, ``fusion_method``, ...) reuse
+    the pipeline's indexes. Configurations that touch ``REINDEX_FIELDS``
+    re-ingest ``pipeline.docs_dir`` into a throwaway index first.
+    """
+    reports: list[RetrievalReport] = []
+    for config in configs:
+        log.info("retrieval_eval_config", **config)
+        if not REINDEX_FIELDS & config.keys():
+            with override_settings(config):
+                reports.append(evaluate_retrieval(pipeline, golden, ks, use_reranker, config))
+            continue
+        with tempfile.TemporaryDirectory(prefix="documind-sweep-") as tmp:
+            with override_settings({**config, "chroma_dir": Path(tmp) / "chroma"}):
+                scratch = RAGPipeline(docs_dir=pipeline.docs_dir, bm25_path=Path(tmp) / "bm25.json")
+                scratch.ingest()
+                reports.append(evaluate_retrieval(scratch, golden, ks, use_reranker, config))
+    return reports
+
+
+def format_table(reports: list[RetrievalReport]) -> str:
+    """One row per configuration: config, ranking metrics and mean latency per question."""
+    if not reports:
+        return ""
+    summaries = [r.summary() for r in reports]
+    metric_cols = [c for c in summaries[0] if c.startswith(("recall@", "ndcg@")) or c == "mrr"] + [
+        "candidate_recall"
+    ]
+    headers = ["config", *metric_cols, "ms/query", "qps"]
+    rows = []
+    for s in summaries:
+        config = ", ".join(f"{k}={v}" for k, v in s["config"].items()) or "(defaults)"
+        ms = sum(s["stage_ms"].get(stage, 0.0) for stage in ("embed_queries", "retrieve", "rerank"))
+        rows.append([config, *(f"{s[c]:.3f}" for c in metric_cols), f"{ms:.2f}", f"{s['qps']}"])
+    widths = [max(len(h), *(len(r[i]) for r in rows)) for i, h in enumerate(headers)]
+    lines = [
+        "  ".join(h.ljust(w) for h, w in zip(headers, widths)),
+        "  ".join("-" * w for w in widths),
+    ]
+    lines.extend("  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in rows)
+    return "\n".join(lines)
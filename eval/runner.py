@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import argparse
 import json
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
 
 import structlog
 
@@ -11,7 +15,8 @@ from src.rag.config import settings
 from src.rag.pipeline import RAGPipeline
 
 from .dataset import GoldenExample, load_golden_set
-from .metrics import EvalScores, evaluate_example
+from .metrics import EvalScores, JudgeCache, evaluate_example
+from .retrieval import DEFAULT_KS, expand_grid, format_table, run_sweep
 
 log = structlog.get_logger()
 
@@ -19,6 +24,11 @@ log = structlog.get_logger()
 @dataclass
 class EvalReport:
     scores: list[EvalScores] = field(default_factory=list)
+    failed: int = 0
+    wall_clock_s: float = 0.0
+    concurrency: int = 1
+    judge_cache_hits: int = 0
+    judge_cache_misses: int = 0
 
     @property
     def avg_faithfulness(self) -> float:
@@ -62,6 +72,10 @@ class EvalReport:
                 "citation": settings.eval_citation_threshold,
             },
             "passed": self.passed(),
+            "failed_examples": self.failed,
+            "wall_clock_s": round(self.wall_clock_s, 3),
+            "concurrency": self.concurrency,
+            "judge_cache": {"hits": self.judge_cache_hits, "misses": self.judge_cache_misses},
         }
 
 
@@ -69,8 +83,16 @@ def run_evaluation(
     pipeline: RAGPipeline,
     golden_path: Path | None = None,
     api_key: str | None = None,
+    concurrency: int | None = None,
+    cache: JudgeCache | None = None,
 ) -> EvalReport:
-    """Run the full eval pipeline against a golden dataset."""
+    """Run the full eval pipeline against a golden dataset.
+
+    Examples are evaluated concurrently (``RAG_EVAL_CONCURRENCY``), pipeline
+    and judge calls back off and retry on rate limits, and judge scores are
+    cached in ``RAG_EVAL_JUDGE_CACHE_PATH`` so unchanged answers are not
+    re-judged on the next run.
+    """
     gpath = golden_path or settings.eval_golden_path
     key = api_key or settings.gemini_api_key
 
@@ -79,30 +101,80 @@ def run_evaluation(
         log.warning("empty_golden_set", path=str(gpath))
         return EvalReport()
 
-    report = EvalReport()
+    workers = max(1, concurrency or settings.eval_concurrency)
+    judge_cache = cache if cache is not None else JudgeCache(settings.eval_judge_cache_path)
+    started = time.perf_counter()
 
-    for example in golden:
+    def _evaluate(example: GoldenExample) -> EvalScores | None:
         log.info("evaluating", question=example.question)
         try:
+            # Generation already retries and falls back inside the pipeline
             response = pipeline.query(example.question)
-            scores = evaluate_example(response, example, api_key=key)
-            report.scores.append(scores)
-
-            log.info(
-                "eval_result",
-                question=example.question[:60],
-                faithfulness=scores.faithfulness,
-                relevance=scores.relevance,
-                citation=scores.citation_accuracy,
-            )
+            scores = evaluate_example(response, example, api_key=key, cache=judge_cache)
         except Exception:
             log.exception("eval_example_failed", question=example.question[:60])
-
+            return None
+
+        log.info(
+            "eval_result",
+            question=example.question[:60],
+            faithfulness=scores.faithfulness,
+            relevance=scores.relevance,
+            citation=scores.citation_accuracy,
+        )
+        return scores
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_evaluate, golden))
+
+    judge_cache.save()
+    report = EvalReport(
+        scores=[s for s in results if s is not None],
+        failed=sum(1 for s in results if s is None),
+        wall_clock_s=time.perf_counter() - started,
+        concurrency=workers,
+        judge_cache_hits=judge_cache.hits,
+        judge_cache_misses=judge_cache.misses,
+    )
+    log.info("eval_finished", examples=len(golden), wall_clock_s=round(report.wall_clock_s, 3))
     return report
 
 
-def main() -> None:
+def _load_sweep(value: str) -> dict[str, list[Any]]:
+    """A ``{setting: [values]}`` grid given inline as JSON or as a path to a JSON file."""
+    path = Path(value)
+    grid = json.loads(path.read_text(encoding="utf-8") if path.exists() else value)
+    return {name: values if isinstance(values, list) else [values] for name, values in grid.items()}
+
+
+def run_retrieval_evaluation(pipe: RAGPipeline, args: argparse.Namespace) -> None:
+    golden = load_golden_set(args.golden or settings.eval_golden_path)
+    configs = expand_grid(_load_sweep(args.sweep) if args.sweep else {})
+    reports = run_sweep(pipe, golden, configs, ks=tuple(args.k), use_reranker=not args.no_rerank)
+    summaries = [r.summary() for r in reports]
+    print(format_table(reports))
+    if args.out:
+        args.out.write_text(json.dumps(summaries, indent=2), encoding="utf-8")
+
+
+def main(argv: list[str] | None = None) -> None:
     """CLI entrypoint for evaluation."""
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline on the golden set")
+    parser.add_argument("--golden", type=Path, help="Golden set (default RAG_EVAL_GOLDEN_PATH)")
+    parser.add_argument(
+        "--retrieval-only",
+        action="store_true",
+        help="Skip generation and judging; report recall@k, MRR, nDCG and stage latency",
+    )
+    parser.add_argument(
+        "--sweep",
+        help='Settings grid, inline JSON or a file: {"bm25_top_k": [10, 25], "rrf_k": [30, 60]}',
+    )
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_KS), help="Cutoffs")
+    parser.add_argument("--no-rerank", action="store_true", help="Score the fused candidates")
+    parser.add_argument("--out", type=Path, help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
     pipe = RAGPipeline()
 
     if settings.bm25_path.exists():
@@ -110,10 +182,16 @@ def main() -> None:
     else:
         pipe.ingest()
 
-    report = run_evaluation(pipe)
+    if args.retrieval_only:
+        run_retrieval_evaluation(pipe, args)
+        return
+
+    report = run_evaluation(pipe, golden_path=args.golden)
     summary = report.summary()
 
     print(json.dumps(summary, indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(summary, indent=2), encoding="utf-8")
 
     if not report.passed():
         print("\nEVALUATION FAILED — below threshold", file=sys.stderr)
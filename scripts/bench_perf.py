@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""Throughput / tail-latency benchmarks on synthetic corpora, diffable against a baseline."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.perf import main
+
+if __name__ == "__main__":
+    sys.exit(main())
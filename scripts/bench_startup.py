@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""Measure API import time and time-to-ready (background vs blocking startup)."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.startup import main
+
+if __name__ == "__main__":
+    main()
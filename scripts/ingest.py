@@ -19,7 +19,7 @@ def main() -> None:
         print(f"Error: {docs_dir} does not exist")
         sys.exit(1)
 
-    pipe = RAGPipeline()
+    pipe = RAGPipeline(docs_dir=docs_dir)
     count = pipe.ingest(docs_dir=docs_dir)
     print(f"Ingested {count} chunks from {docs_dir}")
 
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Export indexes for shared serving, or run the pre-fork multi-worker server.
+
+python scripts/serve.py export [--out DIR] [--shards N]
+python scripts/serve.py serve --workers 4
+python scripts/serve.py inference [--socket PATH]
+python scripts/serve.py shards --socket-dir DIR [--dir DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+# Allow running from project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.rag.config import settings
+from src.rag.inference import serve_inference
+from src.rag.pipeline import RAGPipeline
+from src.rag.serve import serve
+from src.rag.sharding import serve_shards
+
+
+def _default_export_dir() -> Path:
+    return settings.shared_index_dir or settings.data_dir / "shared"
+
+
+def export(out: Path, shards: int) -> None:
+    pipe = RAGPipeline()
+    if not pipe.has_saved_index:
+        print(f"Error: no saved index at {settings.bm25_path}; run scripts/ingest.py first")
+        sys.exit(1)
+    pipe.load_indexes()
+    manifest = pipe.export_shared(out, shards=shards)
+    where = f"{manifest['shards']} shards in {out}" if manifest.get("shards") else str(out)
+    print(f"Exported generation {manifest['generation']} ({manifest['chunks']} chunks) to {where}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="write the current indexes as memory-mappable files")
+    p_export.add_argument("--out", type=Path, default=None)
+    p_export.add_argument(
+        "--shards", type=int, default=settings.shard_count, help="partition for shard processes"
+    )
+
+    p_serve = sub.add_parser("serve", help="run N workers sharing one socket")
+    p_serve.add_argument("--workers", type=int, default=settings.workers)
+    p_serve.add_argument("--host", default=settings.host)
+    p_serve.add_argument("--port", type=int, default=settings.port)
+    p_serve.add_argument("--shared-index-dir", type=Path, default=None)
+    p_serve.add_argument("--no-preload", action="store_true", help="let workers load models")
+
+    p_infer = sub.add_parser("inference", help="run the batching model-inference server")
+    p_infer.add_argument("--socket", type=Path, default=settings.inference_socket)
+
+    p_shards = sub.add_parser("shards", help="serve each shard of a sharded export in a process")
+    p_shards.add_argument("--dir", type=Path, default=None, help="sharded export directory")
+    p_shards.add_argument("--socket-dir", type=Path, default=settings.shard_socket_dir)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export(args.out or _default_export_dir(), args.shards)
+        return
+    if args.command == "shards":
+        if args.socket_dir is None:
+            print("Error: pass --socket-dir or set RAG_SHARD_SOCKET_DIR")
+            sys.exit(1)
+        serve_shards(args.dir or _default_export_dir(), args.socket_dir)
+        return
+    if args.command == "inference":
+        if args.socket is None:
+            print("Error: pass --socket or set RAG_INFERENCE_SOCKET")
+            sys.exit(1)
+        serve_inference(args.socket)
+        return
+
+    if args.shared_index_dir is not None:
+        # Forked workers inherit the master's settings object
+        settings.shared_index_dir = args.shared_index_dir
+    serve(
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        preload_models=not args.no_preload,
+    )
+
+
+if __name__ == "__main__":
+    main()
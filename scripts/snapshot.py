@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Create or restore portable, checksummed index snapshots.
+
+python scripts/snapshot.py create --out data/snapshots/docs.tar.gz [--shards N]
+python scripts/snapshot.py restore SOURCE [--into DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+# Allow running from project root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.rag.config import settings
+from src.rag.pipeline import RAGPipeline
+from src.rag.snapshot import SnapshotError, create_snapshot, restore_snapshot
+
+
+def create(out: Path, shards: int) -> None:
+    pipe = RAGPipeline()
+    if not pipe.has_saved_index:
+        print(f"Error: no saved index at {settings.bm25_path}; run scripts/ingest.py first")
+        sys.exit(1)
+    pipe.load_indexes()
+    meta = create_snapshot(pipe, out, shards=shards)
+    manifest = meta["manifest"]
+    print(
+        f"Snapshot of generation {manifest['generation']} ({manifest['chunks']} chunks, "
+        f"{len(meta['files'])} files) written to {out}"
+    )
+
+
+def restore(source: str, into: Path) -> None:
+    try:
+        meta = restore_snapshot(source, into)
+    except SnapshotError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    manifest = meta["manifest"]
+    print(f"Restored generation {manifest['generation']} ({manifest['chunks']} chunks) to {into}")
+    print(f"Serve it with RAG_SHARED_INDEX_DIR={into}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_create = sub.add_parser("create", help="package the saved indexes as one archive")
+    p_create.add_argument("--out", type=Path, default=settings.snapshot_dir / "snapshot.tar.gz")
+    p_create.add_argument(
+        "--shards", type=int, default=settings.shard_count, help="partition for shard processes"
+    )
+
+    p_restore = sub.add_parser("restore", help="verify and unpack an archive (path or URL)")
+    p_restore.add_argument("source")
+    p_restore.add_argument("--into", type=Path, default=None, help="shared index directory")
+
+    args = parser.parse_args()
+    if args.command == "create":
+        create(args.out, args.shards)
+        return
+    restore(args.source, args.into or settings.shared_index_dir or settings.data_dir / "shared")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Admission control: concurrency slots, bounded per-class queues, priority.
+
+Every ``/query``, ``/ingest`` and ``/upload`` request needs one of the
+process's ``RAG_ADMISSION_MAX_CONCURRENCY`` slots before it runs. The
+default, four per CPU, keeps retrieval and the local models (CPU bound)
+busy while other queries wait on the remote LLM. Requests fall into three
+classes, in priority order:
+
+- ``interactive``: ``/query``; may use every slot
+- ``batch``: ``/query`` sent with ``X-Request-Class: batch``
+- ``ingest``: ``/ingest`` and ``/upload``
+
+``batch`` and ``ingest`` are capped at their own share of the slots. A freed
+slot goes to the oldest waiter of the highest-priority class still under its
+cap, so interactive queries overtake queued batch and ingest work.
+
+A request is turned away immediately instead of queueing when its class
+queue is full (429), or when the expected wait (requests ahead of it times
+their recent service time, spread over the usable slots) exceeds the class
+SLO (503). A queued request still waiting at its SLO is dropped with 503.
+Rejections carry a ``Retry-After`` hint.
+
+The controller is driven from the server's event loop, so waiting requests
+do not occupy a threadpool worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from typing import Any, Literal, NoReturn
+
+import structlog
+
+from .config import settings
+from .metrics import ADMISSION_REJECTED, QUEUE_WAIT_SECONDS
+
+log = structlog.get_logger()
+
+RequestClass = Literal["interactive", "batch", "ingest"]
+CLASSES: tuple[RequestClass, ...] = ("interactive", "batch", "ingest")  # priority order
+
+_SLOTS_PER_CPU = 4
+_INITIAL_SERVICE_S = 0.1  # service-time guess until a request of the class has finished
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejectedError(Exception):
+    """The request was shed; ``status_code`` is 429 or 503."""
+
+    def __init__(self, request_class: str, status_code: int, retry_after: float, reason: str):
+        super().__init__(f"{request_class} request rejected: {reason}")
+        self.request_class = request_class
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+@dataclass(frozen=True)
+class ClassLimits:
+    max_concurrency: int
+    max_queue: int
+    slo_s: float
+
+
+@dataclass
+class _ClassState:
+    limits: ClassLimits
+    active: int = 0
+    waiters: deque[asyncio.Future[None]] = field(default_factory=deque)
+    service_s: float = _INITIAL_SERVICE_S  # moving average of slot hold time
+
+
+def admission_capacity() -> int:
+    """Requests served at once: ``RAG_ADMISSION_MAX_CONCURRENCY``, or 4 per CPU."""
+    return settings.admission_max_concurrency or _SLOTS_PER_CPU * (os.cpu_count() or 1)
+
+
+class AdmissionController:
+    """Grants concurrency slots to request classes in priority order."""
+
+    def __init__(self, capacity: int, limits: dict[RequestClass, ClassLimits]) -> None:
+        self.capacity = max(1, capacity)
+        self._classes = {name: _ClassState(limits[name]) for name in CLASSES}
+        self._active = 0
+
+    @classmethod
+    def from_settings(cls) -> AdmissionController:
+        capacity = admission_capacity()
+        batch = settings.admission_batch_max_concurrency or max(1, capacity // 2)
+        return cls(
+            capacity,
+            {
+                "interactive": ClassLimits(
+                    capacity,
+                    settings.admission_interactive_queue,
+                    settings.admission_interactive_slo_ms / 1000,
+                ),
+                "batch": ClassLimits(
+                    batch, settings.admission_batch_queue, settings.admission_batch_slo_ms / 1000
+                ),
+                "ingest": ClassLimits(
+                    settings.admission_ingest_max_concurrency,
+                    settings.admission_ingest_queue,
+                    settings.admission_ingest_slo_ms / 1000,
+                ),
+            },
+        )
+
+    def estimated_wait(self, request_class: RequestClass) -> float:
+        """Expected queue wait of a new ``request_class`` arrival, in seconds.
+
+        Counts the waiters it would not overtake (its own class and higher
+        priorities) plus one service time to free a slot.
+        """
+        state = self._classes[request_class]
+        ahead = CLASSES[: CLASSES.index(request_class) + 1]
+        work = sum(len(self._classes[c].waiters) * self._classes[c].service_s for c in ahead)
+        slots = min(self.capacity, state.limits.max_concurrency)
+        return (work + state.service_s) / max(1, slots)
+
+    def _can_start(self, state: _ClassState) -> bool:
+        return (
+            self._active < self.capacity
+            and state.active < state.limits.max_concurrency
+            and not state.waiters
+        )
+
+    def _start(self, state: _ClassState) -> None:
+        state.active += 1
+        self._active += 1
+
+    def _reject(self, request_class: RequestClass, status: int, reason: str) -> NoReturn:
+        ADMISSION_REJECTED.inc(request_class)
+        retry_after = self.estimated_wait(request_class)
+        log.warning("request_shed", request_class=request_class, status=status, reason=reason)
+        raise AdmissionRejectedError(request_class, status, retry_after, reason)
+
+    async def acquire(self, request_class: RequestClass) -> float:
+        """Wait for a slot; returns the seconds spent queued.
+
+        Raises ``AdmissionRejectedError`` when the request is shed.
+        """
+        state = self._classes[request_class]
+        if self._can_start(state):
+            self._start(state)
+            QUEUE_WAIT_SECONDS.observe(request_class, 0.0)
+            return 0.0
+        if len(state.waiters) >= state.limits.max_queue:
+            self._reject(request_class, 429, "queue full")
+        if self.estimated_wait(request_class) > state.limits.slo_s:
+            self._reject(request_class, 503, "expected queue wait exceeds SLO")
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=state.limits.slo_s)
+        except BaseException as exc:
+            if future.done() and not future.cancelled():
+                self.release(request_class, 0.0)  # granted while being abandoned
+            else:
+                with suppress(ValueError):
+                    state.waiters.remove(future)
+            if isinstance(exc, TimeoutError):
+                self._reject(request_class, 503, "queue wait exceeded SLO")
+            raise
+        waited = time.monotonic() - start
+        QUEUE_WAIT_SECONDS.observe(request_class, waited)
+        return waited
+
+    def release(self, request_class: RequestClass, service_s: float) -> None:
+        """Return a slot and hand it to the next waiter in priority order."""
+        state = self._classes[request_class]
+        state.active -= 1
+        self._active -= 1
+        if service_s > 0:
+            state.service_s += _EWMA_ALPHA * (service_s - state.service_s)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.capacity:
+            for name in CLASSES:
+                state = self._classes[name]
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()  # abandoned (timed out or client gone)
+                if state.waiters and state.active < state.limits.max_concurrency:
+                    self._start(state)
+                    state.waiters.popleft().set_result(None)
+                    break
+            else:
+                return
+
+    @asynccontextmanager
+    async def admit(self, request_class: RequestClass) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block."""
+        await self.acquire(request_class)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(request_class, time.monotonic() - start)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "active": self._active,
+            "classes": {
+                name: {
+                    "active": state.active,
+                    "queued": len(state.waiters),
+                    "max_concurrency": state.limits.max_concurrency,
+                    "max_queue": state.limits.max_queue,
+                    "slo_ms": round(state.limits.slo_s * 1000, 1),
+                    "service_ms": round(state.service_s * 1000, 1),
+                    "estimated_wait_ms": round(self.estimated_wait(name) * 1000, 1),
+                }
+                for name, state in self._classes.items()
+            },
+        }
@@ -0,0 +1,149 @@
+"""Text analysis for the sparse index: tokenize, normalize, drop stopwords, stem.
+
+The same ``Analyzer`` runs over chunk text at index time and over the
+question at query time, so both sides agree on what a term is. Exports
+record the analyzer in their manifest and are always queried with the one
+they were built with.
+
+Terms are interned to dense integer ids in a ``Vocabulary``, so a tokenized
+document is an int32 array rather than a list of Python strings.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import numpy as np
+
+from .config import settings
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Function words that carry no topical signal, plus the fragments "\w+"
+# leaves behind from contractions and possessives ("don't" -> "don", "t")
+ENGLISH_STOPWORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been
+    before being below between both but by can could did do does doing down during
+    each few for from further had has have having he her here hers herself him
+    himself his how i if in into is it its itself just me more most my myself no nor
+    not now of off on once only or other our ours ourselves out over own same she
+    should so some such than that the their theirs them themselves then there these
+    they this those through to too under until up very was we were what when where
+    which while who whom why will with would you your yours yourself yourselves
+    d ll m re s t ve don doesn didn isn aren wasn weren won wouldn shouldn couldn
+    """.split()
+)
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def light_stem(term: str) -> str:
+    """Harman's S-stemmer: fold plural forms onto the singular.
+
+    Conservative on purpose: it never merges unrelated words, unlike the
+    full Porter suffix rules.
+    """
+    if len(term) <= 3 or not term.endswith("s"):
+        return term
+    if term.endswith("ies") and not term.endswith(("eies", "aies")):
+        return term[:-3] + "y"
+    if term.endswith("es") and not term.endswith(("aes", "ees", "oes")):
+        return term[:-1]
+    if not term.endswith(("us", "ss")):
+        return term[:-1]
+    return term
+
+
+@dataclass(frozen=True)
+class Analyzer:
+    """Turns text into index terms.
+
+    ``normalize`` folds Unicode compatibility forms and strips accents,
+    ``stopwords`` drops ``ENGLISH_STOPWORDS`` and ``stem`` applies
+    ``light_stem``. With all three off this is the plain lowercase ``\\w+``
+    tokenizer.
+    """
+
+    normalize: bool = True
+    stopwords: bool = True
+    stem: bool = True
+
+    def __call__(self, text: str) -> list[str]:
+        text = text.lower()
+        if self.normalize and not text.isascii():
+            text = _strip_accents(text)
+        terms = _TOKEN_RE.findall(text)
+        if self.stopwords:
+            terms = [t for t in terms if t not in ENGLISH_STOPWORDS]
+        if self.stem:
+            terms = [light_stem(t) for t in terms]
+        return terms
+
+    def config(self) -> dict[str, Any]:
+        """JSON form stored in export manifests."""
+        return asdict(self)
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Analyzer:
+        """Analyzer described by a manifest."""
+        return cls(**config)
+
+
+# Lowercased word tokens only
+PLAIN = Analyzer(normalize=False, stopwords=False, stem=False)
+
+
+def default_analyzer() -> Analyzer:
+    """The analyzer configured by the ``RAG_BM25_*`` settings."""
+    return Analyzer(
+        normalize=settings.bm25_unicode_normalize,
+        stopwords=settings.bm25_stopwords,
+        stem=settings.bm25_stemming,
+    )
+
+
+class Vocabulary:
+    """Interns terms to dense int ids, assigned in first-seen order."""
+
+    def __init__(self, terms: Iterable[str] = ()) -> None:
+        self._terms: list[str] = []
+        self._ids: dict[str, int] = {}
+        for term in terms:
+            self._add(term)
+
+    def _add(self, term: str) -> int:
+        tid = self._ids[term] = len(self._terms)
+        self._terms.append(term)
+        return tid
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    @property
+    def terms(self) -> list[str]:
+        return self._terms
+
+    def intern(self, terms: list[str]) -> np.ndarray:
+        """Ids of ``terms`` as an int32 array, adding unseen terms."""
+        ids = self._ids
+        return np.fromiter(
+            (ids[t] if t in ids else self._add(t) for t in terms), np.int32, len(terms)
+        )
+
+    def lookup(self, terms: list[str]) -> list[int]:
+        """Ids of the known ``terms``; unknown terms match nothing and are dropped."""
+        ids = self._ids
+        return [ids[t] for t in terms if t in ids]
+
+    @property
+    def memory_bytes(self) -> int:
+        # Rough per-entry cost: the str object, its dict slot and its list slot
+        return sum(len(t) + 88 for t in self._terms)
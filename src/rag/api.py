@@ -1,37 +1,57 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import uuid
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import AsyncIterator
+from typing import Any, AsyncIterator, Literal
 
 import structlog
-from fastapi import FastAPI, HTTPException, UploadFile
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
 
+from .admission import AdmissionController, AdmissionRejectedError, RequestClass
 from .config import settings
-from .models import RAGRequest, RAGResponse
+from .deadline import Deadline, DeadlineExceededError
+from .inference import get_client
+from .jobs import IngestJob, IngestJobQueue
+from .metrics import ADMISSION_REJECTED, render_prometheus
+from .models import TENANT_PATTERN, RAGRequest, RAGResponse
 from .pipeline import RAGPipeline
+from .snapshot import SnapshotError, is_url, restore_snapshot
+from .startup import StartupState, memory_usage, run_startup, start_background
+from .tenants import DEFAULT_TENANT, TenantRegistry, validate_tenant
 
 log = structlog.get_logger()
 
 MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50 MB
+UPLOAD_READ_BYTES = 1024 * 1024  # uploads are streamed to disk in blocks of this size
+INGEST_BACKLOG_RETRY_AFTER_S = 30
 
+# Cheap to construct: Chroma and the models are opened lazily
 pipeline = RAGPipeline()
+# A tenant with queued or running jobs is never evicted
+tenants = TenantRegistry(busy=lambda name: jobs.has_pending(name))
+startup = StartupState()
+jobs = IngestJobQueue(on_finished=lambda job: tenants.refresh(job.tenant))
+admission = AdmissionController.from_settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
-    # Startup: try to load existing indexes, or ingest if docs exist
-    if settings.bm25_path.exists():
-        log.info("loading_existing_indexes")
-        pipeline.load_indexes()
-    elif settings.docs_dir.exists() and any(settings.docs_dir.iterdir()):
-        log.info("ingesting_docs_on_startup", dir=str(settings.docs_dir))
-        count = pipeline.ingest()
-        log.info("startup_ingest_complete", chunks=count)
+    # Startup: load (or ingest) indexes and warm the models. In background mode the
+    # port binds immediately and requests get 503 + Retry-After until ready.
+    startup.reset()
+    if settings.startup_mode == "background":
+        start_background(pipeline, startup)
     else:
-        log.warning("no_docs_found", dir=str(settings.docs_dir))
+        run_startup(pipeline, startup)
+    jobs.start()
     yield
+    jobs.stop()
 
 
 app = FastAPI(
@@ -42,9 +62,69 @@ app = FastAPI(
 )
 
 
-def _validate_docs_path(directory: Path) -> Path:
+def _require_started() -> None:
+    if not startup.is_ready:
+        raise HTTPException(
+            503,
+            f"Server is starting ({startup.phase}). Retry shortly.",
+            headers={"Retry-After": str(settings.startup_retry_after_s)},
+        )
+
+
+def _get_pipeline(tenant: str) -> RAGPipeline:
+    """Default tenant uses the module pipeline; others come from the registry."""
+    if tenant == DEFAULT_TENANT:
+        return pipeline
+    try:
+        return tenants.get(validate_tenant(tenant))
+    except ValueError as e:
+        raise HTTPException(400, str(e)) from e
+
+
+def _require_writable(pipe: RAGPipeline) -> None:
+    if pipe.read_only:
+        raise HTTPException(
+            409, "Indexes are served read-only from a shared export; re-export to update them"
+        )
+
+
+@asynccontextmanager
+async def _slot(request_class: RequestClass) -> AsyncIterator[None]:
+    """Hold an admission slot for the block, or shed the request with 429 / 503."""
+    if not settings.admission_control:
+        yield
+        return
+    try:
+        async with admission.admit(request_class):
+            yield
+    except AdmissionRejectedError as e:
+        raise HTTPException(
+            e.status_code, str(e), headers={"Retry-After": e.retry_after_header}
+        ) from e
+
+
+async def query_slot(
+    x_request_class: Literal["interactive", "batch"] = Header(default="interactive"),
+) -> AsyncIterator[None]:
+    async with _slot(x_request_class):
+        yield
+
+
+async def ingest_slot() -> AsyncIterator[None]:
+    if settings.admission_control and jobs.depth >= settings.admission_max_ingest_jobs:
+        ADMISSION_REJECTED.inc("ingest")
+        raise HTTPException(
+            429,
+            f"Ingest backlog full ({jobs.depth} jobs queued). Retry later.",
+            headers={"Retry-After": str(INGEST_BACKLOG_RETRY_AFTER_S)},
+        )
+    async with _slot("ingest"):
+        yield
+
+
+def _validate_docs_path(directory: Path, root: Path | None = None) -> Path:
     """Ensure the path is within the allowed docs directory."""
-    allowed_root = settings.docs_dir.resolve()
+    allowed_root = (root or settings.docs_dir).resolve()
     resolved = directory.resolve()
     if not (resolved == allowed_root or str(resolved).startswith(str(allowed_root) + "/")):
         # On Windows also check backslash
@@ -55,35 +135,142 @@ def _validate_docs_path(directory: Path) -> Path:
 
 @app.get("/health")
 def health() -> dict[str, str]:
-    status = "ready" if pipeline.is_ready else "not_ready"
-    return {"status": status, "chunks": str(pipeline.chunk_count)}
+    ready = startup.is_ready and pipeline.is_ready
+    mem = memory_usage()
+    return {
+        "status": "ready" if ready else "not_ready",
+        "startup": startup.phase,
+        "startup_progress": f"{startup.progress:.2f}",
+        "startup_error": startup.error,
+        "chunks": str(pipeline.chunk_count) if ready else "0",
+        "tenants_loaded": str(len(tenants.loaded)),
+        "pid": str(os.getpid()),
+        "rss_mb": str(mem.get("rss_mb", 0.0)),
+        "pss_mb": str(mem.get("pss_mb", mem.get("rss_mb", 0.0))),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Prometheus metrics: per-stage query latency histograms for this process."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/inference/stats")
+def inference_stats() -> dict[str, Any]:
+    """Queue depth and batch-size histograms of the model-inference server."""
+    client = get_client()
+    if client is None:
+        raise HTTPException(404, "No inference server configured (RAG_INFERENCE_SOCKET)")
+    try:
+        return client.stats()
+    except (OSError, RuntimeError) as e:
+        raise HTTPException(503, f"Inference server unavailable: {e}") from e
+
+
+@app.get("/admission/stats")
+def admission_stats() -> dict[str, Any]:
+    """Slots in use, queue depths and expected queue wait per request class."""
+    return {"enabled": settings.admission_control, **admission.stats()}
 
 
 class IngestRequest(BaseModel):
     docs_dir: str = ""
+    tenant: str = Field(default=DEFAULT_TENANT, pattern=TENANT_PATTERN)
 
 
-class IngestResponse(BaseModel):
-    chunks_indexed: int
-
-
-@app.post("/ingest", response_model=IngestResponse)
-def ingest_docs(req: IngestRequest) -> IngestResponse:
-    """Ingest / re-ingest documents from a directory."""
-    directory = Path(req.docs_dir) if req.docs_dir else settings.docs_dir
-    directory = _validate_docs_path(directory)
+@app.post("/ingest", response_model=IngestJob, status_code=202, dependencies=[Depends(ingest_slot)])
+def ingest_docs(req: IngestRequest) -> IngestJob:
+    """Queue an ingest / re-ingest of a directory; poll /jobs/{job_id} for progress."""
+    _require_started()
+    pipe = _get_pipeline(req.tenant)
+    _require_writable(pipe)
+    directory = Path(req.docs_dir) if req.docs_dir else pipe.docs_dir
+    directory = _validate_docs_path(directory, root=pipe.docs_dir)
     if not directory.exists():
         raise HTTPException(404, f"Directory not found: {directory}")
-    count = pipeline.ingest(docs_dir=directory)
-    return IngestResponse(chunks_indexed=count)
-
-
-@app.post("/query", response_model=RAGResponse)
-def query_docs(req: RAGRequest) -> RAGResponse:
+    return jobs.submit(pipe, "directory", [directory], tenant=req.tenant)
+
+
+class SnapshotLoadRequest(BaseModel):
+    source: str = ""  # archive in RAG_SNAPSHOT_DIR; empty = re-fetch RAG_SNAPSHOT_SOURCE
+
+
+@app.post("/admin/snapshot", dependencies=[Depends(ingest_slot)])
+def load_snapshot(req: SnapshotLoadRequest) -> dict[str, Any]:
+    """Verify and hot-load a newer index snapshot; queries switch over atomically.
+
+    Only a node already serving a shared export can hot-load: the snapshot
+    replaces that export in place, so a restart serves it too. A node with a
+    writable index would otherwise turn read-only until restarted.
+    """
+    _require_started()
+    target = settings.shared_index_dir
+    if not pipeline.read_only or target is None:
+        raise HTTPException(
+            409,
+            "Snapshots hot-load only over a shared export; "
+            "set RAG_SHARED_INDEX_DIR or RAG_SNAPSHOT_SOURCE and restart to serve one",
+        )
+    if req.source:
+        if is_url(req.source):
+            raise HTTPException(400, "Set RAG_SNAPSHOT_SOURCE to load snapshots from a URL")
+        source: str | Path = _validate_docs_path(
+            settings.snapshot_dir / req.source, root=settings.snapshot_dir
+        )
+        if not Path(source).is_file():
+            raise HTTPException(404, f"Snapshot not found: {req.source}")
+    elif settings.snapshot_source:
+        source = settings.snapshot_source
+    else:
+        raise HTTPException(400, "No snapshot given and RAG_SNAPSHOT_SOURCE is not set")
+
+    try:
+        meta = restore_snapshot(source, target)
+    except SnapshotError as e:
+        raise HTTPException(422, str(e)) from e
+    except OSError as e:
+        raise HTTPException(502, f"Cannot fetch snapshot: {e}") from e
+    pipeline.load_shared(target)
+    manifest = meta["manifest"]
+    return {
+        "generation": manifest["generation"],
+        "chunks": manifest["chunks"],
+        "shards": manifest.get("shards", 0),
+        "created_at": meta["created_at"],
+    }
+
+
+@app.get("/jobs/{job_id}", response_model=IngestJob)
+def get_job(job_id: str) -> IngestJob:
+    """Progress of an ingestion job: files processed, chunks embedded, throughput."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job not found: {job_id}")
+    return job
+
+
+def _request_deadline(body_ms: int | None, header_ms: int | None) -> Deadline | None:
+    """The tightest of the body field, the header and the server default."""
+    budgets = [ms for ms in (body_ms, header_ms, settings.query_deadline_ms) if ms]
+    return Deadline.after_ms(min(budgets)) if budgets else None
+
+
+@app.post("/query", response_model=RAGResponse, dependencies=[Depends(query_slot)])
+def query_docs(
+    req: RAGRequest,
+    x_request_deadline_ms: int | None = Header(default=None, ge=1),
+) -> RAGResponse:
     """Ask a question against the indexed documents."""
-    if not pipeline.is_ready:
+    deadline = _request_deadline(req.deadline_ms, x_request_deadline_ms)
+    _require_started()
+    pipe = _get_pipeline(req.tenant)
+    if not pipe.is_ready:
         raise HTTPException(503, "Pipeline not ready. Ingest documents first.")
-    return pipeline.query(req.query, top_k=req.top_k)
+    try:
+        return pipe.query(req.query, top_k=req.top_k, filters=req.filters, deadline=deadline)
+    except DeadlineExceededError as e:
+        raise HTTPException(504, str(e)) from e
 
 
 def _sanitize_filename(filename: str) -> str:
@@ -91,30 +278,88 @@ def _sanitize_filename(filename: str) -> str:
     return Path(filename).name
 
 
-@app.post("/upload")
-async def upload_file(file: UploadFile) -> IngestResponse:
-    """Upload a single document file for ingestion."""
+def _too_large() -> HTTPException:
+    return HTTPException(
+        413, f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+    )
+
+
+async def _receive_upload(file: UploadFile, dest: Path) -> tuple[str, int]:
+    """Stream ``file`` to ``dest`` block by block; returns its SHA-256 and size.
+
+    The size limit is checked as blocks arrive, and nothing is left behind
+    when the upload is rejected. Disk writes run in the thread pool so a
+    slow disk never stalls the event loop.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(dest.open, "wb")
+    try:
+        while block := await file.read(UPLOAD_READ_BYTES):
+            size += len(block)
+            if size > MAX_UPLOAD_BYTES:
+                raise _too_large()
+            digest.update(block)
+            await run_in_threadpool(out.write, block)
+        await run_in_threadpool(out.close)
+    except BaseException:
+        out.close()
+        dest.unlink(missing_ok=True)
+        raise
+    return digest.hexdigest(), size
+
+
+@app.post("/upload", response_model=IngestJob, status_code=202, dependencies=[Depends(ingest_slot)])
+async def upload_file(
+    file: UploadFile, response: Response, tenant: str = DEFAULT_TENANT
+) -> IngestJob:
+    """Upload a single document file and queue it for incremental indexing.
+
+    Content already indexed byte for byte is not indexed again: the answer
+    is 200 with a finished job naming the source that holds it.
+    """
+    _require_started()
+    pipe = _get_pipeline(tenant)
+    _require_writable(pipe)
     if not file.filename:
         raise HTTPException(400, "No filename provided")
 
     safe_name = _sanitize_filename(file.filename)
     if not safe_name:
         raise HTTPException(400, "Invalid filename")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
 
-    # Read with size limit
-    content = await file.read()
-    if len(content) > MAX_UPLOAD_BYTES:
-        raise HTTPException(413, f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024*1024)} MB")
-
-    upload_dir = settings.docs_dir / "_uploads"
+    upload_dir = pipe.docs_dir / "_uploads"
     upload_dir.mkdir(parents=True, exist_ok=True)
     dest = upload_dir / safe_name
-
-    dest.write_bytes(content)
-    log.info("file_uploaded", path=str(dest), size=len(content))
-
-    count = pipeline.ingest()
-    return IngestResponse(chunks_indexed=count)
+    # Written under a temporary name so a half-received file is never ingested
+    partial = upload_dir / f".{safe_name}.{uuid.uuid4().hex[:8]}.part"
+    sha256, size = await _receive_upload(file, partial)
+
+    # Reserved atomically, so a concurrent upload of the same bytes sees this one
+    duplicate = pipe.reserve_content(dest, sha256)
+    if duplicate is not None:
+        partial.unlink(missing_ok=True)
+        log.info("upload_duplicate", path=str(dest), duplicate_of=duplicate, sha256=sha256)
+        response.status_code = 200
+        return jobs.skip_duplicate("upload", [dest], duplicate, tenant=tenant)
+
+    os.replace(partial, dest)
+    log.info("file_uploaded", path=str(dest), size=size, sha256=sha256)
+    return jobs.submit(pipe, "upload", [dest], tenant=tenant)
+
+
+@app.delete("/documents", dependencies=[Depends(ingest_slot)])
+def delete_documents(source: list[str] = Query(), tenant: str = DEFAULT_TENANT) -> dict[str, int]:
+    """Remove every chunk of the given sources from the index (the files stay on disk)."""
+    _require_started()
+    pipe = _get_pipeline(tenant)
+    _require_writable(pipe)
+    removed = pipe.delete_sources(source)
+    if removed == 0:
+        raise HTTPException(404, "No indexed chunks for the given sources")
+    return {"removed": removed, "generation": pipe.generation}
 
 
 def create_app() -> FastAPI:
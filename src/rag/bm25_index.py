@@ -1,65 +1,139 @@
 from __future__ import annotations
 
 import json
-import re
+import os
+import sys
+from collections.abc import Sequence
 from pathlib import Path
+from typing import Any
 
+import numpy as np
 import structlog
 from rank_bm25 import BM25L
 
+from .analysis import Analyzer, Vocabulary, default_analyzer
 from .config import settings
-from .models import Chunk, ScoredChunk
+from .filters import FieldIndex
+from .fusion import top_k_indices
+from .models import Chunk, QueryFilters, ScoredChunk
+from .postings import Postings
 
 log = structlog.get_logger()
 
-_TOKENIZE_RE = re.compile(r"\w+")
 
+class BM25Index:
+    """Sparse BM25 retrieval index over chunks, scored by ``rank_bm25``.
 
-def _tokenize(text: str) -> list[str]:
-    return _TOKENIZE_RE.findall(text.lower())
-
+    Not served by the pipeline, which uses ``SegmentedBM25Index``. This is the
+    reference implementation that bench/perf.py measures against and that
+    tests compare segmented scores with.
 
-class BM25Index:
-    """Sparse BM25 retrieval index over chunks."""
+    Text goes through ``analyzer`` (the ``RAG_BM25_*`` settings by default)
+    at index and query time; documents are kept as int32 arrays of term ids.
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, analyzer: Analyzer | None = None) -> None:
+        self.analyzer = analyzer or default_analyzer()
         self._chunks: list[Chunk] = []
         self._bm25: BM25L | None = None
-        self._corpus: list[list[str]] = []
+        self._vocab = Vocabulary()
+        self._corpus: list[np.ndarray] = []
+        self._fields = FieldIndex([])
+        self._memory_bytes = 0
 
     def build(self, chunks: list[Chunk]) -> None:
+        vocab = Vocabulary()
+        corpus = [vocab.intern(self.analyzer(c.text)) for c in chunks]
+        bm25 = BM25L([doc.tolist() for doc in corpus])
         self._chunks = chunks
-        self._corpus = [_tokenize(c.text) for c in chunks]
-        self._bm25 = BM25L(self._corpus)
-        log.info("bm25_built", num_docs=len(chunks))
-
-    def search(self, query: str, top_k: int | None = None) -> list[ScoredChunk]:
+        self._vocab, self._corpus, self._bm25 = vocab, corpus, bm25
+        self._fields = FieldIndex(chunks)
+        self._memory_bytes = self._estimate_memory()
+        log.info("bm25_built", num_docs=len(chunks), terms=len(vocab))
+
+    def _estimate_memory(self) -> int:
+        """Rough resident size: chunk text, term id arrays, vocabulary, per-doc term dicts."""
+        total = self._vocab.memory_bytes
+        for c, doc in zip(self._chunks, self._corpus):
+            # ~100 B per entry of rank_bm25's per-document term-frequency dict
+            unique = len(np.unique(doc))
+            total += sys.getsizeof(c.text) + doc.nbytes + 100 * unique + 400
+        return total
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    @property
+    def chunks(self) -> list[Chunk]:
+        return self._chunks
+
+    @property
+    def sources(self) -> list[str]:
+        return self._fields.sources
+
+    def filter_ids(self, filters: QueryFilters) -> np.ndarray:
+        """Doc positions matching all filters, as a sorted int array."""
+        return self._fields.filter_ids(filters)
+
+    @property
+    def vocab_size(self) -> int:
+        return len(self._vocab)
+
+    def to_postings(self, positions: Sequence[int] | None = None) -> Postings:
+        """Export the analyzed corpus (or the documents at ``positions``) as CSR postings."""
+        docs = self._corpus if positions is None else [self._corpus[i] for i in positions]
+        return Postings.from_ids(docs, self._vocab.terms)
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        filters: QueryFilters | None = None,
+    ) -> list[ScoredChunk]:
         if self._bm25 is None:
             raise RuntimeError("BM25 index not built. Call build() first.")
 
         k = top_k or settings.bm25_top_k
-        tokens = _tokenize(query)
-        scores = self._bm25.get_scores(tokens)
+        tokens = self._vocab.lookup(self.analyzer(query))
+
+        if filters is not None and not filters.is_empty():
+            # Score only the allowed documents instead of the whole corpus
+            ids = self.filter_ids(filters)
+            if len(ids) == 0:
+                return []
+            batch = np.asarray(self._bm25.get_batch_scores(tokens, ids.tolist()))
+            top = top_k_indices(batch, k)
+            ranked, ranked_scores = ids[top], batch[top]
+        else:
+            scores = self._bm25.get_scores(tokens)
+            ranked = top_k_indices(scores, k)
+            ranked_scores = scores[ranked]
 
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:k]
         return [
             ScoredChunk(chunk=self._chunks[idx], score=float(score), origin="bm25")
-            for idx, score in ranked
+            for idx, score in zip(ranked, ranked_scores)
             if score > 0
         ]
 
-    def save(self, path: Path | None = None) -> None:
+    def save(self, path: Path | None = None, meta: dict[str, Any] | None = None) -> None:
         save_path = path or settings.bm25_path
         save_path.parent.mkdir(parents=True, exist_ok=True)
         data = {
             "chunks": [c.model_dump() for c in self._chunks],
+            "meta": meta or {},
         }
-        save_path.write_text(json.dumps(data), encoding="utf-8")
+        # Write-then-rename so a reader never sees a half-written file
+        tmp_path = save_path.with_name(save_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, save_path)
         log.info("bm25_saved", path=str(save_path))
 
-    def load(self, path: Path | None = None) -> None:
+    def load(self, path: Path | None = None) -> dict[str, Any]:
+        """Load and rebuild the index; returns the metadata stored with it."""
         load_path = path or settings.bm25_path
         data = json.loads(load_path.read_text(encoding="utf-8"))
         chunks = [Chunk(**c) for c in data["chunks"]]
         self.build(chunks)
         log.info("bm25_loaded", path=str(load_path), num_docs=len(chunks))
+        return dict(data.get("meta", {}))
@@ -0,0 +1,264 @@
+"""On-disk chunk store: the single copy of chunk text and metadata.
+
+Chunks live in one SQLite table and are addressed by an integer row id.
+Indexes keep only those ids, and a byte-bounded LRU cache holds the
+recently served chunks in memory.
+
+Rows are append-only: re-adding a chunk id writes a new row, so an
+index generation that is still being read never sees its chunks change.
+Row ids are never reused, even after the newest rows are deleted.
+Every ``Segment`` holding a row id counts as a reference. When the last
+segment holding a row is garbage-collected, the row is queued, and
+``collect`` deletes the queued rows at the next write.
+
+Reference counts live in the writing process. A store therefore has a
+single writer: one process that indexes into it and runs ``collect``.
+Another process collecting the same file would delete rows the writer
+still refers to. Read-only workers serve memory-mapped exports instead.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import structlog
+
+from .config import settings
+from .models import Chunk
+
+log = structlog.get_logger()
+
+_COLUMNS = ("chunk_id", "text", "source", "title", "page", "start_char", "end_char", "ingested_at")
+_META_COLUMNS = tuple(c for c in _COLUMNS if c != "text")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    page INTEGER,
+    start_char INTEGER NOT NULL,
+    end_char INTEGER NOT NULL,
+    ingested_at INTEGER NOT NULL
+)
+"""
+_CHUNK_OVERHEAD = 400  # rough size of a Chunk object beyond its text
+_MAX_PARAMS = 900  # stay under SQLite's bound-parameter limit
+
+
+def chunk_store_path(index_path: Path) -> Path:
+    """The chunk store kept next to a BM25 index file."""
+    return index_path.with_name(f"{index_path.stem}.chunks.db")
+
+
+def _row_to_chunk(row: Sequence[Any], columns: Sequence[str] = _COLUMNS) -> Chunk:
+    data = dict(zip(columns, row))
+    data.setdefault("text", "")
+    return Chunk(**data)
+
+
+class ChunkStore:
+    """Chunks by integer id in SQLite, with an LRU cache of hot chunks.
+
+    ``path=None`` keeps the table in memory (tests and benchmarks). Each
+    thread, and each forked process, opens its own connection.
+    """
+
+    def __init__(self, path: Path | None = None, cache_bytes: int | None = None) -> None:
+        self.path = path
+        if path is None:
+            self._uri = f"file:chunks-{secrets.token_hex(8)}?mode=memory&cache=shared"
+        else:
+            self._uri = f"file:{path}"
+        if cache_bytes is None:
+            cache_bytes = settings.chunk_cache_mb * 2**20
+        self._cache_limit = cache_bytes
+        self._cache: OrderedDict[int, Chunk] = OrderedDict()
+        self._cache_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._local = threading.local()
+        self._lock = threading.RLock()  # cache, refcounts and writes
+        self._refs = np.zeros(0, dtype=np.int32)
+        self._garbage: list[int] = []
+        self._keeper: sqlite3.Connection | None = None  # keeps an in-memory table alive
+
+    @property
+    def persistent(self) -> bool:
+        return self.path is not None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            if self.path is not None:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            local.conn, local.pid = conn, os.getpid()
+            if self.path is None and self._keeper is None:
+                self._keeper = conn
+        return local.conn
+
+    def __len__(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+
+    # --- Writing -------------------------------------------------------------
+
+    def add(self, chunks: Sequence[Chunk]) -> np.ndarray:
+        """Store ``chunks`` as new rows; returns their ids (int64, in order)."""
+        with self._lock:
+            conn = self._conn
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO chunks ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    (tuple(getattr(c, col) for col in _COLUMNS) for c in chunks),
+                )
+                # One transaction, so the new rows took consecutive ids ending here
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'chunks'")
+                last = row.fetchone()
+        end = int(last[0]) + 1 if last is not None else 1
+        return np.arange(end - len(chunks), end, dtype=np.int64)
+
+    def retain(self, ids: np.ndarray) -> None:
+        """Count one more reference to each of ``ids``."""
+        if len(ids) == 0:
+            return
+        with self._lock:
+            top = int(ids.max()) + 1
+            if top > len(self._refs):
+                grown = np.zeros(max(top, 2 * len(self._refs)), dtype=np.int32)
+                grown[: len(self._refs)] = self._refs
+                self._refs = grown
+            np.add.at(self._refs, ids, 1)
+
+    def release(self, ids: np.ndarray) -> None:
+        """Drop one reference to each of ``ids``; unreferenced rows become garbage."""
+        if len(ids) == 0:
+            return
+        with self._lock:
+            np.subtract.at(self._refs, ids, 1)
+            self._garbage.extend(int(i) for i in ids[self._refs[ids] == 0])
+
+    def collect(self, orphans: bool = False) -> int:
+        """Delete unreferenced rows; returns how many were deleted.
+
+        By default only rows released since the last call are checked.
+        ``orphans`` sweeps the whole table instead, for rows left behind by
+        a process that stopped before saving the segments referring to them.
+        """
+        with self._lock:
+            conn = self._conn
+            if orphans:
+                rows = conn.execute("SELECT id FROM chunks")
+                stored = np.fromiter((r[0] for r in rows), np.int64)
+                refs = np.zeros(len(stored), dtype=np.int32)
+                known = stored < len(self._refs)
+                refs[known] = self._refs[stored[known]]
+                doomed = stored[refs == 0].tolist()
+            else:
+                doomed = [i for i in dict.fromkeys(self._garbage) if self._refs[i] == 0]
+            self._garbage.clear()
+            if not doomed:
+                return 0
+            with conn:
+                conn.executemany("DELETE FROM chunks WHERE id = ?", ((i,) for i in doomed))
+            for i in doomed:
+                chunk = self._cache.pop(i, None)
+                if chunk is not None:
+                    self._cache_bytes -= len(chunk.text) + _CHUNK_OVERHEAD
+        log.info("chunk_store_collected", rows=len(doomed))
+        return len(doomed)
+
+    def backup_to(self, path: Path) -> ChunkStore:
+        """Copy every row to a new store at ``path``."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        target = ChunkStore(path, self._cache_limit)
+        with self._lock:
+            self._conn.backup(target._conn)
+        return target
+
+    # --- Reading -------------------------------------------------------------
+
+    def _cache_put(self, row_id: int, chunk: Chunk) -> None:
+        # Caller holds self._lock
+        self._cache[row_id] = chunk
+        self._cache_bytes += len(chunk.text) + _CHUNK_OVERHEAD
+        while self._cache_bytes > self._cache_limit and self._cache:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= len(old.text) + _CHUNK_OVERHEAD
+
+    def get_many(self, ids: Sequence[int] | np.ndarray, cache: bool = True) -> list[Chunk]:
+        """Chunks for ``ids``, in order; misses are read in one query per batch."""
+        found: dict[int, Chunk] = {}
+        missing: list[int] = []
+        with self._lock:
+            for i in map(int, ids):
+                chunk = self._cache.get(i)
+                if chunk is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(i)
+                    found[i] = chunk
+            self._hits += len(found)
+            self._misses += len(missing)
+        for start in range(0, len(missing), _MAX_PARAMS):
+            batch = missing[start : start + _MAX_PARAMS]
+            rows = self._conn.execute(
+                f"SELECT id, {', '.join(_COLUMNS)} FROM chunks "
+                f"WHERE id IN ({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for row in rows:
+                found[row[0]] = _row_to_chunk(row[1:])
+        if cache and missing:
+            with self._lock:
+                for i in missing:
+                    if i in found:
+                        self._cache_put(i, found[i])
+        absent = [i for i in map(int, ids) if i not in found]
+        if absent:
+            raise KeyError(f"{len(absent)} chunks are not in the store (e.g. id {absent[0]})")
+        return [found[int(i)] for i in ids]
+
+    def get(self, row_id: int) -> Chunk:
+        return self.get_many([row_id])[0]
+
+    def metadata(self, ids: np.ndarray) -> list[Chunk]:
+        """Chunks for ``ids`` without their text, enough to build a FieldIndex."""
+        by_id: dict[int, Chunk] = {}
+        query = f"SELECT id, {', '.join(_META_COLUMNS)} FROM chunks WHERE id IN "
+        id_list = [int(i) for i in ids]
+        for start in range(0, len(id_list), _MAX_PARAMS):
+            batch = id_list[start : start + _MAX_PARAMS]
+            rows = self._conn.execute(f"{query}({', '.join('?' * len(batch))})", batch)
+            for row in rows:
+                by_id[row[0]] = _row_to_chunk(row[1:], _META_COLUMNS)
+        return [by_id[i] for i in id_list]
+
+    @property
+    def cache_bytes(self) -> int:
+        return self._cache_bytes
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "cached_chunks": len(self._cache),
+                "cache_mb": round(self._cache_bytes / 2**20, 2),
+                "cache_limit_mb": round(self._cache_limit / 2**20, 2),
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
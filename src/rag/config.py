@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -22,6 +23,22 @@ class Settings(BaseSettings):
     reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     llm_model: str = "gemini-2.5-flash"
 
+    # LLM backend: live Gemini or a local stub, optionally behind a record/replay cache
+    llm_backend: Literal["gemini", "stub"] = "gemini"
+    llm_cache_mode: Literal["off", "record", "replay", "auto"] = "off"
+    llm_cache_dir: Path = Path("./data/llm_cache")
+    llm_stub_latency_ms: float = 300.0
+    llm_stub_tokens_per_s: float = 80.0
+
+    # Generation resilience: deadline, hedged duplicates, retries, fallback model
+    llm_timeout_s: float = 30.0
+    llm_hedge: bool = True
+    llm_hedge_after_ms: float = 2000.0  # until enough latencies are seen to use the quantile
+    llm_hedge_quantile: float = 0.95
+    llm_max_retries: int = 2
+    llm_fallback_model: str = "gemini-2.5-flash-lite"  # empty = no fallback
+    llm_fallback_timeout_s: float = 15.0
+
     # Chunking
     chunk_size: int = 512
     chunk_overlap: int = 64
@@ -31,22 +48,83 @@ class Settings(BaseSettings):
     vector_top_k: int = 25
     rerank_top_k: int = 5
     rrf_k: int = 60
+    fusion_method: Literal["rrf", "combsum", "combmnz"] = "rrf"
+    bm25_weight: float = 1.0
+    vector_weight: float = 1.0
+    adaptive_depth: bool = False
+    adaptive_min_k: int = 5
+    adaptive_max_k: int = 25
+    adaptive_long_query_tokens: int = 16
+
+    # BM25 analysis, segment merging and chunk text cache
+    bm25_unicode_normalize: bool = True  # fold compatibility forms and accents in BM25 terms
+    bm25_stopwords: bool = True  # drop English stopwords from BM25 terms
+    bm25_stemming: bool = True  # fold plurals onto the singular in BM25 terms
+    bm25_background_merge: bool = True  # merge BM25 segments off the indexing path
+    bm25_segments_per_tier: int = 8  # segments of similar size merged together
+    bm25_merge_floor_docs: int = 1000  # smaller segments all count as the lowest tier
+    bm25_max_deleted_ratio: float = 0.3  # rewrite a segment once this share is deleted
+    chunk_cache_mb: int = 64  # chunk text kept in memory; the rest is read from the chunk store
+
+    # Context packing before generation
+    context_packing: bool = True
+    context_token_budget: int = 1024  # estimated prompt tokens for references; 0 = no limit
 
     # Paths
     docs_dir: Path = Path("./docs")
     data_dir: Path = Path("./data")
     chroma_dir: Path = Path("./data/chroma")
     bm25_path: Path = Path("./data/bm25_index.json")
+    tenants_dir: Path = Path("./tenants")
+    shared_index_dir: Path | None = None
+
+    # Sharded retrieval (a sharded export in RAG_SHARED_INDEX_DIR)
+    shard_count: int = 0  # shards written by `scripts/serve.py export`; 0 = unsharded
+    shard_socket_dir: Path | None = None  # sockets of shards run separately; unset = spawn them
 
-    # Evaluation thresholds
+    # Index snapshots (scripts/snapshot.py)
+    snapshot_source: str | None = None  # archive path or URL restored when the shared dir is empty
+    snapshot_dir: Path = Path("./data/snapshots")  # archives POST /admin/snapshot may load
+
+    # Multi-tenancy
+    tenant_memory_budget_mb: int = 1024
+
+    # Evaluation
     eval_golden_path: Path = Path("./eval/golden.jsonl")
     eval_faithfulness_threshold: float = 0.7
     eval_relevance_threshold: float = 0.7
     eval_citation_threshold: float = 0.9
+    eval_concurrency: int = 8
+    eval_max_retries: int = 4
+    eval_retry_base_delay_s: float = 1.0
+    eval_judge_cache_path: Path | None = Path("./data/eval_judge_cache.json")
 
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
+    startup_mode: Literal["background", "blocking"] = "background"
+    startup_retry_after_s: int = 5
+    query_deadline_ms: int = 0  # default /query budget; 0 = none unless the request sets one
+    workers: int = 1
+
+    # Admission control: concurrency slots and bounded queues per request class
+    admission_control: bool = True
+    admission_max_concurrency: int = 0  # 0 = 4 per CPU
+    admission_batch_max_concurrency: int = 0  # 0 = half the slots
+    admission_ingest_max_concurrency: int = 1
+    admission_interactive_queue: int = 64
+    admission_batch_queue: int = 256
+    admission_ingest_queue: int = 16
+    admission_interactive_slo_ms: float = 2000.0  # longest acceptable queue wait
+    admission_batch_slo_ms: float = 30000.0
+    admission_ingest_slo_ms: float = 10000.0
+    admission_max_ingest_jobs: int = 32  # queued ingest jobs before /ingest and /upload get 429
+    debug: bool = False
+
+    # Inference server (unset = run models in each API process)
+    inference_socket: Path | None = None
+    inference_max_batch: int = 64
+    inference_max_wait_ms: float = 5.0
 
     @property
     def gemini_api_key(self) -> str:
@@ -0,0 +1,59 @@
+"""Per-request latency budgets and the order in which a query degrades to meet them.
+
+Before each stage ``RAGPipeline.query`` compares the time left with the
+typical (median) cost of the stages still to run, taken from the
+``documind_stage_seconds`` histogram. When the budget is short it gives up
+quality in a fixed order, cheapest loss first:
+
+1. ``reduced_depth``: retrieve ``RAG_ADAPTIVE_MIN_K`` candidates per leg
+2. ``skipped_rerank``: keep fused (RRF) order instead of the cross-encoder
+3. ``shortened_context``: halve the references passed to the LLM
+4. ``no_answer``: generation missed the deadline; sources are still returned
+
+The applied steps are listed in ``RAGResponse.degradations``.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+
+from .metrics import STAGE_SECONDS
+
+REDUCED_DEPTH = "reduced_depth"
+SKIPPED_RERANK = "skipped_rerank"
+SHORTENED_CONTEXT = "shortened_context"
+NO_ANSWER = "no_answer"
+
+
+class DeadlineExceededError(TimeoutError):
+    """The request's budget ran out before any answer could be produced."""
+
+
+@dataclass
+class Deadline:
+    expires_at: float  # time.monotonic()
+    degradations: list[str] = field(default_factory=list)
+
+    @classmethod
+    def after_ms(cls, ms: float) -> Deadline:
+        return cls(time.monotonic() + ms / 1000)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def short_of(self, *stages: str) -> bool:
+        """True when the typical cost of ``stages`` exceeds the time left."""
+        return self.remaining() < expected_seconds(*stages)
+
+    def degrade(self, step: str) -> None:
+        self.degradations.append(step)
+
+
+def expected_seconds(*stages: str) -> float:
+    """Median observed wall time of the given stages, summed (0 until observed)."""
+    return sum(STAGE_SECONDS.labels(stage).quantile(0.5) for stage in stages)
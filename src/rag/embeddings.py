@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 from .config import settings
+from .inference import get_client
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 _model: SentenceTransformer | None = None
 
@@ -11,17 +16,47 @@ _model: SentenceTransformer | None = None
 def _get_model() -> SentenceTransformer:
     global _model
     if _model is None:
+        # Imported lazily: pulling in torch dominates process import time
+        from sentence_transformers import SentenceTransformer
+
         _model = SentenceTransformer(settings.embedding_model)
     return _model
 
 
-def embed_texts(texts: list[str], batch_size: int = 64) -> np.ndarray:
-    """Encode a list of texts into dense vectors."""
+def preload() -> None:
+    """Load the weights without running inference.
+
+    Used by the pre-fork server: weights loaded in the parent are shared
+    copy-on-write by the workers, while the thread pools that inference
+    would start are left for each worker to create after the fork.
+    """
+    _get_model()
+
+
+def warm_up() -> None:
+    """Load the model and run one dummy encode so the first query is fast."""
+    embed_query("warm up")
+
+
+def embed_texts_local(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Encode texts with the in-process model."""
     model = _get_model()
     embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=False)
     return np.asarray(embeddings, dtype=np.float32)
 
 
+def embed_texts(texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """Encode a list of texts into dense vectors.
+
+    Goes through the inference server when ``RAG_INFERENCE_SOCKET`` is set,
+    where concurrent calls are coalesced into shared batches.
+    """
+    client = get_client()
+    if client is not None:
+        return client.embed(texts)
+    return embed_texts_local(texts, batch_size=batch_size)
+
+
 def embed_query(query: str) -> np.ndarray:
     """Encode a single query string."""
     return embed_texts([query])[0]
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from datetime import UTC, datetime
+from pathlib import PurePosixPath
+from typing import Any
+
+import numpy as np
+
+from .models import Chunk, QueryFilters
+
+_KEYWORD_FIELDS = ("source", "title", "file_type")
+_NUMERIC_OPS = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def file_type_of(source: str) -> str:
+    """Lower-cased file suffix of a source path, e.g. ".pdf"."""
+    return PurePosixPath(source.replace("\\", "/")).suffix.lower()
+
+
+def normalize_file_type(file_type: str) -> str:
+    ft = file_type.strip().lower()
+    return ft if ft.startswith(".") else f".{ft}"
+
+
+def epoch_seconds(moment: datetime) -> int:
+    """Unix time of ``moment``; a naive datetime is taken to be UTC, not server-local."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return int(moment.timestamp())
+
+
+def chunk_metadata(chunk: Chunk) -> dict[str, Any]:
+    """Metadata stored alongside each vector: the filterable fields plus char offsets."""
+    return {
+        "source": chunk.source,
+        "title": chunk.title,
+        "page": chunk.page or 0,
+        "start_char": chunk.start_char,
+        "end_char": chunk.end_char,
+        "file_type": file_type_of(chunk.source),
+        "ingested_at": chunk.ingested_at,
+    }
+
+
+def matching_sources(prefix: str, sources: Iterable[str]) -> list[str]:
+    """Resolve a source path prefix against the known sources."""
+    norm = prefix.replace("\\", "/")
+    return sorted(s for s in sources if s.replace("\\", "/").startswith(norm))
+
+
+def to_chroma_where(
+    filters: QueryFilters,
+    sources: Iterable[str],
+) -> dict[str, Any] | None:
+    """Translate filters into a Chroma ``where`` clause.
+
+    Chroma has no prefix operator for metadata, so the source prefix is
+    expanded into an ``$in`` over the known sources.
+    """
+    clauses: list[dict[str, Any]] = []
+    if filters.source_prefix:
+        clauses.append({"source": {"$in": matching_sources(filters.source_prefix, sources)}})
+    if filters.title:
+        clauses.append({"title": {"$eq": filters.title}})
+    if filters.page_min is not None:
+        clauses.append({"page": {"$gte": filters.page_min}})
+    if filters.page_max is not None:
+        clauses.append({"page": {"$lte": filters.page_max}})
+    if filters.file_types:
+        clauses.append(
+            {"file_type": {"$in": [normalize_file_type(ft) for ft in filters.file_types]}}
+        )
+    if filters.ingested_after:
+        clauses.append({"ingested_at": {"$gte": epoch_seconds(filters.ingested_after)}})
+    if filters.ingested_before:
+        clauses.append({"ingested_at": {"$lte": epoch_seconds(filters.ingested_before)}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class FieldIndex:
+    """Per-field postings (value -> doc positions) plus numeric columns.
+
+    Shared by the sparse and dense in-process indexes so both legs apply
+    identical metadata filters.
+    """
+
+    def __init__(self, chunks: Sequence[Chunk]) -> None:
+        self.size = len(chunks)
+        postings: dict[str, dict[str, list[int]]] = {f: {} for f in _KEYWORD_FIELDS}
+        for i, c in enumerate(chunks):
+            postings["source"].setdefault(c.source, []).append(i)
+            postings["title"].setdefault(c.title, []).append(i)
+            postings["file_type"].setdefault(file_type_of(c.source), []).append(i)
+        self._postings = {
+            field: {value: np.asarray(ids, dtype=np.int64) for value, ids in values.items()}
+            for field, values in postings.items()
+        }
+        self._columns = {
+            "page": np.fromiter((c.page or 0 for c in chunks), np.int32, len(chunks)),
+            "ingested_at": np.fromiter((c.ingested_at for c in chunks), np.int64, len(chunks)),
+        }
+
+    @property
+    def sources(self) -> list[str]:
+        return list(self._postings["source"])
+
+    def sources_in(self, mask: np.ndarray) -> list[str]:
+        """Sources with at least one doc position set in ``mask``."""
+        return [s for s, ids in self._postings["source"].items() if mask[ids].any()]
+
+    def _keyword_mask(self, field: str, values: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        for value in values:
+            ids = self._postings[field].get(value)
+            if ids is not None:
+                mask[ids] = True
+        return mask
+
+    def source_ids(self, sources: Iterable[str]) -> np.ndarray:
+        """Doc positions from any of ``sources``, as a sorted int array."""
+        return np.flatnonzero(self._keyword_mask("source", sources))
+
+    def filter_ids(self, filters: QueryFilters) -> np.ndarray:
+        """Doc positions matching all filters, as a sorted int array."""
+        mask = np.ones(self.size, dtype=bool)
+        if filters.source_prefix:
+            sources = matching_sources(filters.source_prefix, self.sources)
+            mask &= self._keyword_mask("source", sources)
+        if filters.title:
+            mask &= self._keyword_mask("title", [filters.title])
+        if filters.file_types:
+            types = [normalize_file_type(ft) for ft in filters.file_types]
+            mask &= self._keyword_mask("file_type", types)
+        pages = self._columns["page"]
+        if filters.page_min is not None:
+            mask &= pages >= filters.page_min
+        if filters.page_max is not None:
+            mask &= pages <= filters.page_max
+        ingested = self._columns["ingested_at"]
+        if filters.ingested_after:
+            mask &= ingested >= epoch_seconds(filters.ingested_after)
+        if filters.ingested_before:
+            mask &= ingested <= epoch_seconds(filters.ingested_before)
+        return np.flatnonzero(mask)
+
+    def where_ids(self, where: dict[str, Any]) -> np.ndarray:
+        """Doc positions matching a Chroma-style ``where`` clause."""
+        return np.flatnonzero(self._where_mask(where))
+
+    def _where_mask(self, where: dict[str, Any]) -> np.ndarray:
+        if "$and" in where:
+            mask = np.ones(self.size, dtype=bool)
+            for clause in where["$and"]:
+                mask &= self._where_mask(clause)
+            return mask
+        if "$or" in where:
+            mask = np.zeros(self.size, dtype=bool)
+            for clause in where["$or"]:
+                mask |= self._where_mask(clause)
+            return mask
+
+        mask = np.ones(self.size, dtype=bool)
+        for field, cond in where.items():
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            for op, value in ops.items():
+                mask &= self._condition_mask(field, op, value)
+        return mask
+
+    def _condition_mask(self, field: str, op: str, value: Any) -> np.ndarray:
+        if field in self._postings:
+            if op in ("$eq", "$ne"):
+                hit = self._keyword_mask(field, [value])
+            elif op in ("$in", "$nin"):
+                hit = self._keyword_mask(field, value)
+            else:
+                raise ValueError(f"Unsupported operator {op} for field {field}")
+            return ~hit if op in ("$ne", "$nin") else hit
+        if field in self._columns:
+            column = self._columns[field]
+            if op in ("$in", "$nin"):
+                hit = np.isin(column, value)
+                return ~hit if op == "$nin" else hit
+            return _NUMERIC_OPS[op](column, value)
+        raise ValueError(f"Unknown filter field: {field}")
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from typing import Literal
+
+import numpy as np
+
+from .config import settings
+from .models import ScoredChunk
+
+FusionMethod = Literal["rrf", "combsum", "combmnz"]
+
+
+def rrf_scores(
+    rankings: list[np.ndarray],
+    num_docs: int,
+    k: int = 60,
+    weights: list[float] | None = None,
+) -> np.ndarray:
+    """Weighted RRF over integer doc indices.
+
+    Each ranking is an array of doc indices ordered best-first. Contributions
+    of ``w / (k + rank)`` are scatter-added into a dense score vector.
+    """
+    scores = np.zeros(num_docs, dtype=np.float64)
+    for i, ranking in enumerate(rankings):
+        if len(ranking) == 0:
+            continue
+        w = weights[i] if weights else 1.0
+        ranks = np.arange(1, len(ranking) + 1, dtype=np.float64)
+        scores += np.bincount(ranking, weights=w / (k + ranks), minlength=num_docs)
+    return scores
+
+
+def minmax_normalize(scores: np.ndarray) -> np.ndarray:
+    """Scale scores to [0, 1]. A constant list maps to all ones."""
+    if len(scores) == 0:
+        return scores.astype(np.float64)
+    lo, hi = float(scores.min()), float(scores.max())
+    if hi - lo <= 1e-12:
+        return np.ones(len(scores), dtype=np.float64)
+    return (scores - lo) / (hi - lo)
+
+
+def comb_scores(
+    rankings: list[np.ndarray],
+    raw_scores: list[np.ndarray],
+    num_docs: int,
+    weights: list[float] | None = None,
+    mnz: bool = False,
+) -> np.ndarray:
+    """CombSUM (or CombMNZ) over min-max normalized per-list scores."""
+    total = np.zeros(num_docs, dtype=np.float64)
+    hits = np.zeros(num_docs, dtype=np.float64)
+    for i, (ranking, raw) in enumerate(zip(rankings, raw_scores)):
+        if len(ranking) == 0:
+            continue
+        w = weights[i] if weights else 1.0
+        total += np.bincount(ranking, weights=w * minmax_normalize(raw), minlength=num_docs)
+        hits += np.bincount(ranking, minlength=num_docs)
+    if mnz:
+        total *= hits
+    return total
+
+
+def top_k_indices(scores: np.ndarray, k: int, candidates: np.ndarray | None = None) -> np.ndarray:
+    """Return indices of the k highest scores, best first.
+
+    Uses argpartition so only the selected k are fully sorted. Ties are broken
+    by the lower index to keep results deterministic.
+    """
+    idx = candidates if candidates is not None else np.arange(len(scores))
+    if len(idx) == 0 or k <= 0:
+        return idx[:0]
+    if k < len(idx):
+        neg = -scores[idx]
+        kth = neg[np.argpartition(neg, k - 1)[k - 1]]
+        # Keep every candidate tied with the k-th score so the cut is deterministic too
+        idx = idx[neg <= kth]
+    order = np.lexsort((idx, -scores[idx]))[:k]
+    return idx[order]
+
+
+def fuse(
+    result_lists: list[list[ScoredChunk]],
+    method: FusionMethod | None = None,
+    weights: list[float] | None = None,
+    k: int | None = None,
+    top_k: int | None = None,
+) -> list[ScoredChunk]:
+    """Fuse ranked ScoredChunk lists into one list.
+
+    Chunk IDs are interned to dense integer indices in first-seen order, then
+    scored with the vectorized kernels above.
+    """
+    fusion_method = method or settings.fusion_method
+    rrf_k = k or settings.rrf_k
+
+    index_of: dict[str, int] = {}
+    chunks: list[ScoredChunk] = []
+    rankings: list[np.ndarray] = []
+    raw_scores: list[np.ndarray] = []
+    for results in result_lists:
+        ranking = np.empty(len(results), dtype=np.int64)
+        for rank, sc in enumerate(results):
+            idx = index_of.get(sc.chunk.chunk_id)
+            if idx is None:
+                idx = index_of[sc.chunk.chunk_id] = len(chunks)
+                chunks.append(sc)
+            ranking[rank] = idx
+        rankings.append(ranking)
+        raw_scores.append(np.fromiter((sc.score for sc in results), np.float64, len(results)))
+
+    if not chunks:
+        return []
+
+    if fusion_method == "rrf":
+        scores = rrf_scores(rankings, len(chunks), k=rrf_k, weights=weights)
+    elif fusion_method in ("combsum", "combmnz"):
+        scores = comb_scores(
+            rankings, raw_scores, len(chunks), weights=weights, mnz=fusion_method == "combmnz"
+        )
+    else:
+        raise ValueError(f"Unknown fusion method: {fusion_method}")
+
+    limit = top_k if top_k is not None else len(chunks)
+    return [
+        ScoredChunk(chunk=chunks[i].chunk, score=float(scores[i]), origin=fusion_method)
+        for i in top_k_indices(scores, limit)
+    ]
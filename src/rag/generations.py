@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import structlog
+
+from .hybrid_retriever import DenseIndex, HybridRetriever, SparseIndex
+
+log = structlog.get_logger()
+
+
+class IndexGeneration:
+    """A BM25 index and vector index that are published and retired together.
+
+    A generation is never mutated after it is published. Readers pin it for the
+    duration of a query; once it is retired and the last reader leaves, its
+    vector index is dropped (for a Chroma generation: its deleted rows become
+    purgeable) and the BM25 index becomes garbage. A segment merge publishes a
+    successor sharing the vector index, which the retired generation then
+    leaves alone.
+    """
+
+    def __init__(
+        self,
+        number: int,
+        bm25: SparseIndex,
+        vector: DenseIndex,
+        retriever: HybridRetriever | None = None,
+    ) -> None:
+        self.number = number
+        self.bm25 = bm25
+        self.vector = vector
+        self.retriever = retriever or HybridRetriever(bm25, vector)
+        self._readers = 0
+        self._retired = False
+        self._keep_vector = False  # a successor serves the same vector index
+        self._reclaimed = False
+        self._lock = threading.Lock()
+
+    @property
+    def readers(self) -> int:
+        return self._readers
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._readers += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._readers -= 1
+            reclaim = self._should_reclaim()
+        if reclaim:
+            self._reclaim()
+
+    def retire(self, keep_vector: bool = False) -> None:
+        with self._lock:
+            self._retired = True
+            self._keep_vector = keep_vector
+            reclaim = self._should_reclaim()
+        if reclaim:
+            self._reclaim()
+
+    def _should_reclaim(self) -> bool:
+        # Caller holds self._lock
+        if self._retired and self._readers == 0 and not self._reclaimed:
+            self._reclaimed = True
+            return True
+        return False
+
+    def _reclaim(self) -> None:
+        if self._keep_vector:
+            return
+        try:
+            self.vector.drop()
+        except Exception:
+            log.exception("generation_reclaim_failed", generation=self.number)
+            return
+        log.info("generation_reclaimed", generation=self.number, collection=self.vector.name)
+
+
+class GenerationHolder:
+    """Holds the current generation; readers pin it, writers swap it atomically."""
+
+    def __init__(self) -> None:
+        self._current: IndexGeneration | None = None
+
+    @property
+    def current(self) -> IndexGeneration | None:
+        return self._current
+
+    @contextmanager
+    def reader(self) -> Iterator[IndexGeneration | None]:
+        """Pin the current generation for the duration of the block.
+
+        Never blocks on indexing: if a swap races with the pin, the stale
+        generation is released and the new one is pinned instead.
+        """
+        while True:
+            gen = self._current
+            if gen is None:
+                yield None
+                return
+            gen.acquire()
+            if gen is self._current:
+                break
+            gen.release()
+        try:
+            yield gen
+        finally:
+            gen.release()
+
+    def publish(self, gen: IndexGeneration) -> None:
+        """Flip readers to ``gen`` (a single reference assignment) and retire the old one."""
+        old, self._current = self._current, gen
+        log.info("generation_published", generation=gen.number, collection=gen.vector.name)
+        if old is not None and old is not gen:
+            old.retire(keep_vector=old.vector is gen.vector)
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import structlog
-from google import genai
-from google.genai import types
 
 from .citations import build_citation_map, validate_citations
 from .config import settings
+from .llm import LLMRequest, get_backend
+from .metrics import span
 from .models import Citation, ScoredChunk
+from .resilience import complete_resilient
 
 log = structlog.get_logger()
 
@@ -21,15 +22,6 @@ provided reference documents. Follow these rules strictly:
 5. Be concise and direct. Do not repeat the question.
 """
 
-_client: genai.Client | None = None
-
-
-def _get_client() -> genai.Client:
-    global _client
-    if _client is None:
-        _client = genai.Client(api_key=settings.gemini_api_key)
-    return _client
-
 
 def _build_context_block(chunks: list[ScoredChunk]) -> str:
     lines: list[str] = []
@@ -44,8 +36,13 @@ def generate(
     chunks: list[ScoredChunk],
     model: str | None = None,
     temperature: float = 0.1,
+    deadline: float | None = None,
 ) -> tuple[str, list[Citation]]:
-    """Generate an answer with enforced citations."""
+    """Generate an answer with enforced citations.
+
+    ``deadline`` (a ``time.monotonic()`` instant) bounds the LLM call; past it
+    ``LLMDeadlineExceededError`` is raised.
+    """
     if not chunks:
         return "I don't have enough information to answer this question.", []
 
@@ -53,20 +50,17 @@ def generate(
     context = _build_context_block(chunks)
     citation_map = build_citation_map(chunks)
 
-    client = _get_client()
-
-    response = client.models.generate_content(
+    request = LLMRequest(
         model=llm_model,
-        contents=f"References:\n{context}\n\nQuestion: {query}",
-        config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT,
-            temperature=temperature,
-        ),
+        prompt=f"References:\n{context}\n\nQuestion: {query}",
+        system=SYSTEM_PROMPT,
+        temperature=temperature,
     )
+    with span("generate"):
+        raw_answer = complete_resilient(get_backend(), request, deadline=deadline)
 
-    raw_answer = response.text or ""
-
-    answer, citations = validate_citations(raw_answer, citation_map)
+    with span("citations"):
+        answer, citations = validate_citations(raw_answer, citation_map)
 
     # If the model produced no citations at all, flag it
     if not citations and chunks:
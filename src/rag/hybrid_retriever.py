@@ -1,50 +1,124 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING, Any, Protocol
+
 import structlog
 
-from .bm25_index import BM25Index
 from .config import settings
-from .models import ScoredChunk
-from .vector_store import VectorStore
+from .filters import matching_sources, to_chroma_where
+from .fusion import fuse
+from .metrics import span
+from .models import Chunk, QueryFilters, ScoredChunk
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .analysis import Analyzer
 
 log = structlog.get_logger()
 
 
+class SparseIndex(Protocol):
+    """What the retriever needs from a sparse index (SegmentedBM25Index or a shared one)."""
+
+    analyzer: Analyzer
+
+    @property
+    def chunks(self) -> list[Chunk]: ...
+
+    @property
+    def sources(self) -> list[str]: ...
+
+    @property
+    def memory_bytes(self) -> int: ...
+
+    def search(
+        self, query: str, top_k: int | None = None, filters: QueryFilters | None = None
+    ) -> list[ScoredChunk]: ...
+
+
+class DenseIndex(Protocol):
+    """What the retriever needs from a dense index (VectorStore or a shared one)."""
+
+    @property
+    def name(self) -> str: ...
+
+    @property
+    def count(self) -> int: ...
+
+    @property
+    def memory_bytes(self) -> int: ...
+
+    def drop(self) -> None: ...
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[ScoredChunk]: ...
+
+
 def reciprocal_rank_fusion(
     result_lists: list[list[ScoredChunk]],
     k: int | None = None,
+    weights: list[float] | None = None,
 ) -> list[ScoredChunk]:
     """Merge multiple ranked lists using Reciprocal Rank Fusion (RRF).
 
-    RRF score for document d = sum over all lists of 1 / (k + rank_in_list)
+    RRF score for document d = sum over all lists of w / (k + rank_in_list)
     """
-    rrf_k = k or settings.rrf_k
-    chunk_scores: dict[str, float] = {}
-    chunk_map: dict[str, ScoredChunk] = {}
-
-    for results in result_lists:
-        for rank, sc in enumerate(results):
-            cid = sc.chunk.chunk_id
-            chunk_scores[cid] = chunk_scores.get(cid, 0.0) + 1.0 / (rrf_k + rank + 1)
-            # Keep the highest-scored version
-            if cid not in chunk_map or sc.score > chunk_map[cid].score:
-                chunk_map[cid] = sc
-
-    ranked = sorted(chunk_scores.items(), key=lambda x: x[1], reverse=True)
-    return [
-        ScoredChunk(
-            chunk=chunk_map[cid].chunk,
-            score=score,
-            origin="rrf",
-        )
-        for cid, score in ranked
-    ]
+    return fuse(result_lists, method="rrf", weights=weights, k=k)
+
+
+def _score_gap(results: list[ScoredChunk], window: int) -> float:
+    """Relative drop from the top score to the mean of the next few, in [0, 1]."""
+    if len(results) < 2:
+        return 1.0 if results else 0.0
+    top = results[0].score
+    rest = [sc.score for sc in results[1 : window + 1]]
+    gap = (top - sum(rest) / len(rest)) / (abs(top) + 1e-9)
+    return max(0.0, min(1.0, gap))
+
+
+def choose_candidate_depth(
+    query: str,
+    bm25_results: list[ScoredChunk],
+    vector_results: list[ScoredChunk],
+    min_k: int | None = None,
+    max_k: int | None = None,
+) -> int:
+    """Pick a per-leg candidate depth between min_k and max_k.
+
+    Easy queries (a clear score gap in both legs, strong agreement between the
+    legs' heads, short query) get shallow depth; hard queries get the full depth.
+    """
+    lo = min_k or settings.adaptive_min_k
+    hi = max(lo, max_k or settings.adaptive_max_k)
+
+    gap = (_score_gap(bm25_results, lo) + _score_gap(vector_results, lo)) / 2
+    bm25_head = {sc.chunk.chunk_id for sc in bm25_results[:lo]}
+    vector_head = {sc.chunk.chunk_id for sc in vector_results[:lo]}
+    overlap = len(bm25_head & vector_head) / lo
+    length = min(1.0, len(query.split()) / settings.adaptive_long_query_tokens)
+
+    confidence = 0.4 * gap + 0.4 * overlap + 0.2 * (1.0 - length)
+    depth = hi - round(confidence * (hi - lo))
+    log.debug(
+        "adaptive_depth",
+        gap=round(gap, 3),
+        overlap=round(overlap, 3),
+        length=round(length, 3),
+        depth=depth,
+    )
+    return depth
 
 
 class HybridRetriever:
-    """Combines BM25 sparse retrieval with dense vector search via RRF."""
+    """Combines BM25 sparse retrieval with dense vector search via rank fusion."""
 
-    def __init__(self, bm25: BM25Index, vector: VectorStore) -> None:
+    def __init__(self, bm25: SparseIndex, vector: DenseIndex) -> None:
         self._bm25 = bm25
         self._vector = vector
 
@@ -54,9 +128,33 @@ class HybridRetriever:
         bm25_top_k: int | None = None,
         vector_top_k: int | None = None,
         final_top_k: int | None = None,
+        adaptive: bool | None = None,
+        filters: QueryFilters | None = None,
+        query_embedding: np.ndarray | None = None,
     ) -> list[ScoredChunk]:
-        bm25_results = self._bm25.search(query, top_k=bm25_top_k)
-        vector_results = self._vector.search(query, top_k=vector_top_k)
+        where = None
+        if filters is not None and not filters.is_empty():
+            sources = self._bm25.sources
+            if filters.source_prefix and not matching_sources(filters.source_prefix, sources):
+                return []  # nothing in the corpus can match
+            where = to_chroma_where(filters, sources)
+
+        use_adaptive = settings.adaptive_depth if adaptive is None else adaptive
+        if use_adaptive:
+            # Pull the legs at max depth (cheap), then trim before fusion so the
+            # reranker only sees as many candidates as the query needs.
+            bm25_top_k = bm25_top_k or settings.adaptive_max_k
+            vector_top_k = vector_top_k or settings.adaptive_max_k
+
+        bm25_results, vector_results = self._search_legs(
+            query, bm25_top_k, vector_top_k, filters, where, query_embedding
+        )
+
+        if use_adaptive:
+            depth = choose_candidate_depth(query, bm25_results, vector_results)
+            bm25_results = bm25_results[:depth]
+            vector_results = vector_results[:depth]
+            final_top_k = final_top_k or 2 * depth
 
         log.debug(
             "hybrid_retrieval",
@@ -64,7 +162,27 @@ class HybridRetriever:
             vector_hits=len(vector_results),
         )
 
-        fused = reciprocal_rank_fusion([bm25_results, vector_results])
-
         k = final_top_k or (settings.bm25_top_k + settings.vector_top_k)
-        return fused[:k]
+        with span("fusion"):
+            return fuse(
+                [bm25_results, vector_results],
+                weights=[settings.bm25_weight, settings.vector_weight],
+                top_k=k,
+            )
+
+    def _search_legs(
+        self,
+        query: str,
+        bm25_top_k: int | None,
+        vector_top_k: int | None,
+        filters: QueryFilters | None,
+        where: dict[str, Any] | None,
+        query_embedding: np.ndarray | None,
+    ) -> tuple[list[ScoredChunk], list[ScoredChunk]]:
+        """Ranked BM25 and vector candidates, each best first."""
+        with span("bm25"):
+            bm25_results = self._bm25.search(query, top_k=bm25_top_k, filters=filters)
+        vector_results = self._vector.search(
+            query, top_k=vector_top_k, where=where, query_embedding=query_embedding
+        )
+        return bm25_results, vector_results
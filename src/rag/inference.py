@@ -0,0 +1,370 @@
+"""Out-of-process model inference with dynamic batching.
+
+One process owns the embedding model and the cross-encoder. API workers send
+``embed`` / ``score`` requests over a Unix socket; the server queues the
+individual texts (or query-passage pairs) and runs them through the model in
+dynamic batches: a batch is flushed when it reaches ``max_batch`` items or
+when its oldest item has waited ``max_wait_ms``. Concurrent single-query
+requests therefore share one forward pass instead of contending for the GIL.
+Messages are framed as described in ``wire``.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Generic, TypeVar
+
+import numpy as np
+import structlog
+
+from .config import settings
+from .metrics import Histogram
+from .wire import recv_message, send_array, send_message
+
+log = structlog.get_logger()
+
+T = TypeVar("T")
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class DynamicBatcher(Generic[T]):
+    """Coalesces items submitted from many threads into batched calls of ``fn``.
+
+    ``fn`` receives a list of items and must return one result per item.
+    A single worker thread runs ``fn``, so the model is never entered
+    concurrently.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[list[T]], Sequence[Any]],
+        max_batch: int,
+        max_wait_ms: float,
+    ) -> None:
+        self.name = name
+        self._fn = fn
+        self._max_batch = max_batch
+        self._max_wait_s = max_wait_ms / 1000
+        self._queue: deque[tuple[float, T, Future[Any]]] = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_depths = Histogram(QUEUE_DEPTH_BUCKETS)
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def submit_many(self, items: Sequence[T]) -> list[Future[Any]]:
+        now = time.monotonic()
+        futures: list[Future[Any]] = [Future() for _ in items]
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError(f"Batcher {self.name} is stopped")
+            self._queue.extend(zip([now] * len(items), items, futures))
+            self._cond.notify()
+        return futures
+
+    def run(self, items: Sequence[T]) -> list[Any]:
+        """Submit ``items`` and block until all their results are ready."""
+        return [f.result() for f in self.submit_many(items)]
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def _next_batch(self) -> list[tuple[float, T, Future[Any]]] | None:
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            # Wait for more items until the batch is full or the oldest item's budget is spent
+            deadline = self._queue[0][0] + self._max_wait_s
+            while len(self._queue) < self._max_batch and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self.queue_depths.observe(len(self._queue))
+            n = min(self._max_batch, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            self.batch_sizes.observe(len(batch))
+            try:
+                results = self._fn([item for _, item, _ in batch])
+            except Exception as e:
+                log.exception("inference_batch_failed", batcher=self.name, size=len(batch))
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            if len(results) < len(batch):
+                log.error(
+                    "inference_batch_short", batcher=self.name, size=len(batch), got=len(results)
+                )
+                error = RuntimeError(
+                    f"Batcher {self.name} got {len(results)} results for {len(batch)} items"
+                )
+                for _, _, future in batch[len(results) :]:
+                    future.set_exception(error)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.depth,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_depth_at_flush": self.queue_depths.snapshot(),
+        }
+
+
+# --- Server ----------------------------------------------------------------
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 256  # default of 5 refuses bursts of new API threads
+
+
+class SocketServer:
+    """Serves framed requests on a Unix socket, one thread per connection.
+
+    Subclasses implement ``_handle`` and answer with ``send_message`` on the connection.
+    """
+
+    name = "socket"
+
+    def __init__(self, socket_path: Path) -> None:
+        self.socket_path = socket_path
+        self._server: _UnixServer | None = None
+        self._thread: threading.Thread | None = None
+        self._conns: set[socket.socket] = set()
+        self._conns_lock = threading.Lock()
+
+    def _handle(self, header: dict[str, Any], payload: bytes, conn: socket.socket) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        """Bind the socket and serve connections in background threads."""
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                conn: socket.socket = self.request
+                with server._conns_lock:
+                    server._conns.add(conn)
+                while True:
+                    try:
+                        header, payload = recv_message(conn)
+                    except ConnectionError:
+                        return
+                    try:
+                        server._handle(header, payload, conn)
+                    except OSError:
+                        return  # the client gave up on this connection (e.g. timed out)
+                    except Exception as e:
+                        log.exception(f"{server.name}_request_failed", op=header.get("op"))
+                        send_message(conn, {"error": str(e)})
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()  # stale socket from a previous run
+        self._server = _UnixServer(str(self.socket_path), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name=f"{self.name}-server", daemon=True
+        )
+        self._thread.start()
+        log.info(f"{self.name}_server_listening", socket=str(self.socket_path), pid=os.getpid())
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # Persistent client connections outlive serve_forever; cut them so clients reconnect
+        with self._conns_lock:
+            conns, self._conns = self._conns, set()
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.socket_path.unlink(missing_ok=True)
+
+
+class InferenceServer(SocketServer):
+    """Serves batched ``embed`` and ``score`` requests on a Unix socket."""
+
+    name = "inference"
+
+    def __init__(
+        self,
+        socket_path: Path,
+        embed_fn: Callable[[list[str]], np.ndarray],
+        score_fn: Callable[[list[tuple[str, str]]], np.ndarray],
+        max_batch: int | None = None,
+        max_wait_ms: float | None = None,
+    ) -> None:
+        super().__init__(socket_path)
+        batch = max_batch or settings.inference_max_batch
+        wait = settings.inference_max_wait_ms if max_wait_ms is None else max_wait_ms
+        self.embedder: DynamicBatcher[str] = DynamicBatcher(
+            "embed", lambda texts: list(embed_fn(texts)), batch, wait
+        )
+        self.scorer: DynamicBatcher[tuple[str, str]] = DynamicBatcher(
+            "score", lambda pairs: list(score_fn(pairs)), batch, wait
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {"embed": self.embedder.stats(), "score": self.scorer.stats()}
+
+    def _handle(self, header: dict[str, Any], payload: bytes, conn: socket.socket) -> None:
+        op = header.get("op")
+        if op == "embed":
+            rows = self.embedder.run(header["texts"])
+            send_array(conn, np.stack(rows) if rows else np.zeros((0, 0), np.float32))
+        elif op == "score":
+            pairs = [(q, p) for q, p in header["pairs"]]
+            send_array(conn, np.asarray(self.scorer.run(pairs), dtype=np.float32))
+        elif op == "stats":
+            send_message(conn, {"stats": self.stats()})
+        else:
+            send_message(conn, {"error": f"Unknown op: {op}"})
+
+    def stop(self) -> None:
+        super().stop()
+        self.embedder.stop()
+        self.scorer.stop()
+
+
+def serve_inference(socket_path: Path | None = None) -> None:
+    """Run the inference server with the real models until interrupted."""
+    from . import embeddings, reranker
+
+    path = socket_path or settings.inference_socket
+    if path is None:
+        raise ValueError("No inference socket configured (RAG_INFERENCE_SOCKET)")
+    embeddings.embed_texts_local(["warm up"])
+    reranker.score_pairs_local([("warm up", "warm up")])
+    server = InferenceServer(path, embeddings.embed_texts_local, reranker.score_pairs_local)
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+# --- Client ----------------------------------------------------------------
+
+
+class SocketClient:
+    """Thread-safe framed-JSON client; each thread keeps its own persistent connection."""
+
+    server_name = "Socket"
+
+    def __init__(self, socket_path: Path, timeout_s: float = 30.0) -> None:
+        self.socket_path = socket_path
+        self._timeout_s = timeout_s
+        self._local = threading.local()
+        self._socks: list[socket.socket] = []
+        self._socks_lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout_s)
+        sock.connect(str(self.socket_path))
+        with self._socks_lock:
+            self._socks.append(sock)
+        return sock
+
+    def close(self) -> None:
+        """Close every thread's connection."""
+        with self._socks_lock:
+            socks, self._socks = self._socks, []
+        for sock in socks:
+            sock.close()
+
+    def _discard(self, sock: socket.socket | None) -> None:
+        """Close this thread's connection so the next call opens a fresh one."""
+        if sock is not None:
+            with self._socks_lock:
+                if sock in self._socks:
+                    self._socks.remove(sock)
+            sock.close()
+        self._local.sock = None
+
+    def _call(self, header: dict[str, Any], payload: bytes = b"") -> tuple[dict[str, Any], bytes]:
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_message(sock, header, payload)
+                reply, data = recv_message(sock)
+                break
+            except OSError as e:
+                # A timed-out connection may still deliver the abandoned reply, so it is
+                # never reused. A closed one means the server may have restarted: retry once.
+                self._discard(sock)
+                if attempt or not isinstance(e, ConnectionError):
+                    raise
+        if "error" in reply:
+            raise RuntimeError(f"{self.server_name} server error: {reply['error']}")
+        return reply, data
+
+
+class InferenceClient(SocketClient):
+    """Client of the model-inference server."""
+
+    server_name = "Inference"
+
+    def _array(self, header: dict[str, Any]) -> np.ndarray:
+        reply, payload = self._call(header)
+        return np.frombuffer(payload, dtype=reply["dtype"]).reshape(reply["shape"])
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self._array({"op": "embed", "texts": texts})
+
+    def score(self, pairs: Sequence[Sequence[str]]) -> np.ndarray:
+        return self._array({"op": "score", "pairs": [list(p) for p in pairs]})
+
+    def stats(self) -> dict[str, Any]:
+        reply, _ = self._call({"op": "stats"})
+        return reply["stats"]
+
+
+_client: InferenceClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> InferenceClient | None:
+    """Client for ``RAG_INFERENCE_SOCKET``, or None to run models in-process."""
+    global _client
+    path = settings.inference_socket
+    if path is None:
+        return None
+    if _client is None or _client.socket_path != path:
+        with _client_lock:
+            if _client is None or _client.socket_path != path:
+                _client = InferenceClient(path)
+    return _client
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-import structlog
+import hashlib
+import time
 from pathlib import Path
+from typing import Protocol
+
+import structlog
 
 from .chunker import chunk_markdown, chunk_text
 from .models import Chunk
@@ -9,6 +13,14 @@ from .models import Chunk
 log = structlog.get_logger()
 
 
+class IngestProgress(Protocol):
+    """Receives progress events while files are loaded and embedded."""
+
+    def file_done(self, path: Path, chunks: int) -> None: ...
+
+    def chunks_embedded(self, count: int) -> None: ...
+
+
 def _read_text_file(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="replace")
 
@@ -26,10 +38,44 @@ def _read_pdf(path: Path) -> list[tuple[int, str]]:
     return pages
 
 
-def ingest_file(path: Path) -> list[Chunk]:
-    """Load a single file and return chunks."""
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_of(path: Path, root: Path) -> str:
+    """The ``source`` recorded for chunks of ``path``: its POSIX path relative to ``root``.
+
+    Directory ingests, uploads and deletes all name a file this way, so the
+    same file is one source however the caller spelled its path, and sources
+    do not reveal where the corpus lives on the host. A file outside ``root``
+    keeps the path it was given.
+    """
+    try:
+        return path.resolve().relative_to(root.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def ingest_file(path: Path, root: Path) -> list[Chunk]:
+    """Load a single file and return chunks stamped with the ingest time.
+
+    Chunk sources are relative to ``root``, the corpus directory.
+    """
+    chunks = _load_file(path, root)
+    now = int(time.time())
+    for c in chunks:
+        c.ingested_at = now
+    return chunks
+
+
+def _load_file(path: Path, root: Path) -> list[Chunk]:
     suffix = path.suffix.lower()
-    source = path.as_posix()
+    source = source_of(path, root)
 
     if suffix == ".pdf":
         pages = _read_pdf(path)
@@ -57,8 +103,14 @@ def ingest_directory(
     directory: Path,
     glob_pattern: str = "**/*",
     extensions: set[str] | None = None,
+    progress: IngestProgress | None = None,
+    root: Path | None = None,
 ) -> list[Chunk]:
-    """Recursively ingest all supported files from a directory."""
+    """Recursively ingest all supported files from a directory.
+
+    Chunk sources are relative to ``root``, which defaults to ``directory``.
+    """
+    root = directory if root is None else root
     if extensions is None:
         extensions = {".md", ".markdown", ".txt", ".pdf", ".rst"}
 
@@ -71,9 +123,13 @@ def ingest_directory(
         if path.suffix.lower() not in extensions:
             continue
         try:
-            all_chunks.extend(ingest_file(path))
+            chunks = ingest_file(path, root)
         except Exception:
             log.exception("ingest_error", path=str(path))
+            continue
+        all_chunks.extend(chunks)
+        if progress is not None:
+            progress.file_done(path, len(chunks))
 
     log.info("ingest_complete", directory=str(directory), total_chunks=len(all_chunks))
     return all_chunks
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+import structlog
+from pydantic import BaseModel, computed_field
+
+from .pipeline import RAGPipeline
+
+log = structlog.get_logger()
+
+JobKind = Literal["directory", "upload"]
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+_MAX_FINISHED_JOBS = 1000
+
+
+class IngestJob(BaseModel):
+    """Status and progress of a background ingestion job."""
+
+    job_id: str
+    kind: JobKind
+    tenant: str
+    paths: list[str]
+    status: JobStatus = "queued"
+    files_processed: int = 0
+    chunks_embedded: int = 0
+    chunks_indexed: int = 0
+    coalesced_with: list[str] = []
+    duplicate_of: str = ""  # set when the content was already indexed and nothing ran
+    error: str = ""
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def chunks_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.chunks_embedded / elapsed, 2) if elapsed > 0 else 0.0
+
+
+@dataclass
+class _Pending:
+    job: IngestJob
+    pipeline: RAGPipeline
+
+
+class _BatchProgress:
+    """Fans ingest progress events out to every job in a coalesced batch."""
+
+    def __init__(self, jobs: list[IngestJob]) -> None:
+        self._jobs = jobs
+
+    def file_done(self, path: Path, chunks: int) -> None:
+        for job in self._jobs:
+            job.files_processed += 1
+
+    def chunks_embedded(self, count: int) -> None:
+        for job in self._jobs:
+            job.chunks_embedded += count
+
+
+class IngestJobQueue:
+    """Single background worker that runs ingestion jobs in submission order.
+
+    Consecutive queued upload jobs for the same tenant are coalesced into one
+    incremental index update, so a burst of uploads triggers one embed + BM25
+    rebuild. Jobs of one tenant never run out of submission order.
+    """
+
+    def __init__(self, on_finished: Callable[[IngestJob], None] | None = None) -> None:
+        self._on_finished = on_finished
+        self._pending: deque[_Pending] = deque()
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="documind-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(
+        self,
+        pipeline: RAGPipeline,
+        kind: JobKind,
+        paths: list[Path],
+        tenant: str = "default",
+    ) -> IngestJob:
+        job = IngestJob(
+            job_id=uuid.uuid4().hex[:12],
+            kind=kind,
+            tenant=tenant,
+            paths=[p.as_posix() for p in paths],
+            created_at=time.time(),
+        )
+        with self._cond:
+            self._jobs[job.job_id] = job
+            self._pending.append(_Pending(job, pipeline))
+            self._trim_history()
+            self._cond.notify()
+        log.info("ingest_job_queued", job_id=job.job_id, kind=kind, tenant=tenant)
+        return job
+
+    def skip_duplicate(
+        self, kind: JobKind, paths: list[Path], duplicate_of: str, tenant: str = "default"
+    ) -> IngestJob:
+        """Record a job that needs no work: its content is indexed as ``duplicate_of``."""
+        now = time.time()
+        job = IngestJob(
+            job_id=uuid.uuid4().hex[:12],
+            kind=kind,
+            tenant=tenant,
+            paths=[p.as_posix() for p in paths],
+            status="succeeded",
+            duplicate_of=duplicate_of,
+            created_at=now,
+            started_at=now,
+            finished_at=now,
+        )
+        with self._cond:
+            self._jobs[job.job_id] = job
+            self._trim_history()
+        log.info("ingest_job_skipped", job_id=job.job_id, duplicate_of=duplicate_of)
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def has_pending(self, tenant: str) -> bool:
+        """Whether ``tenant`` has a queued or running job."""
+        with self._cond:
+            return any(
+                j.tenant == tenant and j.status in ("queued", "running")
+                for j in self._jobs.values()
+            )
+
+    @property
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _trim_history(self) -> None:
+        finished = [j for j in self._jobs.values() if j.status in ("succeeded", "failed")]
+        for job in finished[: max(0, len(self._jobs) - _MAX_FINISHED_JOBS)]:
+            del self._jobs[job.job_id]
+
+    def _next_batch(self) -> list[_Pending] | None:
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                return None
+            first = self._pending.popleft()
+            batch = [first]
+            if first.job.kind == "upload":
+                rest: deque[_Pending] = deque()
+                merging = True
+                for item in self._pending:
+                    if item.pipeline is first.pipeline:
+                        # Uploads queued after a directory job must not overtake it
+                        merging = merging and item.job.kind == "upload"
+                        if merging:
+                            batch.append(item)
+                            continue
+                    rest.append(item)
+                self._pending = rest
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            self._process(batch)
+
+    def _process(self, batch: list[_Pending]) -> None:
+        jobs = [item.job for item in batch]
+        pipe = batch[0].pipeline
+        started = time.time()
+        ids = [j.job_id for j in jobs]
+        for job in jobs:
+            job.status = "running"
+            job.started_at = started
+            job.coalesced_with = [i for i in ids if i != job.job_id]
+
+        progress = _BatchProgress(jobs)
+        try:
+            if jobs[0].kind == "directory":
+                count = pipe.ingest(docs_dir=Path(jobs[0].paths[0]), progress=progress)
+            else:
+                paths = list(dict.fromkeys(Path(p) for j in jobs for p in j.paths))
+                count = pipe.ingest_files(paths, progress=progress)
+            status: JobStatus = "succeeded"
+            error = ""
+        except Exception as e:
+            log.exception("ingest_job_failed", job_ids=ids)
+            count, status, error = 0, "failed", str(e)
+
+        finished = time.time()
+        for job in jobs:
+            job.chunks_indexed = count
+            job.status = status
+            job.error = error
+            job.finished_at = finished
+        log.info(
+            "ingest_job_finished",
+            job_ids=ids,
+            status=status,
+            chunks=count,
+            seconds=round(finished - started, 3),
+        )
+        if self._on_finished is not None:
+            self._on_finished(jobs[0])
@@ -0,0 +1,243 @@
+"""Pluggable LLM backends: live Gemini, a deterministic local stub, and record/replay.
+
+``RAG_LLM_BACKEND`` picks the backend (``gemini`` or ``stub``) and
+``RAG_LLM_CACHE_MODE`` optionally wraps it in a record/replay cache keyed by
+a hash of the full request (model, system prompt, prompt, temperature):
+
+- ``record``: always call the backend and store the response
+- ``replay``: only serve stored responses; a miss raises ``LLMCacheMissError``
+- ``auto``: serve stored responses, record on a miss
+
+Recorded Gemini responses let benchmarks and evals run offline at full
+speed with the exact text the live model produced.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal, Protocol
+
+import structlog
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from google import genai
+
+log = structlog.get_logger()
+
+CacheMode = Literal["off", "record", "replay", "auto"]
+
+
+@dataclass(frozen=True)
+class LLMRequest:
+    model: str
+    prompt: str
+    system: str = ""
+    temperature: float = 0.0
+
+    def key(self) -> str:
+        """Stable hash of everything that determines the response."""
+        raw = json.dumps(asdict(self), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMBackend(Protocol):
+    name: str
+
+    def complete(self, request: LLMRequest) -> str: ...
+
+
+class LLMCacheMissError(KeyError):
+    """Replay mode found no recorded response for a request."""
+
+
+class GeminiBackend:
+    """Live Gemini via google-genai; one client per backend, created lazily."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str | None = None) -> None:
+        self._api_key = api_key
+        self._client: genai.Client | None = None
+        self._lock = threading.Lock()
+
+    def _get_client(self) -> genai.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google import genai
+                    from google.genai import types
+
+                    # Bound abandoned (hedged or timed-out) calls so their threads finish
+                    self._client = genai.Client(
+                        api_key=self._api_key or settings.gemini_api_key,
+                        http_options=types.HttpOptions(timeout=int(settings.llm_timeout_s * 1000)),
+                    )
+        return self._client
+
+    def complete(self, request: LLMRequest) -> str:
+        from google.genai import types
+
+        response = self._get_client().models.generate_content(
+            model=request.model,
+            contents=request.prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=request.system or None,
+                temperature=request.temperature,
+            ),
+        )
+        return response.text or ""
+
+
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Rate limits, transient server errors and dropped connections."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    return code in _RETRYABLE_CODES
+
+
+_REF_RE = re.compile(r"^\[(\d+)\]", re.MULTILINE)
+_JUDGE_RE = re.compile(r"scale of 0\.0 to 1\.0|decimal number", re.IGNORECASE)
+
+
+class StubBackend:
+    """Deterministic local stand-in for an LLM.
+
+    Answers cite up to three of the ``[N]`` references found in the prompt;
+    judge prompts (asking for a 0.0-1.0 score) get a score derived from the
+    request hash. Latency is simulated as ``latency_ms`` to the first token
+    plus the output length at ``tokens_per_s`` (0 = instant).
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float | None = None, tokens_per_s: float | None = None) -> None:
+        self.latency_ms = settings.llm_stub_latency_ms if latency_ms is None else latency_ms
+        self.tokens_per_s = settings.llm_stub_tokens_per_s if tokens_per_s is None else tokens_per_s
+
+    def _text(self, request: LLMRequest) -> str:
+        key = request.key()
+        if _JUDGE_RE.search(request.system) or _JUDGE_RE.search(request.prompt):
+            return f"{0.7 + (int(key[:8], 16) % 31) / 100:.2f}"
+        refs = list(dict.fromkeys(int(n) for n in _REF_RE.findall(request.prompt)))
+        if not refs:
+            return "The references do not contain enough information to answer this question."
+        return " ".join(
+            f"According to the references, this point is supported [{n}]." for n in refs[:3]
+        )
+
+    def complete(self, request: LLMRequest) -> str:
+        text = self._text(request)
+        delay = self.latency_ms / 1000
+        if self.tokens_per_s > 0:
+            delay += len(text.split()) / self.tokens_per_s
+        if delay > 0:
+            time.sleep(delay)
+        return text
+
+
+class RecordReplayBackend:
+    """Wraps a backend with an on-disk response cache keyed by request hash."""
+
+    def __init__(self, inner: LLMBackend | None, cache_dir: Path, mode: CacheMode) -> None:
+        if mode != "replay" and inner is None:
+            raise ValueError(f"Cache mode {mode!r} needs a backend to record from")
+        self._inner = inner
+        self._dir = cache_dir
+        self.mode = mode
+        self.name = f"{mode}:{inner.name if inner else 'none'}"
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self._dir / key[:2] / f"{key}.json"
+
+    def lookup(self, request: LLMRequest) -> str | None:
+        path = self._path(request.key())
+        if not path.exists():
+            return None
+        return str(json.loads(path.read_text(encoding="utf-8"))["response"])
+
+    def store(self, request: LLMRequest, response: str) -> None:
+        path = self._path(request.key())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "request": asdict(request),
+            "response": response,
+            "backend": self._inner.name if self._inner else "",
+            "recorded_at": int(time.time()),
+        }
+        tmp = path.with_suffix(f".tmp-{os.getpid()}-{threading.get_ident()}")
+        tmp.write_text(json.dumps(record, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(path)
+
+    def complete(self, request: LLMRequest) -> str:
+        if self.mode in ("replay", "auto"):
+            cached = self.lookup(request)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            if self.mode == "replay":
+                raise LLMCacheMissError(f"No recorded LLM response for {request.key()[:12]}")
+        assert self._inner is not None
+        response = self._inner.complete(request)
+        self.store(request, response)
+        return response
+
+
+_backends: dict[tuple[object, ...], LLMBackend] = {}
+_backends_lock = threading.Lock()
+_override: LLMBackend | None = None
+
+
+def set_backend(backend: LLMBackend | None) -> None:
+    """Force a backend for every caller (benchmarks, tests); None restores settings."""
+    global _override
+    _override = backend
+
+
+def get_backend(api_key: str | None = None) -> LLMBackend:
+    """The configured backend, built once per configuration and reused."""
+    if _override is not None:
+        return _override
+    config = (
+        settings.llm_backend,
+        settings.llm_cache_mode,
+        str(settings.llm_cache_dir),
+        settings.llm_stub_latency_ms,
+        settings.llm_stub_tokens_per_s,
+        api_key,
+    )
+    backend = _backends.get(config)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(config)
+            if backend is None:
+                backend = _build_backend(api_key)
+                _backends[config] = backend
+                log.info("llm_backend", backend=backend.name)
+    return backend
+
+
+def _build_backend(api_key: str | None) -> LLMBackend:
+    inner: LLMBackend
+    if settings.llm_backend == "stub":
+        inner = StubBackend()
+    else:
+        inner = GeminiBackend(api_key)
+    if settings.llm_cache_mode == "off":
+        return inner
+    return RecordReplayBackend(inner, settings.llm_cache_dir, settings.llm_cache_mode)
@@ -0,0 +1,226 @@
+"""Per-stage latency tracing and Prometheus text exposition.
+
+Wrap a stage in ``span("name")`` to record its wall time into the
+``documind_stage_seconds`` histogram. Inside a ``trace()`` block the same
+timings are also collected per request, so they can be returned to the
+caller in debug mode. A span costs two ``perf_counter`` calls and one
+bucket update — a few microseconds against queries that take tens of
+milliseconds.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style)."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip([*map(str, self._bounds), "+Inf"], counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (0.0 with no observations)."""
+        with self._lock:
+            counts = list(self._counts)
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        cumulative = 0
+        for i, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= q * total:
+                return self._bounds[min(i, len(self._bounds) - 1)]
+        return self._bounds[-1]
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        snap = self.snapshot()
+        sep = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}'
+            for le, count in snap["buckets"].items()
+        ]
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {snap['sum']:.6f}")
+        lines.append(f"{name}_count{suffix} {snap['count']}")
+        return lines
+
+
+class LabeledHistogram:
+    """A histogram family with one label, e.g. ``stage``."""
+
+    def __init__(
+        self, name: str, help_text: str, label: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self._help = help_text
+        self._label = label
+        self._buckets = buckets
+        self._children: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        hist = self._children.get(value)
+        if hist is None:
+            with self._lock:
+                hist = self._children.setdefault(value, Histogram(self._buckets))
+        return hist
+
+    def observe(self, value: str, amount: float) -> None:
+        self.labels(value).observe(amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self._help}", f"# TYPE {self.name} histogram"]
+        for value, hist in sorted(self._children.items()):
+            lines.extend(hist.render(self.name, f'{self._label}="{value}"'))
+        return lines
+
+
+class LabeledCounter:
+    """A monotonically increasing counter family with one label."""
+
+    def __init__(self, name: str, help_text: str, label: str) -> None:
+        self.name = name
+        self._help = help_text
+        self._label = label
+        self._values: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[value] = self._values.get(value, 0.0) + amount
+
+    def get(self, value: str) -> float:
+        return self._values.get(value, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self._help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f'{self.name}{{{self._label}="{v}"}} {n:g}' for v, n in items)
+        return lines
+
+
+STAGE_SECONDS = LabeledHistogram(
+    "documind_stage_seconds", "Wall time of query pipeline stages in seconds.", "stage"
+)
+CONTEXT_TOKENS = LabeledHistogram(
+    "documind_context_tokens",
+    "Estimated prompt context tokens per query, before and after packing.",
+    "phase",
+    TOKEN_BUCKETS,
+)
+LLM_SECONDS = LabeledHistogram(
+    "documind_llm_seconds", "Wall time of LLM completions, hedges included, by model.", "model"
+)
+LLM_EVENTS = LabeledCounter(
+    "documind_llm_events_total",
+    "LLM calls and what happened to them: hedged, hedge_won, retried, fallback, timeout.",
+    "event",
+)
+QUEUE_WAIT_SECONDS = LabeledHistogram(
+    "documind_queue_wait_seconds",
+    "Time admitted requests waited for a concurrency slot, by request class.",
+    "class",
+)
+ADMISSION_REJECTED = LabeledCounter(
+    "documind_admission_rejected_total",
+    "Requests shed by admission control (429 queue full, 503 SLO), by request class.",
+    "class",
+)
+
+
+class Trace:
+    """Stage timings collected for a single request."""
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def timings_ms(self) -> dict[str, float]:
+        return {stage: round(s * 1000, 3) for stage, s in self.stages.items()}
+
+
+_current: ContextVar[Trace | None] = ContextVar("documind_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the timings of every span entered in this block."""
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(stage, elapsed)
+        t = _current.get()
+        if t is not None:
+            t.add(stage, elapsed)
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        *STAGE_SECONDS.render(),
+        *CONTEXT_TOKENS.render(),
+        *LLM_SECONDS.render(),
+        *LLM_EVENTS.render(),
+        *QUEUE_WAIT_SECONDS.render(),
+        *ADMISSION_REJECTED.render(),
+    ]
+    return "\n".join(lines) + "\n"
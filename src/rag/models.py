@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+from datetime import datetime
+
 from pydantic import BaseModel, Field
 
+# Tenant / collection names: lowercase, digits, "-" and "_", max 48 chars
+TENANT_PATTERN = r"^[a-z0-9](?:[a-z0-9_-]{0,46}[a-z0-9])?$"
+
 
 class Chunk(BaseModel):
     """A piece of a document with source metadata."""
@@ -13,6 +18,7 @@ class Chunk(BaseModel):
     page: int | None = None
     start_char: int = 0
     end_char: int = 0
+    ingested_at: int = 0  # unix seconds
 
     def citation_label(self) -> str:
         label = self.title or self.source
@@ -26,7 +32,7 @@ class ScoredChunk(BaseModel):
 
     chunk: Chunk
     score: float
-    origin: str = ""  # "bm25", "vector", "rrf", "reranker"
+    origin: str = ""  # "bm25", "vector", "rrf", "combsum", "combmnz", "reranker"
 
 
 class Citation(BaseModel):
@@ -38,9 +44,37 @@ class Citation(BaseModel):
     quote: str = ""
 
 
+class QueryFilters(BaseModel):
+    """Metadata constraints pushed down into both retrieval legs."""
+
+    source_prefix: str | None = None
+    title: str | None = None
+    page_min: int | None = Field(default=None, ge=0)
+    page_max: int | None = Field(default=None, ge=0)
+    file_types: list[str] = []  # e.g. [".pdf", "md"]
+    ingested_after: datetime | None = None
+    ingested_before: datetime | None = None
+
+    def is_empty(self) -> bool:
+        return not any(
+            (
+                self.source_prefix,
+                self.title,
+                self.page_min is not None,
+                self.page_max is not None,
+                self.file_types,
+                self.ingested_after,
+                self.ingested_before,
+            )
+        )
+
+
 class RAGRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=2000)
     top_k: int = Field(default=5, ge=1, le=20)
+    filters: QueryFilters | None = None
+    tenant: str = Field(default="default", pattern=TENANT_PATTERN)
+    deadline_ms: int | None = Field(default=None, ge=1, le=300_000)
 
 
 class RAGResponse(BaseModel):
@@ -48,3 +82,6 @@ class RAGResponse(BaseModel):
     citations: list[Citation]
     chunks_used: list[ScoredChunk]
     query: str
+    timings: dict[str, float] | None = None  # stage -> ms, only when RAG_DEBUG is on
+    context_tokens: dict[str, int] | None = None  # before/after/saved, only when RAG_DEBUG is on
+    degradations: list[str] = []  # steps taken to meet the request deadline, in order
@@ -0,0 +1,199 @@
+"""Context packing: shrink the reranked chunks before they go into the prompt.
+
+Two passes, both keeping one reference per packed block so ``[N]`` citations
+map onto ``build_citation_map`` exactly as before:
+
+1. Merge chunks from the same source section whose character ranges touch or
+   overlap, dropping the overlap that ``chunk_text`` repeats at the start of
+   each chunk. The merged block takes the rank of its best member.
+2. If the result is still over ``RAG_CONTEXT_TOKEN_BUDGET``, keep the
+   sentences that share the most terms with the query (at least one per
+   block) and drop the rest, marking gaps with an ellipsis.
+
+Token counts are estimated at four characters per token, which is close
+enough for budgeting and reporting without a tokenizer dependency.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+
+import structlog
+
+from .analysis import Analyzer, default_analyzer
+from .config import settings
+from .models import Chunk, ScoredChunk
+
+log = structlog.get_logger()
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_MIN_TEXT_OVERLAP = 16  # shorter suffix/prefix matches are treated as coincidence
+_RANGE_SLACK = 2  # chunk offsets drift by the stripped whitespace and joining space
+_GAP = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class PackedContext:
+    chunks: list[ScoredChunk]
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def _text_overlap(left: str, right: str, limit: int) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for n in range(min(len(left), len(right), limit), _MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:n]):
+            return n
+    return 0
+
+
+def _join(left: Chunk, right: Chunk, limit: int) -> str | None:
+    """The two chunks' texts joined without the duplicated overlap, or None if not adjacent."""
+    overlap = _text_overlap(left.text, right.text, limit)
+    if overlap:
+        return left.text + right.text[overlap:]
+    if right.start_char <= left.end_char + _RANGE_SLACK:
+        return f"{left.text}\n{right.text}"
+    return None
+
+
+def merge_adjacent(chunks: list[ScoredChunk]) -> list[ScoredChunk]:
+    """Merge touching or overlapping chunks of the same source section.
+
+    Sections are keyed by (source, title, page) because chunk offsets are
+    relative to the section they were split from.
+    """
+    limit = 2 * settings.chunk_overlap + 1
+    groups: dict[tuple[str, str, int | None], list[tuple[int, ScoredChunk]]] = {}
+    for rank, sc in enumerate(chunks):
+        key = (sc.chunk.source, sc.chunk.title, sc.chunk.page)
+        groups.setdefault(key, []).append((rank, sc))
+
+    merged: list[tuple[int, ScoredChunk]] = []
+    for members in groups.values():
+        members.sort(key=lambda m: m[1].chunk.start_char)
+        best_rank, current = members[0]
+        for rank, sc in members[1:]:
+            text = _join(current.chunk, sc.chunk, limit)
+            if text is None:
+                merged.append((best_rank, current))
+                best_rank, current = rank, sc
+                continue
+            if rank < best_rank:
+                best_rank = rank
+            current = ScoredChunk(
+                chunk=current.chunk.model_copy(
+                    update={
+                        "text": text,
+                        "end_char": max(current.chunk.end_char, sc.chunk.end_char),
+                    }
+                ),
+                score=max(current.score, sc.score),
+                origin=current.origin,
+            )
+        merged.append((best_rank, current))
+
+    merged.sort(key=lambda m: m[0])
+    return [sc for _, sc in merged]
+
+
+def _sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def _relevance(sentence: str, query_terms: set[str], analyze: Analyzer) -> float:
+    terms = analyze(sentence)
+    if not terms:
+        return 0.0
+    hits = len(query_terms.intersection(terms))
+    # Favour dense matches over long sentences that happen to mention a term
+    return hits / math.sqrt(len(terms))
+
+
+def select_sentences(
+    query: str, chunks: list[ScoredChunk], budget: int, analyzer: Analyzer | None = None
+) -> list[ScoredChunk]:
+    """Keep the most query-relevant sentences of each chunk within ``budget`` tokens.
+
+    ``analyzer`` should be the one the serving BM25 index was built with, so
+    sentences match the query the way retrieval did; the ``RAG_BM25_*``
+    settings are used when none is given.
+    """
+    analyze = analyzer or default_analyzer()
+    query_terms = set(analyze(query))
+    split = [_sentences(sc.chunk.text) for sc in chunks]
+    candidates = [
+        (_relevance(sentence, query_terms, analyze), block, i)
+        for block, sentences in enumerate(split)
+        for i, sentence in enumerate(sentences)
+    ]
+    # Higher relevance first; ties go to the better-ranked block, then earlier sentences
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+
+    keep: list[set[int]] = [set() for _ in chunks]
+    used = 0
+    # Every block keeps its best sentence so its [N] reference stays meaningful
+    for _, block, i in candidates:
+        if not keep[block]:
+            keep[block].add(i)
+            used += estimate_tokens(split[block][i])
+    for _, block, i in candidates:
+        if i in keep[block]:
+            continue
+        cost = estimate_tokens(split[block][i])
+        if used + cost > budget:
+            continue
+        keep[block].add(i)
+        used += cost
+
+    packed: list[ScoredChunk] = []
+    for sc, sentences, kept in zip(chunks, split, keep):
+        if len(kept) == len(sentences):
+            packed.append(sc)
+            continue
+        parts: list[str] = []
+        previous = -1
+        for i in sorted(kept):
+            if i != previous + 1:
+                parts.append(_GAP)
+            parts.append(sentences[i])
+            previous = i
+        if previous != len(sentences) - 1:
+            parts.append(_GAP)
+        text = " ".join(parts)
+        packed.append(sc.model_copy(update={"chunk": sc.chunk.model_copy(update={"text": text})}))
+    return packed
+
+
+def pack_context(
+    query: str,
+    chunks: list[ScoredChunk],
+    budget: int | None = None,
+    analyzer: Analyzer | None = None,
+) -> PackedContext:
+    """Merge overlapping chunks, then trim to the token budget (0 = no limit)."""
+    limit = settings.context_token_budget if budget is None else budget
+    before = sum(estimate_tokens(sc.chunk.text) for sc in chunks)
+    packed = merge_adjacent(chunks)
+    if limit > 0 and sum(estimate_tokens(sc.chunk.text) for sc in packed) > limit:
+        packed = select_sentences(query, packed, limit, analyzer)
+    after = sum(estimate_tokens(sc.chunk.text) for sc in packed)
+    log.debug(
+        "context_packed",
+        chunks_in=len(chunks),
+        chunks_out=len(packed),
+        tokens_before=before,
+        tokens_after=after,
+        tokens_saved=before - after,
+    )
+    return PackedContext(chunks=packed, tokens_before=before, tokens_after=after)
@@ -1,85 +1,525 @@
 from __future__ import annotations
 
+import threading
 from pathlib import Path
+from typing import Any
 
 import structlog
 
-from .bm25_index import BM25Index
+from . import embeddings, reranker
+from .chunk_store import ChunkStore, chunk_store_path
+from .citations import build_citation_map
 from .config import settings
+from .deadline import (
+    NO_ANSWER,
+    REDUCED_DEPTH,
+    SHORTENED_CONTEXT,
+    SKIPPED_RERANK,
+    Deadline,
+    DeadlineExceededError,
+)
+from .generations import GenerationHolder, IndexGeneration
 from .generator import generate
-from .hybrid_retriever import HybridRetriever
-from .ingest import ingest_directory
-from .models import Chunk, RAGResponse
-from .reranker import rerank
-from .vector_store import VectorStore
+from .ingest import IngestProgress, file_sha256, ingest_directory, ingest_file, source_of
+from .metrics import CONTEXT_TOKENS, span, trace
+from .models import Chunk, QueryFilters, RAGResponse, ScoredChunk
+from .packing import PackedContext, pack_context
+from .reranker import rerank, rerank_many
+from .resilience import LLMDeadlineExceededError
+from .segments import SegmentedBM25Index, TieredMergePolicy
+from .sharding import export_sharded
+from .shared_index import export_generation, open_shared
+from .vector_store import DEFAULT_COLLECTION, VectorGeneration, VectorStore
 
 log = structlog.get_logger()
 
 
 class RAGPipeline:
-    """End-to-end pipeline: ingest → retrieve → rerank → generate."""
+    """End-to-end pipeline: ingest → retrieve → rerank → generate.
 
-    def __init__(self) -> None:
-        self._bm25 = BM25Index()
-        self._vector = VectorStore()
-        self._retriever = HybridRetriever(self._bm25, self._vector)
-        self._ready = False
+    Indexes are served as immutable generations. Indexing builds a new BM25
+    index and vector generation off to the side and publishes them with one
+    reference swap, so queries never see a half-built index. Both are
+    incremental: the BM25 index adds a segment and tombstones, merged in the
+    background, and the one vector collection gains the new rows and marks
+    the replaced ones deleted as of the new generation.
+    """
+
+    def __init__(
+        self,
+        docs_dir: Path | None = None,
+        bm25_path: Path | None = None,
+        collection_name: str | None = None,
+        chroma_dir: Path | None = None,
+    ) -> None:
+        self._docs_dir = docs_dir or settings.docs_dir
+        self._bm25_path = bm25_path or settings.bm25_path
+        # Single copy of chunk text and metadata; the indexes refer to it by row id
+        self._chunk_store = ChunkStore(chunk_store_path(self._bm25_path))
+        self._vectors = VectorStore(
+            persist_dir=str(chroma_dir) if chroma_dir is not None else None,
+            collection_name=collection_name or DEFAULT_COLLECTION,
+        )
+        self._generations = GenerationHolder()
+        self._write_lock = threading.Lock()  # serializes index builds, never taken by readers
+        self._read_only = False  # set when serving a shared (memory-mapped) export
+        self._merge_state = threading.Lock()
+        self._merging = False  # a background merge thread is running
+        self._merge_pending = False  # another update arrived while it ran
+        # SHA-256 of each indexed file, by source; replaced, never mutated
+        self._content_hashes: dict[str, str] = {}
+        # SHA-256 of uploads accepted but not indexed yet, by source
+        self._pending_hashes: dict[str, str] = {}
+        self._pending_lock = threading.Lock()
 
     @property
     def is_ready(self) -> bool:
-        return self._ready
+        return self._generations.current is not None
+
+    @property
+    def generation(self) -> int:
+        gen = self._generations.current
+        return gen.number if gen is not None else 0
 
     @property
     def chunk_count(self) -> int:
-        return self._vector.count
+        gen = self._generations.current
+        return gen.vector.count if gen is not None else 0
+
+    @property
+    def read_only(self) -> bool:
+        return self._read_only
+
+    @property
+    def docs_dir(self) -> Path:
+        return self._docs_dir
+
+    @property
+    def has_saved_index(self) -> bool:
+        return self._bm25_path.exists()
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate in-process memory held by this pipeline's sparse and dense indexes."""
+        gen = self._generations.current
+        return gen.bm25.memory_bytes + gen.vector.memory_bytes if gen is not None else 0
+
+    def close(self) -> None:
+        """Release Chroma's in-memory index; the pipeline reopens it on next use."""
+        self._vectors.close()
+
+    def _check_writable(self) -> None:
+        if self._read_only:
+            raise RuntimeError("Pipeline serves a read-only shared index; re-export to update it")
+
+    def _index_meta(self, number: int, hashes: dict[str, str]) -> dict[str, Any]:
+        return {"generation": number, "content_hashes": hashes}
+
+    def _publish(
+        self,
+        bm25: SegmentedBM25Index,
+        vector: VectorGeneration,
+        number: int,
+        hashes: dict[str, str] | None = None,
+    ) -> None:
+        hashes = self._content_hashes if hashes is None else hashes
+        bm25.save(self._bm25_path, meta=self._index_meta(number, hashes))
+        self._generations.publish(IndexGeneration(number, bm25, vector))
+        self._content_hashes = hashes
+
+    def _source_of(self, path: Path) -> str:
+        return source_of(path, self._docs_dir)
+
+    def _path_of(self, source: str) -> Path:
+        # Inverse of _source_of: sources inside docs_dir are stored relative to it
+        path = self._docs_dir / source
+        return path if path.is_file() else Path(source)
+
+    def duplicate_of(self, path: Path, digest: str) -> str | None:
+        """An indexed source with content ``digest`` that makes indexing ``path`` redundant.
+
+        That is ``path`` itself when it was indexed with the same bytes, or
+        another source with those bytes when ``path`` is not indexed yet.
+        """
+        hashes = {**self._content_hashes, **self._pending_hashes}
+        source = self._source_of(path)
+        if source in hashes:
+            return source if hashes[source] == digest else None
+        return next((s for s, d in hashes.items() if d == digest), None)
+
+    def reserve_content(self, path: Path, digest: str) -> str | None:
+        """Claim ``path`` with content ``digest`` for indexing, unless that is redundant.
+
+        Returns what ``duplicate_of`` returns. Otherwise the digest counts as
+        indexed until ``ingest_files`` has run for ``path``, so two concurrent
+        uploads of the same bytes cannot both be accepted.
+        """
+        with self._pending_lock:
+            duplicate = self.duplicate_of(path, digest)
+            if duplicate is None:
+                self._pending_hashes = {**self._pending_hashes, self._source_of(path): digest}
+            return duplicate
+
+    def _release_content(self, sources: list[str]) -> None:
+        with self._pending_lock:
+            gone = set(sources)
+            self._pending_hashes = {s: d for s, d in self._pending_hashes.items() if s not in gone}
+
+    def _current_vector(self) -> VectorGeneration | None:
+        current = self._generations.current
+        if current is not None and isinstance(current.vector, VectorGeneration):
+            return current.vector
+        return None
+
+    def _current_sparse(self) -> SegmentedBM25Index:
+        current = self._generations.current
+        if current is not None and isinstance(current.bm25, SegmentedBM25Index):
+            return current.bm25
+        return SegmentedBM25Index(store=self._chunk_store)
 
     def ingest(
         self,
         docs_dir: Path | None = None,
         extensions: set[str] | None = None,
+        progress: IngestProgress | None = None,
     ) -> int:
         """Ingest documents from disk and build both indexes."""
-        directory = docs_dir or settings.docs_dir
-        chunks = ingest_directory(directory, extensions=extensions)
-        return self.index_chunks(chunks)
+        directory = docs_dir or self._docs_dir
+        chunks = ingest_directory(
+            directory, extensions=extensions, progress=progress, root=self._docs_dir
+        )
+        hashes = {s: file_sha256(self._path_of(s)) for s in dict.fromkeys(c.source for c in chunks)}
+        return self.index_chunks(chunks, progress=progress, hashes=hashes)
+
+    def index_chunks(
+        self,
+        chunks: list[Chunk],
+        progress: IngestProgress | None = None,
+        hashes: dict[str, str] | None = None,
+    ) -> int:
+        """Build a fresh generation from pre-loaded chunks and publish it.
 
-    def index_chunks(self, chunks: list[Chunk]) -> int:
-        """Build indexes from pre-loaded chunks."""
+        ``hashes`` maps source files to their SHA-256 for duplicate detection.
+        """
         if not chunks:
             log.warning("no_chunks_to_index")
             return 0
 
-        self._bm25.build(chunks)
-        self._bm25.save()
-        self._vector.add_chunks(chunks)
-        self._ready = True
+        with self._write_lock:
+            self._check_writable()
+            number = self.generation + 1
+            bm25 = SegmentedBM25Index(store=self._chunk_store)
+            bm25.build(chunks)
+            vector = self._vectors.stage(number, base=self._current_vector())
+            vector.delete_sources()
+            vector.add_chunks(chunks, on_batch=progress.chunks_embedded if progress else None)
+            self._publish(bm25, vector, number, hashes=hashes or {})
 
-        log.info("pipeline_indexed", total_chunks=len(chunks))
+        log.info("pipeline_indexed", total_chunks=len(chunks), generation=number)
         return len(chunks)
 
+    def ingest_files(self, paths: list[Path], progress: IngestProgress | None = None) -> int:
+        """Incrementally index files, replacing chunks previously indexed from them.
+
+        Only the new files are embedded, and only their rows and the replaced
+        files' rows are written to the vector collection. The BM25 index
+        shares the current one's segments: the new chunks go into one new
+        segment and the replaced files' chunks are tombstoned.
+        """
+        replaced = sorted({self._source_of(p) for p in paths})
+        try:
+            return self._ingest_files(paths, replaced, progress)
+        finally:
+            self._release_content(replaced)
+
+    def _ingest_files(
+        self, paths: list[Path], replaced: list[str], progress: IngestProgress | None
+    ) -> int:
+        new_chunks: list[Chunk] = []
+        new_hashes: dict[str, str] = {}
+        for path in paths:
+            try:
+                chunks = ingest_file(path, self._docs_dir)
+                new_hashes[self._source_of(path)] = file_sha256(path)
+            except Exception:
+                log.exception("ingest_error", path=str(path))
+                continue
+            new_chunks.extend(chunks)
+            if progress is not None:
+                progress.file_done(path, len(chunks))
+
+        with self._write_lock:
+            self._check_writable()
+            bm25 = self._current_sparse().updated(add=new_chunks, delete_sources=replaced)
+            if bm25.num_docs == 0:
+                log.warning("no_chunks_to_index")
+                return 0
+
+            number = self.generation + 1
+            vector = self._vectors.stage(number, base=self._current_vector())
+            vector.delete_sources(replaced)
+            vector.add_chunks(new_chunks, on_batch=progress.chunks_embedded if progress else None)
+            gone = set(replaced)
+            hashes = {s: d for s, d in self._content_hashes.items() if s not in gone}
+            self._publish(bm25, vector, number, hashes={**hashes, **new_hashes})
+
+        log.info(
+            "pipeline_incremental_indexed",
+            files=len(paths),
+            new_chunks=len(new_chunks),
+            generation=number,
+        )
+        self._schedule_merge()
+        return len(new_chunks)
+
+    def delete_sources(self, sources: list[str]) -> int:
+        """Remove every chunk indexed from ``sources``; returns how many were removed.
+
+        Sources are relative to ``docs_dir``; a path to the file, absolute or
+        relative to the working directory, matches it too.
+        """
+        sources = sorted({*sources, *(self._source_of(Path(s)) for s in sources)})
+        with self._write_lock:
+            self._check_writable()
+            if self._generations.current is None:
+                return 0
+            before = self._current_sparse()
+            bm25 = before.updated(delete_sources=sources)
+            removed = before.num_docs - bm25.num_docs
+            if removed == 0:
+                return 0
+
+            number = self.generation + 1
+            vector = self._vectors.stage(number, base=self._current_vector())
+            vector.delete_sources(sources)
+            gone = set(sources)
+            hashes = {s: d for s, d in self._content_hashes.items() if s not in gone}
+            self._publish(bm25, vector, number, hashes=hashes)
+
+        log.info(
+            "pipeline_sources_deleted", sources=len(sources), chunks=removed, generation=number
+        )
+        self._schedule_merge()
+        return removed
+
+    def merge_segments(self, policy: TieredMergePolicy | None = None) -> int:
+        """Run the segment merges ``policy`` asks for; returns how many ran.
+
+        Merging happens outside the write lock. Installing the result takes it
+        briefly, so updates that land meanwhile are kept: their tombstones are
+        carried over, and a merge whose inputs disappeared is planned again.
+        The merged index is published as a successor of the current generation
+        that keeps its number and vector generation; queries pinned to the
+        current one finish on the segments they started with.
+        """
+        policy = policy or TieredMergePolicy.from_settings()
+        merges = 0
+        while True:
+            gen = self._generations.current
+            if gen is None or not isinstance(gen.bm25, SegmentedBM25Index):
+                return merges
+            plan = gen.bm25.plan_merge(policy)
+            if plan is None:
+                return merges
+            merged = plan.run()
+            with self._write_lock:
+                current = self._generations.current
+                if current is None or not isinstance(current.bm25, SegmentedBM25Index):
+                    return merges
+                bm25 = current.bm25.with_merge(plan, merged)
+                if bm25 is None:
+                    continue
+                meta = self._index_meta(current.number, self._content_hashes)
+                bm25.save(self._bm25_path, meta=meta)
+                self._generations.publish(IndexGeneration(current.number, bm25, current.vector))
+            merges += 1
+
+    def _schedule_merge(self) -> None:
+        if not settings.bm25_background_merge:
+            self.merge_segments()
+            return
+        with self._merge_state:
+            if self._merging:
+                self._merge_pending = True
+                return
+            self._merging = True
+        threading.Thread(target=self._merge_worker, name="bm25-merge", daemon=True).start()
+
+    def _merge_worker(self) -> None:
+        while True:
+            try:
+                self.merge_segments()
+            except Exception:
+                log.exception("bm25_merge_failed")
+            with self._merge_state:
+                if not self._merge_pending:
+                    self._merging = False
+                    return
+                self._merge_pending = False
+
     def load_indexes(self) -> None:
-        """Load pre-built indexes from disk."""
-        self._bm25.load()
-        self._ready = True
-        log.info("pipeline_loaded", vector_count=self._vector.count)
-
-    def query(self, question: str, top_k: int = 5) -> RAGResponse:
-        """Run the full RAG pipeline on a question."""
-        if not self._ready:
+        """Load pre-built indexes from disk and publish them as the current generation."""
+        with self._write_lock:
+            bm25 = SegmentedBM25Index(store=self._chunk_store)
+            meta = bm25.load(self._bm25_path)
+            number = int(meta.get("generation", 0))
+            # An index saved without a generation predates per-row generation tracking
+            vector = self._vectors.load_generation(number, adopt_untracked="generation" not in meta)
+            self._generations.publish(IndexGeneration(number, bm25, vector))
+            self._content_hashes = dict(meta.get("content_hashes", {}))
+        log.info("pipeline_loaded", generation=number, vector_count=vector.count)
+
+    def export_shared(self, directory: Path, shards: int | None = None) -> dict[str, Any]:
+        """Export the current generation in the memory-mappable layout for workers.
+
+        With more than one shard (``RAG_SHARD_COUNT`` by default) the corpus is
+        partitioned for scatter-gather serving by shard processes.
+        """
+        gen = self._generations.current
+        if gen is None:
             raise RuntimeError("Pipeline not ready. Call ingest() or load_indexes() first.")
+        num_shards = settings.shard_count if shards is None else shards
+        if num_shards > 1:
+            return export_sharded(gen, directory, num_shards)
+        return export_generation(gen, directory)
+
+    def load_shared(self, directory: Path) -> None:
+        """Serve a read-only exported generation straight from memory-mapped files."""
+        with self._write_lock:
+            gen = open_shared(directory)
+            self._generations.publish(gen)
+            self._read_only = True
+        log.info("pipeline_loaded_shared", generation=gen.number, dir=str(directory))
+
+    def warm_up(self) -> None:
+        """Load both models and run a dummy forward pass through each."""
+        embeddings.warm_up()
+        reranker.warm_up()
+        log.info("models_warmed")
+
+    def retrieve_many(
+        self,
+        questions: list[str],
+        top_k: int | None = None,
+        use_reranker: bool = True,
+    ) -> list[list[ScoredChunk]]:
+        """Retrieve (and rerank) context for many questions without generating.
+
+        Query embeddings are computed in one batch and all rerank pairs go
+        through the cross-encoder together, so this is much faster per
+        question than calling ``query`` in a loop.
+        """
+        if not questions:
+            return []
+        with span("embed_queries"):
+            query_embeddings = embeddings.embed_texts(questions)
+        with self._generations.reader() as gen:
+            if gen is None:
+                raise RuntimeError("Pipeline not ready. Call ingest() or load_indexes() first.")
+            with span("retrieve"):
+                candidates = [
+                    gen.retriever.retrieve(q, query_embedding=emb)
+                    for q, emb in zip(questions, query_embeddings)
+                ]
+        if not use_reranker:
+            return candidates
+        with span("rerank"):
+            return rerank_many(questions, candidates, top_k=top_k)
+
+    def query(
+        self,
+        question: str,
+        top_k: int = 5,
+        filters: QueryFilters | None = None,
+        deadline: Deadline | None = None,
+    ) -> RAGResponse:
+        """Run the full RAG pipeline on a question.
+
+        With a ``deadline``, stages degrade in the order documented in
+        ``deadline.py`` when the remaining budget is shorter than they
+        usually take; the applied steps are listed in the response.
+        """
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceededError("Request deadline expired before the query started")
+
+        def short_of(*stages: str) -> bool:
+            return deadline is not None and deadline.short_of(*stages)
+
+        with trace() as timings, span("query"):
+            with self._generations.reader() as gen:
+                if gen is None:
+                    raise RuntimeError("Pipeline not ready. Call ingest() or load_indexes() first.")
+
+                # Step 1: Hybrid retrieval (BM25 + vector → RRF fusion)
+                depth: int | None = None
+                if short_of("retrieve", "rerank", "generate"):
+                    assert deadline is not None
+                    deadline.degrade(REDUCED_DEPTH)
+                    depth = settings.adaptive_min_k
+                with span("retrieve"):
+                    candidates = gen.retriever.retrieve(
+                        question,
+                        bm25_top_k=depth,
+                        vector_top_k=depth,
+                        final_top_k=2 * depth if depth else None,
+                        filters=filters,
+                    )
 
-        # Step 1: Hybrid retrieval (BM25 + vector → RRF fusion)
-        candidates = self._retriever.retrieve(question)
+            # Step 2: Cross-encoder reranking, or fused order when out of time
+            if short_of("rerank", "generate"):
+                assert deadline is not None
+                deadline.degrade(SKIPPED_RERANK)
+                reranked = candidates[:top_k]
+            else:
+                with span("rerank"):
+                    reranked = rerank(question, candidates, top_k=top_k)
+            if short_of("generate"):
+                assert deadline is not None
+                deadline.degrade(SHORTENED_CONTEXT)
+                reranked = reranked[: max(1, len(reranked) // 2)]
 
-        # Step 2: Cross-encoder reranking
-        reranked = rerank(question, candidates, top_k=top_k)
+            # Step 3: Merge overlapping chunks and trim the context to the token budget
+            packed: PackedContext | None = None
+            context = reranked
+            if settings.context_packing:
+                with span("pack"):
+                    packed = pack_context(question, reranked, analyzer=gen.bm25.analyzer)
+                context = packed.chunks
+                CONTEXT_TOKENS.observe("before", packed.tokens_before)
+                CONTEXT_TOKENS.observe("after", packed.tokens_after)
 
-        # Step 3: Generate answer with citation enforcement
-        answer, citations = generate(question, reranked)
+            # Step 4: Generate answer with citation enforcement
+            try:
+                answer, citations = generate(
+                    question, context, deadline=deadline.expires_at if deadline else None
+                )
+            except LLMDeadlineExceededError:
+                if deadline is None:
+                    raise
+                deadline.degrade(NO_ANSWER)
+                log.warning("generation_deadline_exceeded", query=question[:80])
+                answer = (
+                    "No answer could be generated within the request's time budget. "
+                    "The most relevant sources are listed below."
+                )
+                citations = list(build_citation_map(context).values())
 
+        stage_ms = timings.timings_ms()
+        log.debug("query_timings", **stage_ms)
         return RAGResponse(
             answer=answer,
             citations=citations,
-            chunks_used=reranked,
+            chunks_used=context,
             query=question,
+            timings=stage_ms if settings.debug else None,
+            degradations=list(deadline.degradations) if deadline else [],
+            context_tokens=(
+                {
+                    "before": packed.tokens_before,
+                    "after": packed.tokens_after,
+                    "saved": packed.tokens_saved,
+                }
+                if settings.debug and packed is not None
+                else None
+            ),
         )
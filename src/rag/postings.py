@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .analysis import Vocabulary
+
+if TYPE_CHECKING:
+    from .codec import CompressedPostings
+
+# BM25L parameters, matching rank_bm25.BM25L defaults
+K1 = 1.5
+B = 0.75
+DELTA = 0.5
+
+
+@dataclass
+class Postings:
+    """Inverted index in CSR form: term id -> (doc ids, term frequencies).
+
+    Postings for term ``t`` live in ``doc_ids[indptr[t]:indptr[t + 1]]`` (ascending)
+    with matching ``tfs``. All arrays can be memory-mapped read-only.
+    """
+
+    vocab: dict[str, int]
+    indptr: np.ndarray  # int64, len(vocab) + 1
+    doc_ids: np.ndarray  # int32
+    tfs: np.ndarray  # int32
+    doc_len: np.ndarray  # int32, one per document
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def avgdl(self) -> float:
+        return float(self.doc_len.mean()) if self.num_docs else 0.0
+
+    @property
+    def df(self) -> np.ndarray:
+        """Document frequency of every term id."""
+        return np.diff(self.indptr)
+
+    @classmethod
+    def from_corpus(cls, corpus: list[list[str]]) -> Postings:
+        vocab = Vocabulary()
+        return cls.from_ids([vocab.intern(tokens) for tokens in corpus], vocab.terms)
+
+    @classmethod
+    def from_ids(cls, corpus: Sequence[np.ndarray], terms: Sequence[str]) -> Postings:
+        """Postings of documents given as arrays of term ids into ``terms``.
+
+        Terms that occur in none of the documents are left out, so a subset of
+        a corpus gets a vocabulary of its own.
+        """
+        lengths = np.fromiter((len(d) for d in corpus), np.int64, len(corpus))
+        flat = np.concatenate(corpus).astype(np.int64) if len(corpus) else np.zeros(0, np.int64)
+        used, local = np.unique(flat, return_inverse=True)
+        docs = np.repeat(np.arange(len(corpus), dtype=np.int64), lengths)
+        # One sort groups the tokens by (term, doc); run lengths are the tfs
+        keys, tfs = np.unique(local * max(1, len(corpus)) + docs, return_counts=True)
+        tids, doc_ids = np.divmod(keys, max(1, len(corpus)))
+        indptr = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tids, minlength=len(used)), out=indptr[1:])
+        return cls(
+            vocab={terms[int(t)]: i for i, t in enumerate(used)},
+            indptr=indptr,
+            doc_ids=doc_ids.astype(np.int32),
+            tfs=tfs.astype(np.int32),
+            doc_len=lengths.astype(np.int32),
+        )
+
+    def term_postings(
+        self, tid: int, candidates: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Doc ids and tfs of term ``tid``; ``candidates`` is accepted for parity."""
+        start, end = int(self.indptr[tid]), int(self.indptr[tid + 1])
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    @property
+    def terms(self) -> list[str]:
+        """Terms in id order."""
+        return sorted(self.vocab, key=self.vocab.__getitem__)
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "vocab.json").write_text(json.dumps(self.terms), encoding="utf-8")
+        np.save(directory / "indptr.npy", self.indptr)
+        np.save(directory / "doc_ids.npy", self.doc_ids)
+        np.save(directory / "tfs.npy", self.tfs)
+        np.save(directory / "doc_len.npy", self.doc_len)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> Postings:
+        mode = "r" if mmap else None
+        terms = json.loads((directory / "vocab.json").read_text(encoding="utf-8"))
+        return cls(
+            vocab={t: i for i, t in enumerate(terms)},
+            indptr=np.load(directory / "indptr.npy", mmap_mode=mode),
+            doc_ids=np.load(directory / "doc_ids.npy", mmap_mode=mode),
+            tfs=np.load(directory / "tfs.npy", mmap_mode=mode),
+            doc_len=np.load(directory / "doc_len.npy", mmap_mode=mode),
+        )
+
+
+def merge_postings(parts: Sequence[tuple[Postings, np.ndarray]]) -> Postings:
+    """Concatenate the documents ``keep`` (ascending local ids) of each part.
+
+    The kept documents are renumbered consecutively in part order; terms that
+    no kept document contains are dropped from the vocabulary.
+    """
+    vocab: dict[str, int] = {}
+    tids, docs, tfs, lengths = [], [], [], []
+    offset = 0
+    for postings, keep in parts:
+        remap = np.full(postings.num_docs, -1, dtype=np.int64)
+        remap[keep] = np.arange(offset, offset + len(keep))
+        local_terms = postings.terms
+        global_ids = np.fromiter(
+            (vocab.setdefault(t, len(vocab)) for t in local_terms), np.int64, len(local_terms)
+        )
+        new_docs = remap[postings.doc_ids]
+        live = new_docs >= 0
+        tids.append(np.repeat(global_ids, np.diff(postings.indptr))[live])
+        docs.append(new_docs[live])
+        tfs.append(np.asarray(postings.tfs)[live])
+        lengths.append(np.asarray(postings.doc_len)[keep])
+        offset += len(keep)
+
+    tid = np.concatenate(tids) if tids else np.zeros(0, np.int64)
+    doc = np.concatenate(docs) if docs else np.zeros(0, np.int64)
+    counts = np.bincount(tid, minlength=len(vocab))
+    # Compact away terms whose documents were all dropped
+    used = counts > 0
+    new_tid = np.cumsum(used) - 1
+    order = np.lexsort((doc, new_tid[tid]))
+    indptr = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+    np.cumsum(counts[used], out=indptr[1:])
+    terms = list(vocab)
+    return Postings(
+        vocab={terms[int(t)]: i for i, t in enumerate(np.flatnonzero(used))},
+        indptr=indptr,
+        doc_ids=doc[order].astype(np.int32),
+        tfs=(np.concatenate(tfs) if tfs else np.zeros(0, np.int32))[order].astype(np.int32),
+        doc_len=(np.concatenate(lengths) if lengths else np.zeros(0, np.int32)).astype(np.int32),
+    )
+
+
+@dataclass
+class CorpusStats:
+    """Corpus-wide statistics for scoring one shard as if it were the whole index.
+
+    ``df`` is aligned with the shard's own vocabulary: ``df[tid]`` counts the
+    documents of the whole corpus that contain the shard's term ``tid``.
+    """
+
+    num_docs: int
+    avgdl: float
+    df: np.ndarray  # int64
+
+
+def bm25l_scores(
+    postings: Postings | CompressedPostings, terms: list[str], stats: CorpusStats | None = None
+) -> np.ndarray:
+    """BM25L score of every document for the query terms.
+
+    Work is proportional to the postings of the query terms, not the corpus.
+    Repeated query terms count once per occurrence, as in rank_bm25. With
+    ``stats``, IDF and length normalization use the whole corpus, so a
+    shard's scores equal those of the unsharded index.
+    """
+    scores = np.zeros(postings.num_docs, dtype=np.float64)
+    if postings.num_docs == 0:
+        return scores
+    n = stats.num_docs if stats is not None else postings.num_docs
+    avgdl = stats.avgdl if stats is not None else postings.avgdl
+    log_n = np.log(n + 1)
+    for term in terms:
+        tid = postings.vocab.get(term)
+        if tid is None:
+            continue
+        docs, tf = postings.term_postings(tid)
+        df = int(stats.df[tid]) if stats is not None else len(docs)
+        idf = log_n - np.log(df + 0.5)
+        scores[docs] += bm25l_term_scores(tf, postings.doc_len[docs], idf, avgdl)
+    return scores
+
+
+def bm25l_term_scores(tf: np.ndarray, doc_len: np.ndarray, idf: float, avgdl: float) -> np.ndarray:
+    """BM25L contribution of one query term to the documents containing it."""
+    tf = tf.astype(np.float64)
+    ctd = tf / (1 - B + B * doc_len / avgdl)
+    return idf * tf * (K1 + 1) * (ctd + DELTA) / (K1 + ctd + DELTA)
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+import numpy as np
 import structlog
-from sentence_transformers import CrossEncoder
 
 from .config import settings
+from .inference import get_client
 from .models import ScoredChunk
 
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
 log = structlog.get_logger()
 
 _model: CrossEncoder | None = None
@@ -14,10 +21,35 @@ _model: CrossEncoder | None = None
 def _get_model() -> CrossEncoder:
     global _model
     if _model is None:
+        from sentence_transformers import CrossEncoder
+
         _model = CrossEncoder(settings.reranker_model)
     return _model
 
 
+def preload() -> None:
+    """Load the weights without running inference (see ``embeddings.preload``)."""
+    _get_model()
+
+
+def warm_up() -> None:
+    """Load the model and run one dummy prediction so the first query is fast."""
+    score_pairs([("warm up", "warm up")])
+
+
+def score_pairs_local(pairs: Sequence[Sequence[str]]) -> np.ndarray:
+    """Cross-encoder scores from the in-process model."""
+    return np.asarray(_get_model().predict([list(p) for p in pairs]), dtype=np.float32)
+
+
+def score_pairs(pairs: Sequence[Sequence[str]]) -> np.ndarray:
+    """Cross-encoder scores, via the inference server when one is configured."""
+    client = get_client()
+    if client is not None:
+        return client.score(pairs)
+    return score_pairs_local(pairs)
+
+
 def rerank(
     query: str,
     candidates: list[ScoredChunk],
@@ -28,10 +60,9 @@ def rerank(
         return []
 
     k = top_k or settings.rerank_top_k
-    model = _get_model()
 
-    pairs = [[query, sc.chunk.text] for sc in candidates]
-    scores = model.predict(pairs)
+    pairs = [(query, sc.chunk.text) for sc in candidates]
+    scores = score_pairs(pairs)
 
     reranked: list[ScoredChunk] = []
     for sc, score in zip(candidates, scores):
@@ -47,3 +78,28 @@ def rerank(
 
     log.debug("reranked", input_count=len(candidates), output_count=min(k, len(reranked)))
     return reranked[:k]
+
+
+def rerank_many(
+    queries: list[str],
+    candidate_lists: list[list[ScoredChunk]],
+    top_k: int | None = None,
+) -> list[list[ScoredChunk]]:
+    """Rerank several queries with one cross-encoder call over all their pairs."""
+    k = top_k or settings.rerank_top_k
+    pairs = [(q, sc.chunk.text) for q, cands in zip(queries, candidate_lists) for sc in cands]
+    if not pairs:
+        return [[] for _ in queries]
+    scores = score_pairs(pairs)
+
+    results: list[list[ScoredChunk]] = []
+    offset = 0
+    for cands in candidate_lists:
+        reranked = [
+            ScoredChunk(chunk=sc.chunk, score=float(score), origin="reranker")
+            for sc, score in zip(cands, scores[offset : offset + len(cands)])
+        ]
+        offset += len(cands)
+        reranked.sort(key=lambda x: x.score, reverse=True)
+        results.append(reranked[:k])
+    return results
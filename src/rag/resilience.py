@@ -0,0 +1,246 @@
+"""Deadline-bounded, hedged LLM completions with retries and a fallback model.
+
+``complete_resilient`` runs attempts on a shared thread pool:
+
+- If the first attempt has not answered after the model's recent p95
+  latency (``RAG_LLM_HEDGE_QUANTILE``; ``RAG_LLM_HEDGE_AFTER_MS`` until
+  enough calls have been seen), one duplicate is fired and whichever
+  answers first wins.
+- Rate limits and transient server errors are retried with jittered
+  exponential backoff, up to ``RAG_LLM_MAX_RETRIES`` times.
+- When the primary model keeps failing with retryable errors or misses
+  ``RAG_LLM_TIMEOUT_S``, the request is re-issued against
+  ``RAG_LLM_FALLBACK_MODEL`` with its own ``RAG_LLM_FALLBACK_TIMEOUT_S``.
+  Other errors (bad requests, auth, validation) are raised as they are.
+
+Losing attempts cannot be cancelled mid-request; they finish in the
+background, bounded by the HTTP timeout of the backend.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import replace
+
+import structlog
+
+from .admission import admission_capacity
+from .config import settings
+from .llm import LLMBackend, LLMRequest, is_retryable
+from .metrics import LLM_EVENTS, LLM_SECONDS
+
+log = structlog.get_logger()
+
+_MIN_SAMPLES = 20  # latencies needed before the quantile replaces the configured delay
+_RETRY_BASE_DELAY_S = 0.2
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    """Shared pool, sized for every admitted request to have an attempt and a hedge."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = admission_capacity() * (2 if settings.llm_hedge else 1)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+    return _executor
+
+
+class LLMDeadlineExceededError(TimeoutError):
+    """No attempt answered before the deadline."""
+
+
+class LatencyWindow:
+    """The most recent successful completion latencies of one model."""
+
+    def __init__(self, size: int = 512) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_windows: dict[str, LatencyWindow] = {}
+_windows_lock = threading.Lock()
+
+
+def latency_window(model: str) -> LatencyWindow:
+    window = _windows.get(model)
+    if window is None:
+        with _windows_lock:
+            window = _windows.setdefault(model, LatencyWindow())
+    return window
+
+
+def hedge_delay(model: str) -> float | None:
+    """Seconds to wait before hedging a call to ``model``; None disables hedging."""
+    if not settings.llm_hedge:
+        return None
+    window = latency_window(model)
+    if len(window) >= _MIN_SAMPLES:
+        return window.quantile(settings.llm_hedge_quantile)
+    return settings.llm_hedge_after_ms / 1000
+
+
+def _run_phase(
+    backend: LLMBackend,
+    request: LLMRequest,
+    phase_deadline: float,
+    hedge_after: float | None,
+    max_retries: int,
+    retry_delay_s: float,
+) -> str:
+    """Attempts against one model until one succeeds or the phase deadline passes."""
+    start = time.monotonic()
+    pending: set[Future[str]] = set()
+    hedges: set[Future[str]] = set()
+    retries = 0
+    retry_at: float | None = None
+    hedged = hedge_after is None
+    last_error: Exception | None = None
+
+    def launch() -> Future[str]:
+        future = _pool().submit(backend.complete, request)
+        pending.add(future)
+        return future
+
+    launch()
+    while True:
+        now = time.monotonic()
+        if now >= phase_deadline:
+            LLM_EVENTS.inc("timeout")
+            raise LLMDeadlineExceededError(
+                f"{request.model} gave no answer within {phase_deadline - start:.2f}s"
+            ) from last_error
+
+        wake = phase_deadline
+        if not hedged and hedge_after is not None:
+            wake = min(wake, start + hedge_after)
+        if retry_at is not None:
+            wake = min(wake, retry_at)
+        if pending:
+            done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+        else:
+            time.sleep(max(0.0, wake - now))
+            done = set()
+
+        for future in done:
+            pending.discard(future)
+            try:
+                text = future.result()
+            except Exception as exc:
+                last_error = exc
+                if is_retryable(exc) and retries < max_retries:
+                    retries += 1
+                    delay = retry_delay_s * 2 ** (retries - 1) * random.uniform(0.5, 1.5)
+                    retry_at = time.monotonic() + delay
+                    LLM_EVENTS.inc("retried")
+                    log.warning("llm_retry", model=request.model, attempt=retries, error=str(exc))
+                continue
+            latency_window(request.model).add(time.monotonic() - start)
+            if future in hedges:
+                LLM_EVENTS.inc("hedge_won")
+            return text
+
+        now = time.monotonic()
+        if retry_at is not None and now >= retry_at:
+            retry_at = None
+            launch()
+        if not hedged and hedge_after is not None and now >= start + hedge_after and pending:
+            hedged = True
+            hedges.add(launch())
+            LLM_EVENTS.inc("hedged")
+        if not pending and retry_at is None:
+            assert last_error is not None
+            raise last_error
+
+
+def complete_resilient(
+    backend: LLMBackend,
+    request: LLMRequest,
+    deadline: float | None = None,
+    max_retries: int | None = None,
+    retry_delay_s: float | None = None,
+    hedge: bool = True,
+    fallback: bool = True,
+) -> str:
+    """Complete ``request`` with hedging, retries and fallback.
+
+    ``deadline`` is an optional absolute ``time.monotonic()`` bound on the
+    whole call, fallback included. ``max_retries`` (default
+    ``RAG_LLM_MAX_RETRIES``) and ``retry_delay_s`` let batch callers such as
+    the evaluation judge back off longer than interactive queries. Callers
+    that need the answer to come from ``request.model``, like the judge,
+    turn off ``hedge`` and ``fallback``.
+    """
+    if max_retries is None:
+        max_retries = settings.llm_max_retries
+    if retry_delay_s is None:
+        retry_delay_s = _RETRY_BASE_DELAY_S
+    start = time.monotonic()
+    LLM_EVENTS.inc("calls")
+    primary_end = start + settings.llm_timeout_s
+    if deadline is not None:
+        primary_end = min(primary_end, deadline)
+    try:
+        text = _run_phase(
+            backend,
+            request,
+            primary_end,
+            hedge_delay(request.model) if hedge else None,
+            max_retries,
+            retry_delay_s,
+        )
+        LLM_SECONDS.observe(request.model, time.monotonic() - start)
+        return text
+    except Exception as exc:
+        fallback_model = settings.llm_fallback_model if fallback else ""
+        now = time.monotonic()
+        fallback_end = now + settings.llm_fallback_timeout_s
+        if deadline is not None:
+            fallback_end = min(fallback_end, deadline)
+        if (
+            not is_retryable(exc)
+            or not fallback_model
+            or fallback_model == request.model
+            or fallback_end <= now
+        ):
+            LLM_EVENTS.inc("failed")
+            raise
+        log.warning("llm_fallback", model=request.model, fallback=fallback_model, error=repr(exc))
+        LLM_EVENTS.inc("fallback")
+
+    fallback_request = replace(request, model=fallback_model)
+    try:
+        text = _run_phase(
+            backend,
+            fallback_request,
+            fallback_end,
+            hedge_delay(fallback_model) if hedge else None,
+            max_retries,
+            retry_delay_s,
+        )
+    except Exception:
+        LLM_EVENTS.inc("failed")
+        raise
+    LLM_SECONDS.observe(fallback_model, time.monotonic() - start)
+    return text
@@ -0,0 +1,537 @@
+"""Segmented BM25 index: cheap adds and deletes, tiered background merges.
+
+The index is a list of immutable ``Segment``s, each with its own chunks,
+postings and field index, plus a per-segment live mask of deleted
+documents (tombstones). An update never touches existing segments: new
+chunks are analyzed into one small new segment, and deletes copy the mask
+of the segments they hit. ``updated`` returns a new index sharing every
+untouched segment with the old one, so publishing the next generation
+costs time proportional to the change, not the corpus.
+
+Scores use statistics over the live documents of all segments: the
+document count, average length and each query term's document frequency
+(counted from its postings, with tombstones masked out). A segmented index
+therefore scores every chunk exactly like a BM25 index rebuilt from its
+live chunks.
+
+``TieredMergePolicy`` keeps the segment count logarithmic: segments are
+grouped into tiers by size, and a tier holding ``segments_per_tier``
+segments is merged into one. A segment whose share of deleted documents
+passes ``max_deleted_ratio`` is rewritten on its own to drop them. Merges
+run in the background and are swapped into the live index in one
+reference assignment. A merge never changes a score, so readers cannot
+tell a merged index from the unmerged one.
+
+Segment postings are block-compressed (``codec.CompressedPostings``) and
+decoded block by block at query time; a filtered query decodes only the
+blocks that can hold a matching document. Chunk text is not held by the
+segments: it lives in a ``ChunkStore`` and a segment keeps only the
+store's integer row ids, so a merge concatenates ids instead of copying
+text. Search results are fetched from the store in one batch.
+
+On disk each segment is written once to ``<bm25 path stem>.segments/``:
+``<name>.postings.npz`` and ``<name>.ids.npy``, with the chunks in
+``<bm25 path stem>.chunks.db``. Loading reads the postings back without
+re-analyzing any text. The index file lists the segments, their
+tombstones and the analyzer the postings were built with.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import time
+import weakref
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import structlog
+
+from .analysis import Analyzer, Vocabulary, default_analyzer
+from .chunk_store import ChunkStore, chunk_store_path
+from .codec import CompressedPostings
+from .config import settings
+from .filters import FieldIndex
+from .fusion import top_k_indices
+from .models import Chunk, QueryFilters, ScoredChunk
+from .postings import Postings, bm25l_term_scores, merge_postings
+
+log = structlog.get_logger()
+
+
+class Segment:
+    """An immutable batch of analyzed chunks with its own postings.
+
+    ``ids`` are the chunks' rows in ``store``; ``metadata`` (chunks with or
+    without text) only builds the field index and is not kept.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        metadata: Sequence[Chunk],
+        postings: CompressedPostings,
+        store: ChunkStore,
+        name: str | None = None,
+    ) -> None:
+        self.name = name or secrets.token_hex(8)
+        self.ids = ids
+        self.postings = postings
+        self.store = store
+        self.fields = FieldIndex(metadata)
+        self._positions = {c.chunk_id: i for i, c in enumerate(metadata)}
+        store.retain(ids)
+        weakref.finalize(self, store.release, ids)
+
+    @classmethod
+    def build(
+        cls, chunks: list[Chunk], analyzer: Analyzer, store: ChunkStore, name: str | None = None
+    ) -> Segment:
+        vocab = Vocabulary()
+        docs = [vocab.intern(analyzer(c.text)) for c in chunks]
+        postings = Postings.from_ids(docs, vocab.terms)
+        packed = CompressedPostings.from_postings(postings)
+        return cls(store.add(chunks), chunks, packed, store, name)
+
+    @classmethod
+    def merge(cls, parts: Sequence[tuple[Segment, np.ndarray]]) -> Segment:
+        """One segment holding the documents ``keep`` of each part, in order."""
+        store = parts[0][0].store
+        ids = np.concatenate([seg.ids[keep] for seg, keep in parts])
+        postings = merge_postings([(seg.postings.decode(), keep) for seg, keep in parts])
+        return cls(ids, store.metadata(ids), CompressedPostings.from_postings(postings), store)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions_of(self, chunk_ids: Iterable[str]) -> np.ndarray:
+        found = (self._positions.get(i) for i in chunk_ids)
+        return np.asarray(sorted(p for p in found if p is not None), dtype=np.int64)
+
+    @property
+    def memory_bytes(self) -> int:
+        ids = self.ids.nbytes + sum(len(c) + 100 for c in self._positions)  # ids plus lookup
+        return ids + self.postings.nbytes + sum(len(t) + 80 for t in self.postings.vocab)
+
+    def save(self, directory: Path) -> None:
+        """Write the segment once; segments never change after that."""
+        ids_path = directory / f"{self.name}.ids.npy"
+        postings_path = directory / f"{self.name}.postings.npz"
+        if not ids_path.exists():
+            tmp = ids_path.with_name(ids_path.name + ".tmp")
+            with tmp.open("wb") as f:
+                np.save(f, self.ids)
+            os.replace(tmp, ids_path)
+        if not postings_path.exists():
+            # The postings file is written last: its presence marks a complete segment
+            tmp = postings_path.with_name(postings_path.name + ".tmp")
+            self.postings.save(tmp)
+            os.replace(tmp, postings_path)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, store: ChunkStore) -> Segment:
+        ids = np.load(directory / f"{name}.ids.npy")
+        postings = CompressedPostings.load(directory / f"{name}.postings.npz")
+        return cls(ids, store.metadata(ids), postings, store, name)
+
+
+def _keep(segment: Segment, live: np.ndarray | None) -> np.ndarray:
+    return np.arange(len(segment)) if live is None else np.flatnonzero(live)
+
+
+class _View:
+    """Segments and their live masks (None = no deletes), with derived statistics.
+
+    Positions are physical: segment offset plus local doc id, deleted
+    documents included. A view is never modified.
+    """
+
+    def __init__(self, segments: Sequence[Segment], live: Sequence[np.ndarray | None]) -> None:
+        self.segments = tuple(segments)
+        self.live = tuple(live)
+        self.offsets = np.zeros(len(self.segments) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in self.segments], out=self.offsets[1:])
+        self.live_counts = [
+            len(s) if m is None else int(m.sum()) for s, m in zip(self.segments, self.live)
+        ]
+        self.num_docs = sum(self.live_counts)
+        self.total_len = sum(
+            int(s.postings.doc_len.sum() if m is None else s.postings.doc_len[m].sum())
+            for s, m in zip(self.segments, self.live)
+        )
+
+    def chunks_at(self, positions: np.ndarray) -> list[Chunk]:
+        """Chunks at ``positions``, read from the store in one batch."""
+        if len(positions) == 0:
+            return []
+        which = np.searchsorted(self.offsets, positions, side="right") - 1
+        rows = np.empty(len(positions), dtype=np.int64)
+        for i in np.unique(which):
+            hit = which == i
+            rows[hit] = self.segments[i].ids[positions[hit] - self.offsets[i]]
+        return self.segments[0].store.get_many(rows)
+
+    @cached_property
+    def sources(self) -> list[str]:
+        seen: dict[str, None] = {}
+        for seg, live in zip(self.segments, self.live):
+            fields = seg.fields
+            seen.update(dict.fromkeys(fields.sources if live is None else fields.sources_in(live)))
+        return list(seen)
+
+    def filter_ids(self, filters: QueryFilters) -> np.ndarray:
+        parts = []
+        for seg, live, off in zip(self.segments, self.live, self.offsets):
+            ids = seg.fields.filter_ids(filters)
+            if live is not None:
+                ids = ids[live[ids]]
+            parts.append(ids + off)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def scores(self, terms: list[str], candidates: np.ndarray | None = None) -> np.ndarray:
+        """BM25L score of every position, using live-document statistics.
+
+        With ``candidates`` (ascending positions) only those are guaranteed
+        to be scored, which lets segments without tombstones skip blocks.
+        """
+        scores = np.zeros(int(self.offsets[-1]), dtype=np.float64)
+        if self.num_docs == 0:
+            return scores
+        log_n = np.log(self.num_docs + 1)
+        avgdl = self.total_len / self.num_docs
+        local: list[np.ndarray | None] = [None] * len(self.segments)
+        if candidates is not None:
+            bounds = np.searchsorted(candidates, self.offsets)
+            for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+                local[i] = candidates[lo:hi] - self.offsets[i]
+        for term in terms:
+            hits = []
+            df = 0
+            for seg, live, off, cand in zip(self.segments, self.live, self.offsets, local):
+                p = seg.postings
+                tid = p.vocab.get(term)
+                if tid is None:
+                    continue
+                if live is None:
+                    # No tombstones: df is stored, so only candidate blocks need decoding
+                    df += int(p.df[tid])
+                    docs, tf = p.term_postings(tid, cand)
+                else:
+                    # The live df needs every posting of the term
+                    docs, tf = p.term_postings(tid)
+                    alive = live[docs]
+                    docs, tf = docs[alive], tf[alive]
+                    df += len(docs)
+                hits.append((off, docs, tf, p.doc_len[docs]))
+            if df == 0:
+                continue
+            idf = log_n - np.log(df + 0.5)
+            for off, docs, tf, doc_len in hits:
+                scores[off + docs] += bm25l_term_scores(tf, doc_len, idf, avgdl)
+        return scores
+
+
+@dataclass(frozen=True)
+class TieredMergePolicy:
+    """Chooses which segments to merge next."""
+
+    segments_per_tier: int = 8
+    floor_docs: int = 1000  # segments smaller than this all count as the lowest tier
+    max_deleted_ratio: float = 0.3
+
+    @classmethod
+    def from_settings(cls) -> TieredMergePolicy:
+        return cls(
+            segments_per_tier=max(2, settings.bm25_segments_per_tier),
+            floor_docs=max(1, settings.bm25_merge_floor_docs),
+            max_deleted_ratio=settings.bm25_max_deleted_ratio,
+        )
+
+    def tier(self, docs: int) -> int:
+        tier, bound = 0, self.floor_docs * self.segments_per_tier
+        while docs >= bound:
+            tier += 1
+            bound *= self.segments_per_tier
+        return tier
+
+    def select(self, sizes: Sequence[int], live_counts: Sequence[int]) -> list[int]:
+        """Indexes of the segments to merge into one, or [] when none need merging."""
+        # Rewrite the segment with the largest share of tombstones first
+        deleted = [(1 - live / size, i) for i, (size, live) in enumerate(zip(sizes, live_counts))]
+        worst_ratio, worst = max(deleted, default=(0.0, -1))
+        if worst_ratio > self.max_deleted_ratio:
+            return [worst]
+        tiers: dict[int, list[int]] = defaultdict(list)
+        for i, live in enumerate(live_counts):
+            tiers[self.tier(live)].append(i)
+        for tier in sorted(tiers):
+            members = tiers[tier]
+            if len(members) >= self.segments_per_tier:
+                smallest = sorted(members, key=lambda i: live_counts[i])
+                return sorted(smallest[: self.segments_per_tier])
+        return []
+
+
+@dataclass(frozen=True)
+class MergePlan:
+    """Segments picked for a merge, with their live masks at planning time."""
+
+    segments: tuple[Segment, ...]
+    live: tuple[np.ndarray | None, ...]
+
+    def run(self) -> Segment:
+        return Segment.merge([(s, _keep(s, m)) for s, m in zip(self.segments, self.live)])
+
+
+def segments_dir(index_path: Path) -> Path:
+    return index_path.with_name(f"{index_path.stem}.segments")
+
+
+class SegmentedBM25Index:
+    """BM25L retrieval over immutable segments with tombstone deletes."""
+
+    def __init__(self, analyzer: Analyzer | None = None, store: ChunkStore | None = None) -> None:
+        self.analyzer = analyzer or default_analyzer()
+        self.store = store if store is not None else ChunkStore()
+        self._view = _View((), ())
+
+    def _derive(self, view: _View) -> SegmentedBM25Index:
+        index = SegmentedBM25Index(self.analyzer, self.store)
+        index._view = view
+        return index
+
+    def build(self, chunks: list[Chunk]) -> None:
+        """Replace the contents with one segment holding ``chunks``."""
+        segment = Segment.build(chunks, self.analyzer, self.store)
+        self._view = _View((segment,), (None,)) if chunks else _View((), ())
+        log.info("bm25_built", num_docs=len(chunks), terms=len(segment.postings.vocab))
+
+    def updated(
+        self,
+        add: Sequence[Chunk] = (),
+        delete_sources: Iterable[str] = (),
+        delete_ids: Iterable[str] = (),
+    ) -> SegmentedBM25Index:
+        """A new index with ``add`` in a new segment and the deletes applied.
+
+        Added chunks replace live chunks with the same id. ``self`` is left
+        unchanged and shares its segments with the result.
+        """
+        started = time.perf_counter()
+        view = self._view
+        sources = list(delete_sources)
+        ids = [*delete_ids, *(c.chunk_id for c in add)]
+        segments, masks = [], []
+        deleted = 0
+        for seg, live in zip(view.segments, view.live):
+            dead = np.union1d(seg.fields.source_ids(sources), seg.positions_of(ids))
+            if len(dead):
+                live = np.ones(len(seg), dtype=bool) if live is None else live.copy()
+                deleted += int(live[dead].sum())
+                live[dead] = False
+                if not live.any():
+                    continue  # nothing left in this segment
+            segments.append(seg)
+            masks.append(live)
+        if add:
+            segments.append(Segment.build(list(add), self.analyzer, self.store))
+            masks.append(None)
+        index = self._derive(_View(segments, masks))
+        log.info(
+            "bm25_segments_updated",
+            added=len(add),
+            deleted=deleted,
+            segments=len(segments),
+            num_docs=index.num_docs,
+            ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+        return index
+
+    # --- Merging -------------------------------------------------------------
+
+    def plan_merge(self, policy: TieredMergePolicy) -> MergePlan | None:
+        view = self._view
+        picked = policy.select([len(s) for s in view.segments], view.live_counts)
+        if not picked:
+            return None
+        return MergePlan(
+            tuple(view.segments[i] for i in picked), tuple(view.live[i] for i in picked)
+        )
+
+    def with_merge(self, plan: MergePlan, merged: Segment) -> SegmentedBM25Index | None:
+        """A new index with ``merged`` in place of the plan's segments; None if they are gone.
+
+        Deletes that hit the inputs while the merge ran are carried over.
+        """
+        view = self._view
+        index_of = {id(s): i for i, s in enumerate(view.segments)}
+        if not all(id(s) in index_of for s in plan.segments):
+            return None
+        inputs = [index_of[id(s)] for s in plan.segments]
+        alive = []
+        for i, seg, planned in zip(inputs, plan.segments, plan.live):
+            keep = _keep(seg, planned)
+            now = view.live[i]
+            alive.append(np.ones(len(keep), dtype=bool) if now is None else now[keep])
+        live = np.concatenate(alive)
+        mask = None if live.all() else live
+
+        segments, masks = [], []
+        for i, (seg, seg_live) in enumerate(zip(view.segments, view.live)):
+            if i == inputs[0]:
+                if len(merged) and live.any():
+                    segments.append(merged)
+                    masks.append(mask)
+            elif i not in inputs:
+                segments.append(seg)
+                masks.append(seg_live)
+        log.info(
+            "bm25_segments_merged",
+            merged=len(plan.segments),
+            docs=len(merged),
+            segments=len(segments),
+        )
+        return self._derive(_View(segments, masks))
+
+    # --- Reading -------------------------------------------------------------
+
+    @property
+    def num_docs(self) -> int:
+        return self._view.num_docs
+
+    @property
+    def segment_sizes(self) -> list[int]:
+        """Live documents per segment."""
+        return list(self._view.live_counts)
+
+    @property
+    def chunks(self) -> list[Chunk]:
+        """Every live chunk, read from the store without filling its cache."""
+        view = self._view
+        rows = [seg.ids[_keep(seg, live)] for seg, live in zip(view.segments, view.live)]
+        if not rows:
+            return []
+        return self.store.get_many(np.concatenate(rows), cache=False)
+
+    @property
+    def sources(self) -> list[str]:
+        return self._view.sources
+
+    @property
+    def memory_bytes(self) -> int:
+        view = self._view
+        masks = sum(m.nbytes for m in view.live if m is not None)
+        return masks + sum(s.memory_bytes for s in view.segments) + self.store.cache_bytes
+
+    def filter_ids(self, filters: QueryFilters) -> np.ndarray:
+        """Positions of the live documents matching all filters, ascending."""
+        return self._view.filter_ids(filters)
+
+    def to_postings(self, positions: Sequence[int] | None = None) -> Postings:
+        """Live documents (or those at ascending ``positions`` in ``chunks``) as one postings."""
+        view = self._view
+        wanted = None if positions is None else np.asarray(positions, dtype=np.int64)
+        parts = []
+        start = 0
+        for seg, live in zip(view.segments, view.live):
+            keep = _keep(seg, live)
+            if wanted is not None:
+                end = start + len(keep)
+                keep = keep[wanted[(wanted >= start) & (wanted < end)] - start]
+                start = end
+            parts.append((seg.postings.decode(), keep))
+        return merge_postings(parts)
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        filters: QueryFilters | None = None,
+    ) -> list[ScoredChunk]:
+        view = self._view  # one consistent view even if a merge is installed meanwhile
+        k = top_k or settings.bm25_top_k
+        candidates = None
+        if filters is not None and not filters.is_empty():
+            candidates = view.filter_ids(filters)
+            if len(candidates) == 0:
+                return []
+        scores = view.scores(self.analyzer(query), candidates)
+        ranked = top_k_indices(scores, k, candidates)
+        ranked = ranked[scores[ranked] > 0]
+        return [
+            ScoredChunk(chunk=chunk, score=float(scores[i]), origin="bm25")
+            for i, chunk in zip(ranked, view.chunks_at(ranked))
+        ]
+
+    # --- Persistence ---------------------------------------------------------
+
+    def save(self, path: Path | None = None, meta: dict[str, Any] | None = None) -> None:
+        """Write new segments, then the segment list and tombstones; drop unused segments.
+
+        Chunk rows no segment refers to any more are deleted from the store
+        once the new segment list is on disk.
+        """
+        save_path = path or settings.bm25_path
+        directory = segments_dir(save_path)
+        directory.mkdir(parents=True, exist_ok=True)
+        if self.store.path != chunk_store_path(save_path):
+            self.store.backup_to(chunk_store_path(save_path))
+        view = self._view
+        for seg in view.segments:
+            seg.save(directory)
+        data = {
+            "segments": [
+                {"name": s.name, "deleted": [] if m is None else np.flatnonzero(~m).tolist()}
+                for s, m in zip(view.segments, view.live)
+            ],
+            "analyzer": self.analyzer.config(),
+            "meta": meta or {},
+        }
+        tmp_path = save_path.with_name(save_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, save_path)
+
+        keep = {s.name for s in view.segments}
+        for stale in directory.iterdir():
+            if stale.name.split(".", 1)[0] not in keep:
+                stale.unlink(missing_ok=True)
+        self.store.collect()
+        log.info("bm25_saved", path=str(save_path), segments=len(view.segments))
+
+    def load(self, path: Path | None = None) -> dict[str, Any]:
+        """Load the segments; returns the metadata stored with them."""
+        load_path = path or settings.bm25_path
+        data = json.loads(load_path.read_text(encoding="utf-8"))
+        if self.store.path != chunk_store_path(load_path):
+            self.store = ChunkStore(chunk_store_path(load_path))
+        if "chunks" in data:
+            # Single-file index written before segments existed
+            self.build([Chunk(**c) for c in data["chunks"]])
+        else:
+            # Stored postings must be queried with the analyzer that built them
+            self.analyzer = Analyzer.from_config(data["analyzer"])
+            directory = segments_dir(load_path)
+            segments, masks = [], []
+            for entry in data["segments"]:
+                seg = Segment.load(directory, entry["name"], self.store)
+                live = None
+                if entry["deleted"]:
+                    live = np.ones(len(seg), dtype=bool)
+                    live[entry["deleted"]] = False
+                segments.append(seg)
+                masks.append(live)
+            self._view = _View(segments, masks)
+        self.store.collect(orphans=True)  # rows of segments that were never saved
+        log.info(
+            "bm25_loaded",
+            path=str(load_path),
+            num_docs=self.num_docs,
+            segments=len(self.segment_sizes),
+        )
+        return dict(data.get("meta", {}))
@@ -0,0 +1,126 @@
+"""Pre-fork server: N uvicorn workers sharing one socket, model weights and mmap'd indexes.
+
+The master process loads the model weights, binds the listening socket and
+forks the workers. Weights are shared copy-on-write and the indexes are
+memory-mapped from ``RAG_SHARED_INDEX_DIR`` by every worker, so adding a
+worker costs its private heap rather than another full copy of everything.
+"""
+
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import time
+
+import structlog
+
+from . import embeddings, reranker
+from .config import settings
+from .startup import provision_snapshot
+
+log = structlog.get_logger()
+
+_RESPAWN_DELAY_S = 1.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, index: int) -> None:
+    import uvicorn
+
+    from .api import app
+
+    log.info("worker_started", worker=index, pid=os.getpid())
+    config = uvicorn.Config(app, lifespan="on", log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, index: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Workers handle signals through uvicorn; drop the master's handlers
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            _run_worker(sock, index)
+        except BaseException:
+            log.exception("worker_crashed", worker=index)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(
+    workers: int | None = None,
+    host: str | None = None,
+    port: int | None = None,
+    preload_models: bool = True,
+) -> None:
+    """Run ``workers`` API processes behind one socket until SIGTERM/SIGINT."""
+    n = workers or settings.workers
+    host = host or settings.host
+    port = port or settings.port
+    # Restore once here so the workers find the export instead of racing to fetch it
+    provision_snapshot()
+    if n > 1 and settings.shared_index_dir is None:
+        log.warning("workers_without_shared_index", workers=n)
+
+    if preload_models and settings.inference_socket is None:
+        started = time.perf_counter()
+        embeddings.preload()
+        reranker.preload()
+        log.info("models_preloaded", seconds=round(time.perf_counter() - started, 3))
+    # Import the app before forking so its modules are shared too
+    from .api import app  # noqa: F401
+
+    sock = _bind(host, port)
+    log.info("master_listening", host=host, port=port, workers=n, pid=os.getpid())
+
+    children: dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def _stop(signum: int, _frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    for i in range(n):
+        children[_spawn(sock, i)] = i
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if stopping:
+            log.info("worker_exited", worker=index, pid=pid, code=code)
+            continue
+        log.error("worker_died", worker=index, pid=pid, code=code)
+        time.sleep(_RESPAWN_DELAY_S)
+        if not stopping:
+            children[_spawn(sock, index)] = index
+
+    sock.close()
+    log.info("master_stopped")
@@ -0,0 +1,536 @@
+"""Sharded retrieval: the corpus split over N shard processes, queried scatter-gather.
+
+``export_sharded`` partitions a generation by chunk id into N shards, each
+written under ``shard-NN/`` in the memory-mappable layout of
+``shared_index``. Next to each shard's postings it stores the corpus-wide
+document frequency of the shard's terms (``sparse/global_df.npy``); the
+corpus size and average document length go into the manifest. Scored with
+those statistics, every document gets exactly the BM25 score it has in the
+unsharded index, so per-shard top-k lists can be merged by score.
+
+Each shard is served by its own process (``ShardServer``) on a Unix socket.
+``ShardSet`` embeds the query once, sends one request covering both legs to
+every shard in parallel, and merges the per-shard top-k lists into global
+ones (ties broken by original position, as unsharded) before fusion.
+Postings and embeddings live only in the shard processes; the coordinator
+maps the shards' chunk stores to turn positions back into chunks.
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import structlog
+
+from .analysis import Analyzer
+from .config import settings
+from .embeddings import embed_query
+from .generations import IndexGeneration
+from .hybrid_retriever import HybridRetriever
+from .inference import SocketClient, SocketServer
+from .metrics import span
+from .models import Chunk, QueryFilters, ScoredChunk
+from .postings import CorpusStats
+from .segments import SegmentedBM25Index
+from .shared_index import (
+    FORMAT_VERSION,
+    MmapBM25Index,
+    MmapChunkStore,
+    MmapVectorIndex,
+    normalized_embeddings,
+    open_layout,
+    staging_dir,
+    swap_into_place,
+    write_layout,
+)
+from .vector_store import VectorGeneration
+from .wire import send_message
+
+log = structlog.get_logger()
+
+_STARTUP_TIMEOUT_S = 60.0
+
+
+def shard_dir(directory: Path, index: int) -> Path:
+    return directory / f"shard-{index:02d}"
+
+
+def shard_socket(socket_dir: Path, index: int) -> Path:
+    return socket_dir / f"shard-{index:02d}.sock"
+
+
+def shard_of(chunk_id: str, num_shards: int) -> int:
+    """Stable shard assignment of a chunk."""
+    return zlib.crc32(chunk_id.encode()) % num_shards
+
+
+def export_sharded(gen: IndexGeneration, directory: Path, num_shards: int) -> dict[str, Any]:
+    """Write a generation to ``directory`` as ``num_shards`` memory-mappable shards.
+
+    Like ``export_generation`` the export is staged and renamed into place.
+    Returns the manifest.
+    """
+    if not isinstance(gen.bm25, SegmentedBM25Index) or not isinstance(gen.vector, VectorGeneration):
+        raise TypeError("Only in-process (BM25 + Chroma) generations can be exported")
+    if num_shards < 1:
+        raise ValueError("num_shards must be at least 1")
+
+    chunks = gen.bm25.chunks
+    tmp = staging_dir(directory)
+    started = time.perf_counter()
+
+    embeddings = normalized_embeddings(gen.vector, chunks)
+    full = gen.bm25.to_postings()
+    df = full.df
+    parts: list[list[int]] = [[] for _ in range(num_shards)]
+    for i, chunk in enumerate(chunks):
+        parts[shard_of(chunk.chunk_id, num_shards)].append(i)
+
+    for index, positions in enumerate(parts):
+        out = shard_dir(tmp, index)
+        shard_chunks = [chunks[i] for i in positions]
+        postings = gen.bm25.to_postings(positions)
+        write_layout(out, shard_chunks, postings, embeddings[positions])
+        terms = postings.terms
+        global_df = np.fromiter((df[full.vocab[t]] for t in terms), np.int64, len(terms))
+        np.save(out / "sparse" / "global_df.npy", global_df)
+        np.save(out / "chunks" / "global_ids.npy", np.asarray(positions, dtype=np.int64))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "generation": gen.number,
+        "chunks": len(chunks),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "embedding_model": settings.embedding_model,
+        "analyzer": gen.bm25.analyzer.config(),
+        "created_at": int(time.time()),
+        "shards": num_shards,
+        "shard_chunks": [len(p) for p in parts],
+        "num_docs": full.num_docs,
+        "avgdl": full.avgdl,
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    swap_into_place(tmp, directory)
+
+    log.info(
+        "sharded_index_exported",
+        dir=str(directory),
+        generation=gen.number,
+        chunks=len(chunks),
+        shards=num_shards,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return manifest
+
+
+def _read_manifest(directory: Path) -> dict[str, Any]:
+    manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    if not manifest.get("shards"):
+        raise ValueError(f"{directory} is not a sharded export")
+    return dict(manifest)
+
+
+# --- Shard process ---------------------------------------------------------
+
+
+class Shard:
+    """One shard's sparse and dense index, scored with corpus-wide statistics."""
+
+    def __init__(
+        self, directory: Path, num_docs: int, avgdl: float, analyzer: Analyzer | None = None
+    ) -> None:
+        store, fields, postings, embeddings = open_layout(directory)
+        global_df = np.load(directory / "sparse" / "global_df.npy", mmap_mode="r")
+        stats = CorpusStats(num_docs=num_docs, avgdl=avgdl, df=global_df)
+        self.size = len(store)
+        self.bm25 = MmapBM25Index(store, postings, fields, stats, analyzer)
+        self.vector = MmapVectorIndex(store, embeddings, fields, name=directory.name)
+
+    def search(
+        self,
+        query: str,
+        bm25_k: int,
+        vector_k: int,
+        filters: QueryFilters | None,
+        where: dict[str, Any] | None,
+        query_embedding: np.ndarray | None,
+    ) -> dict[str, list[list[float]]]:
+        """Local positions and scores of the shard's top-k, per leg."""
+        result: dict[str, list[list[float]]] = {"bm25": [[], []], "vector": [[], []]}
+        if bm25_k > 0:
+            ids, scores = self.bm25.rank(query, bm25_k, filters)
+            result["bm25"] = [ids.tolist(), scores.tolist()]
+        if vector_k > 0 and query_embedding is not None:
+            ids, sims = self.vector.rank(query_embedding, vector_k, where)
+            result["vector"] = [ids.tolist(), sims.tolist()]
+        return result
+
+
+class ShardServer(SocketServer):
+    """Serves ``search`` requests against one shard."""
+
+    name = "shard"
+
+    def __init__(self, socket_path: Path, shard: Shard) -> None:
+        super().__init__(socket_path)
+        self.shard = shard
+
+    def _handle(self, header: dict[str, Any], payload: bytes, conn: socket.socket) -> None:
+        op = header.get("op")
+        if op == "search":
+            filters = header.get("filters")
+            embedding = np.frombuffer(payload, dtype=np.float32) if payload else None
+            result = self.shard.search(
+                header["query"],
+                int(header["bm25_k"]),
+                int(header["vector_k"]),
+                QueryFilters.model_validate(filters) if filters else None,
+                header.get("where"),
+                embedding,
+            )
+            send_message(conn, result)
+        elif op == "stats":
+            send_message(conn, {"chunks": self.shard.size})
+        else:
+            send_message(conn, {"error": f"Unknown op: {op}"})
+
+
+def _run_shard(directory: str, index: int, socket_path: str) -> None:
+    """Process entry point: serve one shard until terminated."""
+    root = Path(directory)
+    manifest = _read_manifest(root)
+    shard = Shard(
+        shard_dir(root, index),
+        manifest["num_docs"],
+        manifest["avgdl"],
+        Analyzer.from_config(manifest["analyzer"]),
+    )
+    server = ShardServer(Path(socket_path), shard)
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def spawn_shards(directory: Path, socket_dir: Path) -> list[BaseProcess]:
+    """Start one process per shard of the export in ``directory``."""
+    manifest = _read_manifest(directory)
+    ctx = multiprocessing.get_context("spawn")
+    processes: list[BaseProcess] = []
+    for index in range(manifest["shards"]):
+        proc = ctx.Process(
+            target=_run_shard,
+            args=(str(directory), index, str(shard_socket(socket_dir, index))),
+            name=f"documind-shard-{index}",
+            daemon=True,
+        )
+        proc.start()
+        processes.append(proc)
+    log.info("shards_spawned", shards=len(processes), socket_dir=str(socket_dir))
+    return processes
+
+
+def serve_shards(directory: Path, socket_dir: Path) -> None:
+    """Run every shard of an export in its own process until interrupted."""
+    processes = spawn_shards(directory, socket_dir)
+    try:
+        for proc in processes:
+            proc.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in processes:
+            proc.terminate()
+
+
+# --- Coordinator -----------------------------------------------------------
+
+
+class ShardClient(SocketClient):
+    server_name = "Shard"
+
+    def search(
+        self,
+        query: str,
+        bm25_k: int,
+        vector_k: int,
+        filters: QueryFilters | None,
+        where: dict[str, Any] | None,
+        query_embedding: np.ndarray | None,
+    ) -> dict[str, Any]:
+        header = {
+            "op": "search",
+            "query": query,
+            "bm25_k": bm25_k,
+            "vector_k": vector_k,
+            "filters": filters.model_dump(mode="json") if filters is not None else None,
+            "where": where,
+        }
+        payload = b""
+        if query_embedding is not None:
+            payload = np.ascontiguousarray(query_embedding, dtype=np.float32).tobytes()
+        reply, _ = self._call(header, payload)
+        return reply
+
+    def stats(self) -> dict[str, Any]:
+        reply, _ = self._call({"op": "stats"})
+        return reply
+
+
+class ShardSet:
+    """Scatter-gather over the shard processes serving one sharded export."""
+
+    def __init__(
+        self,
+        directory: Path,
+        socket_dir: Path,
+        processes: list[BaseProcess] | None = None,
+    ) -> None:
+        manifest = _read_manifest(directory)
+        self.directory = directory
+        self.generation = int(manifest.get("generation", 0))
+        self.num_docs = int(manifest["num_docs"])
+        self.analyzer = Analyzer.from_config(manifest["analyzer"])
+        self._processes = processes or []
+        self._stores: list[MmapChunkStore] = []
+        self._global_ids: list[np.ndarray] = []
+        for index in range(manifest["shards"]):
+            path = shard_dir(directory, index)
+            self._stores.append(MmapChunkStore(path / "chunks"))
+            self._global_ids.append(np.load(path / "chunks" / "global_ids.npy", mmap_mode="r"))
+        self._clients = [ShardClient(shard_socket(socket_dir, i)) for i in range(len(self._stores))]
+        # One thread per shard: a query's requests to all shards go out together
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self._clients)), thread_name_prefix="shard"
+        )
+        metadata: list[Chunk | None] = [None] * self.num_docs
+        for store, ids in zip(self._stores, self._global_ids):
+            for chunk, gid in zip(store.metadata(), ids):
+                metadata[int(gid)] = chunk
+        self._sources = list(dict.fromkeys(c.source for c in metadata if c is not None))
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._stores)
+
+    @property
+    def sources(self) -> list[str]:
+        return self._sources
+
+    def chunks(self) -> list[Chunk]:
+        """Every chunk, in the order of the unsharded index."""
+        out: list[Chunk | None] = [None] * self.num_docs
+        for store, ids in zip(self._stores, self._global_ids):
+            for local, gid in enumerate(ids):
+                out[int(gid)] = store.get(local)
+        return [c for c in out if c is not None]
+
+    def wait_ready(self, timeout_s: float = _STARTUP_TIMEOUT_S) -> None:
+        """Block until every shard answers, or raise if one died or timed out."""
+        deadline = time.monotonic() + timeout_s
+        for index, client in enumerate(self._clients):
+            while True:
+                try:
+                    client.stats()
+                    break
+                except OSError:
+                    proc = self._processes[index] if index < len(self._processes) else None
+                    if proc is not None and not proc.is_alive():
+                        raise RuntimeError(f"Shard {index} exited with {proc.exitcode}") from None
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Shard {index} not ready after {timeout_s:.0f}s")
+                    time.sleep(0.05)
+        log.info("shards_ready", shards=self.num_shards, dir=str(self.directory))
+
+    def search(
+        self,
+        query: str,
+        bm25_k: int,
+        vector_k: int,
+        filters: QueryFilters | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> tuple[list[ScoredChunk], list[ScoredChunk]]:
+        """Global BM25 and vector top-k, gathered from every shard in parallel."""
+        with span("shard_search"):
+            futures = [
+                self._executor.submit(
+                    client.search, query, bm25_k, vector_k, filters, where, query_embedding
+                )
+                for client in self._clients
+            ]
+            replies = [f.result() for f in futures]
+        with span("shard_merge"):
+            return (
+                self._merge(replies, "bm25", bm25_k),
+                self._merge(replies, "vector", vector_k),
+            )
+
+    def _merge(self, replies: list[dict[str, Any]], leg: str, k: int) -> list[ScoredChunk]:
+        shards, locals_, scores = [], [], []
+        for index, reply in enumerate(replies):
+            ids, leg_scores = reply[leg]
+            shards.extend([index] * len(ids))
+            locals_.extend(ids)
+            scores.extend(leg_scores)
+        if not scores or k <= 0:
+            return []
+        shard_arr = np.asarray(shards, dtype=np.int64)
+        local_arr = np.asarray(locals_, dtype=np.int64)
+        score_arr = np.asarray(scores, dtype=np.float64)
+        global_arr = np.asarray(
+            [self._global_ids[s][i] for s, i in zip(shard_arr, local_arr)], dtype=np.int64
+        )
+        order = np.lexsort((global_arr, -score_arr))[:k]
+        return [
+            ScoredChunk(
+                chunk=self._stores[int(shard_arr[i])].get(int(local_arr[i])),
+                score=float(score_arr[i]),
+                origin=leg,
+            )
+            for i in order
+        ]
+
+    def close(self) -> None:
+        """Close connections and stop the shard processes this set started."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for client in self._clients:
+            client.close()
+        for proc in self._processes:
+            proc.terminate()
+        for proc in self._processes:
+            proc.join(timeout=5)
+        self._processes = []
+
+
+class ShardedBM25:
+    """The sparse leg of a ``ShardSet`` as a ``SparseIndex``."""
+
+    def __init__(self, shards: ShardSet) -> None:
+        self._shards = shards
+        self.analyzer = shards.analyzer  # the one the shards' postings were built with
+
+    @property
+    def chunks(self) -> list[Chunk]:
+        return self._shards.chunks()
+
+    @property
+    def sources(self) -> list[str]:
+        return self._shards.sources
+
+    @property
+    def memory_bytes(self) -> int:
+        return 0  # postings live in the shard processes
+
+    def search(
+        self, query: str, top_k: int | None = None, filters: QueryFilters | None = None
+    ) -> list[ScoredChunk]:
+        k = top_k or settings.bm25_top_k
+        return self._shards.search(query, k, 0, filters=filters)[0]
+
+
+class ShardedVector:
+    """The dense leg of a ``ShardSet`` as a ``DenseIndex``."""
+
+    def __init__(self, shards: ShardSet) -> None:
+        self._shards = shards
+
+    @property
+    def name(self) -> str:
+        return f"sharded:{self._shards.directory.name}"
+
+    @property
+    def count(self) -> int:
+        return self._shards.num_docs
+
+    @property
+    def memory_bytes(self) -> int:
+        return 0  # embeddings live in the shard processes
+
+    def drop(self) -> None:
+        # Retiring the generation shuts down the shard processes it started
+        self._shards.close()
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[ScoredChunk]:
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = embed_query(query)
+        k = top_k or settings.vector_top_k
+        return self._shards.search(query, 0, k, where=where, query_embedding=query_embedding)[1]
+
+
+class ShardedRetriever(HybridRetriever):
+    """Hybrid retrieval with both legs answered by one scatter-gather round."""
+
+    def __init__(self, bm25: ShardedBM25, vector: ShardedVector, shards: ShardSet) -> None:
+        super().__init__(bm25, vector)
+        self._shards = shards
+
+    def _search_legs(
+        self,
+        query: str,
+        bm25_top_k: int | None,
+        vector_top_k: int | None,
+        filters: QueryFilters | None,
+        where: dict[str, Any] | None,
+        query_embedding: np.ndarray | None,
+    ) -> tuple[list[ScoredChunk], list[ScoredChunk]]:
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = embed_query(query)
+        return self._shards.search(
+            query,
+            bm25_top_k or settings.bm25_top_k,
+            vector_top_k or settings.vector_top_k,
+            filters=filters,
+            where=where,
+            query_embedding=query_embedding,
+        )
+
+
+def open_sharded(directory: Path, manifest: dict[str, Any]) -> IndexGeneration:
+    """Connect to (or start) the shard processes of an export and wrap them as a generation.
+
+    With ``RAG_SHARD_SOCKET_DIR`` set, shards run by ``scripts/serve.py shards``
+    are used; otherwise this process starts its own, which stop with it.
+    """
+    socket_dir = settings.shard_socket_dir
+    processes: list[BaseProcess] = []
+    if socket_dir is None:
+        socket_dir = Path(tempfile.mkdtemp(prefix="documind-shards-"))
+        processes = spawn_shards(directory, socket_dir)
+    shards = ShardSet(directory, socket_dir, processes)
+    try:
+        shards.wait_ready()
+    except Exception:
+        shards.close()
+        raise
+    bm25, vector = ShardedBM25(shards), ShardedVector(shards)
+    log.info(
+        "sharded_index_opened",
+        dir=str(directory),
+        generation=shards.generation,
+        shards=shards.num_shards,
+        chunks=manifest.get("chunks"),
+    )
+    return IndexGeneration(shards.generation, bm25, vector, ShardedRetriever(bm25, vector, shards))
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import structlog
+
+from .analysis import Analyzer, default_analyzer
+from .config import settings
+from .embeddings import embed_query
+from .filters import FieldIndex
+from .fusion import top_k_indices
+from .generations import IndexGeneration
+from .metrics import span
+from .models import Chunk, QueryFilters, ScoredChunk
+from .postings import CorpusStats, Postings, bm25l_scores
+from .segments import SegmentedBM25Index
+from .vector_store import VectorGeneration
+
+log = structlog.get_logger()
+
+FORMAT_VERSION = 1
+
+# Layout of an exported generation:
+#   manifest.json
+#   chunks/texts.bin, chunks/offsets.npy, chunks/meta.json
+#   sparse/vocab.json, sparse/{indptr,doc_ids,tfs,doc_len}.npy
+#   dense/embeddings.npy  (float32, L2-normalized, one row per chunk)
+
+
+class MmapChunkStore:
+    """Chunk texts in one memory-mapped UTF-8 blob; metadata is kept in memory.
+
+    Every worker maps the same file, so the texts live once in the page cache.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+        blob = directory / "texts.bin"
+        self._texts = (
+            np.memmap(blob, dtype=np.uint8, mode="r")
+            if blob.stat().st_size
+            else np.zeros(0, dtype=np.uint8)
+        )
+        self._offsets = offsets
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        self._meta: list[dict[str, Any]] = meta
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    def text(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._texts[start:end].tobytes().decode("utf-8")
+
+    def get(self, i: int) -> Chunk:
+        return Chunk(text=self.text(i), **self._meta[i])
+
+    def metadata(self) -> list[Chunk]:
+        """Chunks without text, enough to build a FieldIndex."""
+        return [Chunk(text="", **m) for m in self._meta]
+
+    @staticmethod
+    def write(chunks: list[Chunk], directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        with open(directory / "texts.bin", "wb") as f:
+            for i, chunk in enumerate(chunks):
+                data = chunk.text.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(directory / "offsets.npy", offsets)
+        meta = [c.model_dump(exclude={"text"}) for c in chunks]
+        (directory / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+class MmapBM25Index:
+    """Read-only BM25L index over memory-mapped postings."""
+
+    def __init__(
+        self,
+        store: MmapChunkStore,
+        postings: Postings,
+        fields: FieldIndex,
+        stats: CorpusStats | None = None,
+        analyzer: Analyzer | None = None,
+    ) -> None:
+        self._store = store
+        self._postings = postings
+        self._fields = fields
+        self._stats = stats  # corpus-wide statistics when this is one shard
+        self.analyzer = analyzer or default_analyzer()  # must be the one the export used
+
+    @property
+    def chunks(self) -> list[Chunk]:
+        return [self._store.get(i) for i in range(len(self._store))]
+
+    @property
+    def sources(self) -> list[str]:
+        return self._fields.sources
+
+    @property
+    def memory_bytes(self) -> int:
+        # Only the vocabulary and field postings are private; the arrays are shared pages
+        return _vocab_bytes(self._postings.vocab)
+
+    def rank(
+        self, query: str, k: int, filters: QueryFilters | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and scores of the top ``k`` matching documents."""
+        scores = bm25l_scores(self._postings, self.analyzer(query), self._stats)
+        candidates = None
+        if filters is not None and not filters.is_empty():
+            candidates = self._fields.filter_ids(filters)
+        ranked = top_k_indices(scores, k, candidates)
+        ranked = ranked[scores[ranked] > 0]
+        return ranked, scores[ranked]
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        filters: QueryFilters | None = None,
+    ) -> list[ScoredChunk]:
+        ranked, scores = self.rank(query, top_k or settings.bm25_top_k, filters)
+        return [
+            ScoredChunk(chunk=self._store.get(int(i)), score=float(score), origin="bm25")
+            for i, score in zip(ranked, scores)
+        ]
+
+
+class MmapVectorIndex:
+    """Exact cosine search over a memory-mapped embedding matrix."""
+
+    def __init__(
+        self, store: MmapChunkStore, embeddings: np.ndarray, fields: FieldIndex, name: str
+    ) -> None:
+        self._store = store
+        self._embeddings = embeddings
+        self._fields = fields
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def count(self) -> int:
+        return len(self._store)
+
+    @property
+    def memory_bytes(self) -> int:
+        return 0  # the embedding matrix is shared pages of the export
+
+    def drop(self) -> None:
+        # The files belong to the export; other workers may still map them
+        pass
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[ScoredChunk]:
+        if self.count == 0:
+            return []
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = embed_query(query)
+        with span("vector_search"):
+            ranked, sims = self.rank(query_embedding, top_k or settings.vector_top_k, where)
+        return [
+            ScoredChunk(chunk=self._store.get(int(i)), score=float(sim), origin="vector")
+            for i, sim in zip(ranked, sims)
+        ]
+
+    def rank(
+        self, query_embedding: np.ndarray, k: int, where: dict[str, Any] | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and cosine similarities of the ``k`` nearest chunks."""
+        if self.count == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = query_embedding.astype(np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        if where:
+            ids = self._fields.where_ids(where)
+            sims = np.full(self.count, -np.inf, dtype=np.float32)
+            sims[ids] = self._embeddings[ids] @ q
+            ranked = top_k_indices(sims, k, ids)
+        else:
+            sims = self._embeddings @ q
+            ranked = top_k_indices(sims, k)
+        return ranked, sims[ranked]
+
+
+def _vocab_bytes(vocab: dict[str, int]) -> int:
+    # Rough per-entry cost of a str -> int dict: key object + slot
+    return sum(len(t) + 80 for t in vocab)
+
+
+def normalized_embeddings(vector: VectorGeneration, chunks: list[Chunk]) -> np.ndarray:
+    """Stored embeddings of ``chunks``, L2-normalized for dot-product search."""
+    embeddings = vector.get_embeddings([c.chunk_id for c in chunks])
+    if len(embeddings):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms == 0, 1.0, norms)
+    return embeddings
+
+
+def write_layout(
+    directory: Path, chunks: list[Chunk], postings: Postings, embeddings: np.ndarray
+) -> None:
+    """Write chunks, postings and embeddings in the memory-mappable layout."""
+    MmapChunkStore.write(chunks, directory / "chunks")
+    postings.save(directory / "sparse")
+    (directory / "dense").mkdir()
+    np.save(directory / "dense" / "embeddings.npy", embeddings)
+
+
+def staging_dir(directory: Path) -> Path:
+    tmp = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return tmp
+
+
+def swap_into_place(tmp: Path, directory: Path) -> None:
+    """Rename a finished export over ``directory``.
+
+    Workers that mapped the old files keep their inodes.
+    """
+    old = directory.with_name(f"{directory.name}.old-{os.getpid()}")
+    if directory.exists():
+        directory.rename(old)
+    tmp.rename(directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def export_generation(gen: IndexGeneration, directory: Path) -> dict[str, Any]:
+    """Write a generation to ``directory`` in the memory-mappable layout.
+
+    The export is written next to the target and renamed into place, so
+    workers never open a half-written directory. Returns the manifest.
+    """
+    if not isinstance(gen.bm25, SegmentedBM25Index) or not isinstance(gen.vector, VectorGeneration):
+        raise TypeError("Only in-process (BM25 + Chroma) generations can be exported")
+
+    chunks = gen.bm25.chunks
+    tmp = staging_dir(directory)
+    started = time.perf_counter()
+
+    embeddings = normalized_embeddings(gen.vector, chunks)
+    write_layout(tmp, chunks, gen.bm25.to_postings(), embeddings)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "generation": gen.number,
+        "chunks": len(chunks),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "embedding_model": settings.embedding_model,
+        "analyzer": gen.bm25.analyzer.config(),
+        "created_at": int(time.time()),
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    swap_into_place(tmp, directory)
+
+    log.info(
+        "shared_index_exported",
+        dir=str(directory),
+        generation=gen.number,
+        chunks=len(chunks),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return manifest
+
+
+def open_layout(
+    directory: Path,
+) -> tuple[MmapChunkStore, FieldIndex, Postings, np.ndarray]:
+    """Map the chunk store, postings and embeddings written by ``write_layout``."""
+    store = MmapChunkStore(directory / "chunks")
+    fields = FieldIndex(store.metadata())
+    postings = Postings.load(directory / "sparse", mmap=True)
+    embeddings = np.load(directory / "dense" / "embeddings.npy", mmap_mode="r")
+    if len(embeddings) != len(store) or postings.num_docs != len(store):
+        raise ValueError(f"Shared index at {directory} is inconsistent")
+    return store, fields, postings, embeddings
+
+
+def open_shared(directory: Path) -> IndexGeneration:
+    """Map an exported generation read-only and wrap it as an IndexGeneration."""
+    manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    version = manifest.get("format_version")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported shared index format {version} in {directory}")
+    if manifest.get("shards"):
+        from .sharding import open_sharded
+
+        return open_sharded(directory, manifest)
+
+    store, fields, postings, embeddings = open_layout(directory)
+    number = int(manifest.get("generation", 0))
+    analyzer = Analyzer.from_config(manifest["analyzer"])
+    bm25 = MmapBM25Index(store, postings, fields, analyzer=analyzer)
+    vector = MmapVectorIndex(store, embeddings, fields, name=f"shared:{directory.name}")
+    log.info("shared_index_opened", dir=str(directory), generation=number, chunks=len(store))
+    return IndexGeneration(number, bm25, vector)
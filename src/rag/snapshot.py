@@ -0,0 +1,207 @@
+"""Portable, versioned and checksummed index snapshots.
+
+A snapshot is one tar archive (gzip-compressed when the name ends in
+``.gz``) holding a shared export under ``index/`` (chunk store, BM25
+postings, embeddings and manifest; sharded or not) and ``snapshot.json``,
+which records the snapshot format, the export manifest and the SHA-256 and
+size of every file. ``<archive>.sha256`` next to it holds the digest of the
+archive itself in ``sha256sum`` format, for checking a download.
+
+Restoring verifies every checksum in a staging directory before anything is
+renamed into place, so a corrupt or truncated download never replaces the
+served index. The result is an ordinary shared export: point
+``RAG_SHARED_INDEX_DIR`` at it, or hot-load it into a running API.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import urllib.request
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Any
+
+import structlog
+
+from .config import settings
+from .shared_index import FORMAT_VERSION, staging_dir, swap_into_place
+
+if TYPE_CHECKING:
+    from .pipeline import RAGPipeline
+
+log = structlog.get_logger()
+
+SNAPSHOT_FORMAT = 1
+META_NAME = "snapshot.json"
+INDEX_DIR = "index"
+
+_CHUNK = 1 << 20
+
+
+class SnapshotError(ValueError):
+    """The snapshot is unreadable, corrupt or incompatible with this server."""
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_CHUNK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksums(directory: Path) -> dict[str, dict[str, Any]]:
+    return {
+        p.relative_to(directory).as_posix(): {"sha256": file_sha256(p), "size": p.stat().st_size}
+        for p in sorted(directory.rglob("*"))
+        if p.is_file()
+    }
+
+
+def is_url(source: str | Path) -> bool:
+    return str(source).startswith(("http://", "https://"))
+
+
+def create_snapshot(pipe: RAGPipeline, archive: Path, shards: int | None = None) -> dict[str, Any]:
+    """Package the pipeline's current generation as a snapshot archive.
+
+    Returns the snapshot metadata (also stored in the archive as ``snapshot.json``).
+    """
+    started = time.perf_counter()
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    mode = "w:gz" if archive.name.endswith(".gz") else "w"
+    with tempfile.TemporaryDirectory(dir=archive.parent, prefix=".snapshot-") as tmp:
+        root = Path(tmp)
+        manifest = pipe.export_shared(root / INDEX_DIR, shards=shards)
+        meta = {
+            "snapshot_format": SNAPSHOT_FORMAT,
+            "created_at": int(time.time()),
+            "manifest": manifest,
+            "files": _checksums(root / INDEX_DIR),
+        }
+        (root / META_NAME).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+        partial = archive.with_name(archive.name + ".partial")
+        with tarfile.open(partial, mode) as tar:
+            tar.add(root / META_NAME, arcname=META_NAME)
+            tar.add(root / INDEX_DIR, arcname=INDEX_DIR)
+        os.replace(partial, archive)
+
+    digest = file_sha256(archive)
+    Path(f"{archive}.sha256").write_text(f"{digest}  {archive.name}\n", encoding="utf-8")
+    log.info(
+        "snapshot_created",
+        path=str(archive),
+        generation=manifest["generation"],
+        chunks=manifest["chunks"],
+        bytes=archive.stat().st_size,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return meta
+
+
+def _download(url: str, dest: Path) -> None:
+    with urllib.request.urlopen(url, timeout=60) as resp, open(dest, "wb") as f:  # noqa: S310
+        shutil.copyfileobj(resp, f, _CHUNK)
+
+
+def _expected_digest(source: str | Path, scratch: Path) -> str | None:
+    """Digest from the ``.sha256`` sidecar of ``source``, if there is one."""
+    sidecar = f"{source}.sha256"
+    if is_url(source):
+        path = scratch / "archive.sha256"
+        try:
+            _download(sidecar, path)
+        except OSError:
+            return None
+    else:
+        path = Path(sidecar)
+        if not path.exists():
+            return None
+    text = path.read_text(encoding="utf-8").split()
+    return text[0] if text else None
+
+
+def _safe_members(tar: tarfile.TarFile) -> list[tarfile.TarInfo]:
+    members = tar.getmembers()
+    for m in members:
+        parts = PurePosixPath(m.name).parts
+        if m.name.startswith("/") or ".." in parts or not (m.isfile() or m.isdir()):
+            raise SnapshotError(f"Unsafe entry in snapshot archive: {m.name}")
+    return members
+
+
+def _verify(root: Path) -> dict[str, Any]:
+    meta_path = root / META_NAME
+    if not meta_path.exists():
+        raise SnapshotError(f"Archive has no {META_NAME}")
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    if meta.get("snapshot_format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {meta.get('snapshot_format')}")
+    manifest = meta.get("manifest", {})
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported index format {manifest.get('format_version')}")
+    if manifest.get("embedding_model") != settings.embedding_model:
+        raise SnapshotError(
+            f"Snapshot was embedded with {manifest.get('embedding_model')}, "
+            f"this server uses {settings.embedding_model}"
+        )
+
+    expected = meta.get("files", {})
+    actual = _checksums(root / INDEX_DIR)
+    if set(actual) != set(expected):
+        missing = sorted(set(expected) - set(actual))
+        extra = sorted(set(actual) - set(expected))
+        raise SnapshotError(f"Snapshot file list mismatch: missing {missing}, unexpected {extra}")
+    for name, info in expected.items():
+        if actual[name] != info:
+            raise SnapshotError(f"Checksum mismatch for {name}")
+    return dict(meta)
+
+
+def restore_snapshot(source: str | Path, target: Path) -> dict[str, Any]:
+    """Fetch, verify and unpack a snapshot into ``target``, replacing what is there.
+
+    ``source`` is a local path or an http(s) URL. Returns the snapshot metadata.
+    """
+    started = time.perf_counter()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = staging_dir(target)
+    staging.mkdir()
+    try:
+        if is_url(source):
+            archive = staging / "archive"
+            _download(str(source), archive)
+        else:
+            archive = Path(source)
+        expected = _expected_digest(source, staging)
+        if expected is not None and file_sha256(archive) != expected:
+            raise SnapshotError(f"Archive checksum does not match {source}.sha256")
+
+        unpacked = staging / "unpacked"
+        try:
+            with tarfile.open(archive, "r:*") as tar:
+                tar.extractall(unpacked, members=_safe_members(tar))
+        except tarfile.TarError as e:
+            raise SnapshotError(f"Cannot read snapshot archive {source}: {e}") from e
+        meta = _verify(unpacked)
+
+        shutil.copy2(unpacked / META_NAME, unpacked / INDEX_DIR / META_NAME)
+        swap_into_place(unpacked / INDEX_DIR, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    log.info(
+        "snapshot_restored",
+        source=str(source),
+        dir=str(target),
+        generation=meta["manifest"]["generation"],
+        chunks=meta["manifest"]["chunks"],
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return meta
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import structlog
+
+from .config import settings
+from .pipeline import RAGPipeline
+from .snapshot import restore_snapshot
+
+log = structlog.get_logger()
+
+# Phase -> progress reported on /health
+_PHASES = {
+    "starting": 0.0,
+    "loading_indexes": 0.1,
+    "warming_models": 0.6,
+    "ready": 1.0,
+    "failed": 1.0,
+}
+
+
+@dataclass
+class StartupState:
+    """Tracks background startup so the API can gate requests on readiness."""
+
+    phase: str = "starting"
+    error: str = ""
+    started_at: float = field(default_factory=time.monotonic)
+    ready_after_s: float | None = None
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def reset(self) -> None:
+        self.phase = "starting"
+        self.error = ""
+        self.started_at = time.monotonic()
+        self.ready_after_s = None
+        self._done.clear()
+
+    def advance(self, phase: str) -> None:
+        self.phase = phase
+        log.info("startup_phase", phase=phase, elapsed_s=round(self.elapsed_s, 3))
+        if phase in ("ready", "failed"):
+            self.ready_after_s = self.elapsed_s
+            self._done.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.phase == "ready"
+
+    @property
+    def progress(self) -> float:
+        return _PHASES.get(self.phase, 0.0)
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until startup finished (ready or failed)."""
+        return self._done.wait(timeout)
+
+
+def memory_usage() -> dict[str, float]:
+    """RSS and PSS of this process in MB.
+
+    PSS splits shared pages (memory-mapped indexes, copy-on-write model
+    weights) across the processes mapping them, so summing it over workers
+    gives the real footprint. Falls back to peak RSS where /proc is missing.
+    """
+    usage: dict[str, float] = {}
+    rollup = Path("/proc/self/smaps_rollup")
+    try:
+        for line in rollup.read_text().splitlines():
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                usage[f"{key.lower()}_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except OSError:
+        usage["rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return usage
+
+
+def provision_snapshot() -> Path | None:
+    """Restore ``RAG_SNAPSHOT_SOURCE`` into the shared index dir if that is empty.
+
+    Returns the directory to serve, or None when no snapshot is configured.
+    """
+    if not settings.snapshot_source:
+        return None
+    shared = settings.shared_index_dir or settings.data_dir / "shared"
+    if not (shared / "manifest.json").exists():
+        log.info("provisioning_from_snapshot", source=settings.snapshot_source, dir=str(shared))
+        restore_snapshot(settings.snapshot_source, shared)
+    settings.shared_index_dir = shared
+    return shared
+
+
+def load_or_ingest(pipe: RAGPipeline) -> None:
+    """Load existing indexes, or ingest the docs directory if there are none.
+
+    When ``RAG_SHARED_INDEX_DIR`` holds an export, it is mapped read-only
+    instead, so every worker shares one copy of the indexes. A fresh node
+    with ``RAG_SNAPSHOT_SOURCE`` set restores that snapshot there first.
+    """
+    shared = provision_snapshot() or settings.shared_index_dir
+    if shared is not None and (shared / "manifest.json").exists():
+        log.info("loading_shared_indexes", dir=str(shared))
+        pipe.load_shared(shared)
+    elif pipe.has_saved_index:
+        log.info("loading_existing_indexes")
+        pipe.load_indexes()
+    elif pipe.docs_dir.exists() and any(pipe.docs_dir.iterdir()):
+        log.info("ingesting_docs_on_startup", dir=str(pipe.docs_dir))
+        count = pipe.ingest()
+        log.info("startup_ingest_complete", chunks=count)
+    else:
+        log.warning("no_docs_found", dir=str(pipe.docs_dir))
+
+
+def run_startup(pipe: RAGPipeline, state: StartupState) -> None:
+    """Load indexes, then warm both models with a dummy forward pass."""
+    log.info("worker_memory", phase="starting", pid=os.getpid(), **memory_usage())
+    try:
+        state.advance("loading_indexes")
+        load_or_ingest(pipe)
+    except Exception as e:
+        log.exception("startup_failed")
+        state.error = str(e)
+        state.advance("failed")
+        return
+
+    state.advance("warming_models")
+    try:
+        pipe.warm_up()
+    except Exception:
+        # Models still load lazily on first query; don't keep the server unavailable
+        log.exception("model_warm_up_failed")
+    state.advance("ready")
+    log.info("worker_memory", phase="ready", pid=os.getpid(), **memory_usage())
+
+
+def start_background(pipe: RAGPipeline, state: StartupState) -> threading.Thread:
+    thread = threading.Thread(
+        target=run_startup, args=(pipe, state), name="documind-startup", daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+import structlog
+
+from .config import settings
+from .models import TENANT_PATTERN
+from .pipeline import RAGPipeline
+
+log = structlog.get_logger()
+
+DEFAULT_TENANT = "default"
+_TENANT_RE = re.compile(TENANT_PATTERN)
+
+
+def validate_tenant(name: str) -> str:
+    if not _TENANT_RE.match(name):
+        raise ValueError(f"Invalid tenant name: {name!r}")
+    return name
+
+
+def tenant_docs_dir(name: str) -> Path:
+    return settings.tenants_dir / name
+
+
+def tenant_bm25_path(name: str) -> Path:
+    return settings.data_dir / "tenants" / name / "bm25_index.json"
+
+
+def tenant_chroma_dir(name: str) -> Path:
+    """Each tenant has its own Chroma directory, so evicting it can free its HNSW memory."""
+    return settings.data_dir / "tenants" / name / "chroma"
+
+
+def load_tenant(name: str) -> RAGPipeline:
+    """Build a tenant's pipeline and load its saved indexes, if any."""
+    pipe = RAGPipeline(
+        docs_dir=tenant_docs_dir(name),
+        bm25_path=tenant_bm25_path(name),
+        chroma_dir=tenant_chroma_dir(name),
+    )
+    if pipe.has_saved_index:
+        pipe.load_indexes()
+    return pipe
+
+
+class TenantRegistry:
+    """Per-tenant pipelines, loaded lazily and evicted LRU under a memory budget.
+
+    Evicting closes the tenant's Chroma client, which frees its HNSW index,
+    and drops the in-memory indexes; the tenant's BM25 file and Chroma
+    directory stay on disk and are reloaded on next use. Tenants with queued
+    or running jobs (``busy``) are never evicted. A pipeline that is still
+    referenced after eviction is handed out again instead of loading a
+    second one, so a tenant never has two writers.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int | None = None,
+        loader: Callable[[str], RAGPipeline] = load_tenant,
+        busy: Callable[[str], bool] | None = None,
+    ) -> None:
+        self._budget = (
+            budget_bytes
+            if budget_bytes is not None
+            else settings.tenant_memory_budget_mb * 1024 * 1024
+        )
+        self._loader = loader
+        self._busy = busy or (lambda name: False)
+        self._pipelines: OrderedDict[str, RAGPipeline] = OrderedDict()
+        # Estimated by memory_bytes when a tenant is loaded or re-indexed
+        self._sizes: dict[str, int] = {}
+        self._evicted: weakref.WeakValueDictionary[str, RAGPipeline] = weakref.WeakValueDictionary()
+        self._loading: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> RAGPipeline:
+        validate_tenant(name)
+        with self._lock:
+            pipe = self._pipelines.get(name)
+            if pipe is not None:
+                self._pipelines.move_to_end(name)
+                return pipe
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # Load outside the registry lock so one slow tenant doesn't block the rest
+        with load_lock:
+            with self._lock:
+                pipe = self._pipelines.get(name)
+                if pipe is not None:
+                    self._pipelines.move_to_end(name)
+                    return pipe
+                pipe = self._evicted.pop(name, None)
+            if pipe is None:
+                pipe = self._loader(name)
+            size = pipe.memory_bytes
+            log.info("tenant_loaded", tenant=name, bytes=size)
+            with self._lock:
+                self._pipelines[name] = pipe
+                self._sizes[name] = size
+                self._loading.pop(name, None)
+                evicted = self._evict()
+        self._close(evicted)
+        return pipe
+
+    def _evict(self) -> list[RAGPipeline]:
+        """Unlink least-recently-used idle tenants until under budget (caller holds lock).
+
+        The most recently used tenant always stays. Returns the unlinked
+        pipelines, for the caller to close once the lock is released.
+        """
+        total = sum(self._sizes.values())
+        evicted: list[RAGPipeline] = []
+        for name in list(self._pipelines)[:-1]:
+            if total <= self._budget:
+                break
+            if self._busy(name):
+                continue
+            pipe = self._pipelines.pop(name)
+            size = self._sizes.pop(name)
+            total -= size
+            self._evicted[name] = pipe
+            evicted.append(pipe)
+            log.info("tenant_evicted", tenant=name, bytes=size)
+        return evicted
+
+    @staticmethod
+    def _close(pipelines: list[RAGPipeline]) -> None:
+        for pipe in pipelines:
+            try:
+                pipe.close()
+            except Exception:
+                log.exception("tenant_close_failed")
+
+    def refresh(self, name: str) -> None:
+        """Re-account a tenant's memory after it was (re)indexed."""
+        with self._lock:
+            pipe = self._pipelines.get(name)
+        if pipe is None:
+            return
+        size = pipe.memory_bytes
+        with self._lock:
+            if self._pipelines.get(name) is not pipe:
+                return
+            self._sizes[name] = size
+            self._pipelines.move_to_end(name)
+            evicted = self._evict()
+        self._close(evicted)
+
+    @property
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._pipelines)
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
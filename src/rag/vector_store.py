@@ -1,42 +1,116 @@
 from __future__ import annotations
 
+import threading
+from collections import Counter
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
 import structlog
-import chromadb
 
 from .config import settings
 from .embeddings import embed_query, embed_texts
+from .filters import chunk_metadata
+from .metrics import span
 from .models import Chunk, ScoredChunk
 
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from chromadb.api.models.Collection import Collection
+
 log = structlog.get_logger()
 
-_COLLECTION_NAME = "documents"
+DEFAULT_COLLECTION = "documents"
+# HNSW graph links, id mappings and metadata Chroma keeps in memory per vector
+_HNSW_BYTES_PER_VECTOR = 300
+# ``gen_until`` of a row that no generation has deleted
+_LIVE = 2**62
+
+
+def _visible_at(number: int) -> dict[str, Any]:
+    """Chroma ``where`` for the rows generation ``number`` sees."""
+    return {"$and": [{"gen_from": {"$lte": number}}, {"gen_until": {"$gt": number}}]}
+
+
+def _and(where: dict[str, Any], other: dict[str, Any] | None) -> dict[str, Any]:
+    return where if other is None else {"$and": [where, other]}
 
 
 class VectorStore:
-    """Dense vector retrieval using ChromaDB."""
+    """Dense vector retrieval using ChromaDB.
 
-    def __init__(self, persist_dir: str | None = None) -> None:
-        path = persist_dir or str(settings.chroma_dir)
-        self._client = chromadb.PersistentClient(path=path)
-        self._collection = self._client.get_or_create_collection(
-            name=_COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"},
-        )
-        self._chunk_map: dict[str, Chunk] = {}
+    One collection holds every generation. Each row records the generation
+    that added it (``gen_from``) and the one that deleted it (``gen_until``),
+    so publishing a generation writes only the rows that changed, and
+    ``VectorGeneration`` filters searches down to one generation's rows.
+    Rows no open generation can see are purged when a generation is dropped.
+    """
+
+    def __init__(self, persist_dir: str | None = None, collection_name: str | None = None) -> None:
+        self._path = persist_dir or str(settings.chroma_dir)
+        self._name = collection_name or DEFAULT_COLLECTION
+        # The Chroma client is opened on first use so constructing a pipeline is cheap
+        self._client_obj: ClientAPI | None = None
+        self._collection_obj: Collection | None = None
+        self._open_lock = threading.Lock()
+        self._dim: int | None = None
+        self._open_generations: Counter[int] = Counter()
+        self._generations_lock = threading.Lock()
+
+    @property
+    def _client(self) -> ClientAPI:
+        self._open()
+        assert self._client_obj is not None
+        return self._client_obj
+
+    @property
+    def _collection(self) -> Collection:
+        self._open()
+        assert self._collection_obj is not None
+        return self._collection_obj
+
+    def _open(self) -> None:
+        if self._collection_obj is not None:
+            return
+        with self._open_lock:
+            if self._collection_obj is None:
+                import chromadb
 
-    def add_chunks(self, chunks: list[Chunk], batch_size: int = 128) -> None:
+                self._client_obj = chromadb.PersistentClient(path=self._path)
+                self._collection_obj = self._client_obj.get_or_create_collection(
+                    name=self._name,
+                    metadata={"hnsw:space": "cosine"},
+                )
+
+    def add_chunks(
+        self,
+        chunks: list[Chunk],
+        batch_size: int = 128,
+        on_batch: Callable[[int], None] | None = None,
+        generation: int = 0,
+    ) -> None:
+        """Embed and store ``chunks`` as rows added by ``generation``."""
         if not chunks:
             return
 
         for i in range(0, len(chunks), batch_size):
             batch = chunks[i : i + batch_size]
-            ids = [c.chunk_id for c in batch]
+            # Row ids are per generation, so a re-added chunk id never
+            # overwrites the row an older generation still serves
+            ids = [f"{c.chunk_id}@{generation}" for c in batch]
             texts = [c.text for c in batch]
             metadatas = [
-                {"source": c.source, "title": c.title, "page": c.page or 0}
+                {
+                    **chunk_metadata(c),
+                    "chunk_id": c.chunk_id,
+                    "gen_from": generation,
+                    "gen_until": _LIVE,
+                }
                 for c in batch
             ]
-            embeddings = embed_texts(texts).tolist()
+            vectors = embed_texts(texts)
+            self._dim = int(vectors.shape[1])
+            embeddings = vectors.tolist()
 
             self._collection.upsert(
                 ids=ids,
@@ -45,26 +119,37 @@ class VectorStore:
                 embeddings=embeddings,
             )
 
-            for c in batch:
-                self._chunk_map[c.chunk_id] = c
+            if on_batch is not None:
+                on_batch(len(batch))
 
-        log.info("vectors_upserted", count=len(chunks))
+        log.info("vectors_upserted", count=len(chunks), generation=generation)
 
-    def search(self, query: str, top_k: int | None = None) -> list[ScoredChunk]:
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[ScoredChunk]:
         k = top_k or settings.vector_top_k
-        query_emb = embed_query(query).tolist()
+        if query_embedding is None:
+            with span("embed_query"):
+                query_embedding = embed_query(query)
+        query_emb = query_embedding.tolist()
 
-        results = self._collection.query(
-            query_embeddings=[query_emb],
-            n_results=k,
-            include=["documents", "metadatas", "distances"],
-        )
+        with span("vector_search"):
+            results = self._collection.query(
+                query_embeddings=[query_emb],
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas", "distances"],
+            )
 
         scored: list[ScoredChunk] = []
         if not results["ids"] or not results["ids"][0]:
             return scored
 
-        for cid, doc, meta, dist in zip(
+        for row_id, doc, meta, dist in zip(
             results["ids"][0],
             results["documents"][0],  # type: ignore[index]
             results["metadatas"][0],  # type: ignore[index]
@@ -72,25 +157,231 @@ class VectorStore:
         ):
             # ChromaDB cosine distance → similarity
             similarity = 1.0 - float(dist)
-            chunk = self._chunk_map.get(cid) or Chunk(
-                chunk_id=cid,
+            # The chunk is rebuilt from what Chroma stores; no second copy is kept here
+            chunk = Chunk(
+                chunk_id=meta.get("chunk_id", row_id),
                 text=doc,
                 source=meta.get("source", ""),
                 title=meta.get("title", ""),
                 page=meta.get("page") or None,
+                start_char=meta.get("start_char", 0),
+                end_char=meta.get("end_char", 0),
+                ingested_at=meta.get("ingested_at", 0),
             )
             scored.append(ScoredChunk(chunk=chunk, score=similarity, origin="vector"))
 
         return scored
 
+    def get_embeddings(
+        self, ids: list[str], where: dict[str, Any] | None = None, batch_size: int = 1000
+    ) -> np.ndarray:
+        """Stored embeddings for chunk ``ids``, in the same order."""
+        rows: dict[str, list[float]] = {}
+        for i in range(0, len(ids), batch_size):
+            page = self._collection.get(
+                where=_and({"chunk_id": {"$in": ids[i : i + batch_size]}}, where),
+                include=["embeddings", "metadatas"],
+            )
+            for meta, emb in zip(page["metadatas"], page["embeddings"]):  # type: ignore[arg-type]
+                rows[str(meta["chunk_id"])] = emb
+        missing = [cid for cid in ids if cid not in rows]
+        if missing:
+            raise KeyError(f"{len(missing)} chunk ids have no stored embedding")
+        return np.asarray([rows[cid] for cid in ids], dtype=np.float32)
+
+    def _row_ids(self, where: dict[str, Any], batch_size: int = 1000) -> list[str]:
+        ids: list[str] = []
+        while page := self._collection.get(
+            where=where, limit=batch_size, offset=len(ids), include=[]
+        )["ids"]:
+            ids.extend(page)
+        return ids
+
+    def _set_until(self, ids: list[str], until: int, batch_size: int = 1000) -> None:
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i : i + batch_size]
+            self._collection.update(ids=batch, metadatas=[{"gen_until": until}] * len(batch))
+
+    def tombstone(self, generation: int, sources: list[str] | None = None) -> int:
+        """Delete, as of ``generation``, the rows from ``sources`` (all rows if None).
+
+        Only rows the previous generation sees are touched, so older
+        generations keep serving them. Returns how many rows were deleted.
+        """
+        where = _visible_at(generation - 1)
+        if sources is not None:
+            if not sources:
+                return 0
+            where = _and(where, {"source": {"$in": sources}})
+        ids = self._row_ids(where)
+        self._set_until(ids, generation)
+        return len(ids)
+
+    def _discard_after(self, generation: int) -> None:
+        """Undo what builds of generations after ``generation`` wrote."""
+        self._collection.delete(where={"gen_from": {"$gt": generation}})
+        undeleted = self._row_ids(
+            {"$and": [{"gen_until": {"$gt": generation}}, {"gen_until": {"$lt": _LIVE}}]}
+        )
+        self._set_until(undeleted, _LIVE)
+
+    def _adopt_untracked(self, generation: int) -> None:
+        # Rows written before generations were tracked carry no gen_* metadata
+        tracked = set(self._row_ids({"gen_from": {"$gte": 0}}))
+        untracked = [i for i in self._collection.get(include=[])["ids"] if i not in tracked]
+        for i in range(0, len(untracked), 1000):
+            batch = untracked[i : i + 1000]
+            self._collection.update(
+                ids=batch,
+                metadatas=[
+                    {"chunk_id": row_id, "gen_from": generation, "gen_until": _LIVE}
+                    for row_id in batch
+                ],
+            )
+        if untracked:
+            log.info("vectors_adopted", count=len(untracked), generation=generation)
+
+    def _open_generation(self, number: int, count: int) -> VectorGeneration:
+        with self._generations_lock:
+            self._open_generations[number] += 1
+        return VectorGeneration(self, number, count)
+
+    def load_generation(self, number: int, adopt_untracked: bool = False) -> VectorGeneration:
+        """Open the saved generation ``number``, discarding rows it cannot see.
+
+        Those are rows deleted by it or earlier generations, and rows written
+        by builds that never published. With ``adopt_untracked``, rows stored
+        without generation metadata are adopted into ``number``.
+        """
+        if adopt_untracked:
+            self._adopt_untracked(number)
+        self._discard_after(number)
+        self._collection.delete(where={"gen_until": {"$lte": number}})
+        return self._open_generation(number, self._collection.count())
+
+    def stage(self, number: int, base: VectorGeneration | None) -> VectorGeneration:
+        """Open generation ``number`` for writing, starting from ``base``'s rows.
+
+        Leftovers of an interrupted build are discarded first; without a base
+        the collection is emptied.
+        """
+        if base is None:
+            self.reset()
+        else:
+            self._discard_after(base.number)
+        return self._open_generation(number, base.count if base is not None else 0)
+
+    def close_generation(self, number: int) -> None:
+        """Forget a dropped generation and purge rows no open generation sees."""
+        with self._generations_lock:
+            self._open_generations[number] -= 1
+            if self._open_generations[number] <= 0:
+                del self._open_generations[number]
+            if not self._open_generations:
+                return
+            oldest = min(self._open_generations)
+            self._collection.delete(where={"gen_until": {"$lte": oldest}})
+
+    @property
+    def name(self) -> str:
+        return self._name
+
     @property
     def count(self) -> int:
         return self._collection.count()
 
+    def estimate_bytes(self, count: int) -> int:
+        """Estimated memory of ``count`` vectors once Chroma has loaded the HNSW index."""
+        if count == 0:
+            return 0
+        if self._dim is None:
+            page = self._collection.get(limit=1, include=["embeddings"])
+            self._dim = len(page["embeddings"][0])  # type: ignore[index]
+        return count * (self._dim * 4 + _HNSW_BYTES_PER_VECTOR)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory of this collection's HNSW index once Chroma has loaded it."""
+        return self.estimate_bytes(self.count)
+
+    def close(self) -> None:
+        """Close the Chroma client; the store reopens it on next use.
+
+        Chroma frees the directory's HNSW indexes once the last client open on
+        it in this process is closed.
+        """
+        with self._open_lock:
+            client, self._client_obj, self._collection_obj = self._client_obj, None, None
+        if client is not None:
+            client.close()
+
+    def drop(self) -> None:
+        """Delete this collection entirely."""
+        self._client.delete_collection(self._name)
+        self._collection_obj = None
+
     def reset(self) -> None:
-        self._client.delete_collection(_COLLECTION_NAME)
-        self._collection = self._client.get_or_create_collection(
-            name=_COLLECTION_NAME,
+        self._client.delete_collection(self._name)
+        self._collection_obj = self._client.get_or_create_collection(
+            name=self._name,
             metadata={"hnsw:space": "cosine"},
         )
-        self._chunk_map.clear()
+
+
+class VectorGeneration:
+    """One generation's view of a ``VectorStore`` collection.
+
+    Searches only see the rows the generation sees. While it is being built
+    (``VectorStore.stage``) rows are added and tombstoned through it; once
+    published it is not changed. Dropping it releases its rows for purging.
+    """
+
+    def __init__(self, store: VectorStore, number: int, count: int) -> None:
+        self.store = store
+        self.number = number
+        self._count = count  # kept up to date here so sizing never asks Chroma
+
+    @property
+    def name(self) -> str:
+        return f"{self.store.name}@g{self.number}"
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.store.estimate_bytes(self._count)
+
+    def add_chunks(
+        self, chunks: list[Chunk], on_batch: Callable[[int], None] | None = None
+    ) -> None:
+        self.store.add_chunks(chunks, on_batch=on_batch, generation=self.number)
+        self._count += len(chunks)
+
+    def delete_sources(self, sources: list[str] | None = None) -> int:
+        """Delete the rows from ``sources`` (all rows if None); returns how many."""
+        deleted = self.store.tombstone(self.number, sources)
+        self._count -= deleted
+        return deleted
+
+    def search(
+        self,
+        query: str,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[ScoredChunk]:
+        return self.store.search(
+            query,
+            top_k=top_k,
+            where=_and(_visible_at(self.number), where),
+            query_embedding=query_embedding,
+        )
+
+    def get_embeddings(self, ids: list[str]) -> np.ndarray:
+        """Stored embeddings for chunk ``ids``, in the same order."""
+        return self.store.get_embeddings(ids, where=_visible_at(self.number))
+
+    def drop(self) -> None:
+        self.store.close_generation(self.number)
@@ -0,0 +1,40 @@
+"""Message framing shared by the inference server and the shard servers.
+
+A message is a 4-byte big-endian header length, a JSON header, then
+``header["nbytes"]`` bytes of payload (a raw array for array replies).
+"""
+
+from __future__ import annotations
+
+import json
+import socket
+import struct
+from typing import Any
+
+import numpy as np
+
+
+def recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("Socket connection closed")
+        buf += part
+    return bytes(buf)
+
+
+def send_message(sock: socket.socket, header: dict[str, Any], payload: bytes = b"") -> None:
+    raw = json.dumps({**header, "nbytes": len(payload)}).encode()
+    sock.sendall(struct.pack("!I", len(raw)) + raw + payload)
+
+
+def recv_message(sock: socket.socket) -> tuple[dict[str, Any], bytes]:
+    (size,) = struct.unpack("!I", recv_exact(sock, 4))
+    header = json.loads(recv_exact(sock, size))
+    return header, recv_exact(sock, int(header.get("nbytes", 0)))
+
+
+def send_array(sock: socket.socket, array: np.ndarray) -> None:
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    send_message(sock, {"shape": list(array.shape), "dtype": "float32"}, array.tobytes())
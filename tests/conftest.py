@@ -0,0 +1,36 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from src.rag import embeddings, sharding, shared_index, vector_store
+from src.rag.config import settings
+from src.rag.pipeline import RAGPipeline
+
+
+def length_embed(texts: list[str]) -> np.ndarray:
+    """Offline stand-in for the embedding model: cheap, with many ties."""
+    return np.asarray([[len(t) % 7 + 1.0, 1.0, 0.5] for t in texts], dtype=np.float32)
+
+
+def hashed_embed(texts: list[str]) -> np.ndarray:
+    """Offline stand-in for the embedding model: a distinct, stable vector per text."""
+    rows = [np.random.default_rng(zlib.crc32(t.encode())).standard_normal(8) for t in texts]
+    return np.asarray(rows, dtype=np.float32)
+
+
+@pytest.fixture
+def embed():
+    """Embedding function behind ``pipeline``; override or parametrize it per module."""
+    return length_embed
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch, embed):
+    """An empty pipeline on a temporary index that embeds with ``embed``."""
+    monkeypatch.setattr(settings, "chroma_dir", tmp_path / "chroma")
+    monkeypatch.setattr(embeddings, "embed_texts", embed)
+    monkeypatch.setattr(vector_store, "embed_texts", embed)
+    for module in (vector_store, shared_index, sharding):
+        monkeypatch.setattr(module, "embed_query", lambda q: embed([q])[0])
+    return RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from src.rag.admission import AdmissionController, AdmissionRejectedError, ClassLimits
+
+
+def _controller(
+    capacity: int = 1, queue: int = 8, slo_s: float = 5.0, ingest_slots: int = 1
+) -> AdmissionController:
+    return AdmissionController(
+        capacity,
+        {
+            "interactive": ClassLimits(capacity, queue, slo_s),
+            "batch": ClassLimits(capacity, queue, slo_s),
+            "ingest": ClassLimits(ingest_slots, queue, slo_s),
+        },
+    )
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_free_slot_is_granted_without_waiting():
+    async def scenario():
+        ctl = _controller(capacity=2)
+        assert await ctl.acquire("interactive") == 0.0
+        assert await ctl.acquire("batch") == 0.0
+        assert ctl.stats()["active"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_interactive_overtakes_queued_batch_and_ingest():
+    async def scenario():
+        ctl = _controller(capacity=1)
+        order: list[str] = []
+        await ctl.acquire("batch")
+
+        async def job(request_class):
+            async with ctl.admit(request_class):
+                order.append(request_class)
+
+        tasks = [asyncio.create_task(job(c)) for c in ("ingest", "batch", "interactive")]
+        await _settle()
+        assert ctl.stats()["classes"]["batch"]["queued"] == 1
+        ctl.release("batch", 0.01)
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "batch", "ingest"]
+
+    asyncio.run(scenario())
+
+
+def test_class_cap_leaves_slots_for_interactive():
+    async def scenario():
+        ctl = _controller(capacity=2, ingest_slots=1)
+        await ctl.acquire("ingest")
+        waiter = asyncio.create_task(ctl.acquire("ingest"))
+        await _settle()
+        assert not waiter.done()  # ingest is capped at one slot
+        assert await ctl.acquire("interactive") == 0.0
+        ctl.release("ingest", 0.01)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        ctl = _controller(capacity=1, queue=1)
+        await ctl.acquire("interactive")
+        waiter = asyncio.create_task(ctl.acquire("interactive"))
+        await _settle()
+        with pytest.raises(AdmissionRejectedError) as info:
+            await ctl.acquire("interactive")
+        assert info.value.status_code == 429
+        assert int(info.value.retry_after_header) >= 1
+        waiter.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_expected_wait_over_slo_is_rejected_with_503():
+    async def scenario():
+        ctl = _controller(capacity=1, slo_s=1.0)
+        await ctl.acquire("interactive")
+        ctl.release("interactive", 30.0)  # slow recent requests
+        await ctl.acquire("interactive")
+        with pytest.raises(AdmissionRejectedError) as info:
+            await ctl.acquire("interactive")
+        assert info.value.status_code == 503
+        assert int(info.value.retry_after_header) >= 6
+
+    asyncio.run(scenario())
+
+
+def test_queued_request_times_out_at_slo_and_frees_its_place():
+    async def scenario():
+        ctl = _controller(capacity=1, slo_s=0.05)
+        await ctl.acquire("interactive")
+        with pytest.raises(AdmissionRejectedError) as info:
+            await ctl.acquire("interactive")
+        assert info.value.status_code == 503
+        assert ctl.stats()["classes"]["interactive"]["queued"] == 0
+        ctl.release("interactive", 0.01)
+        assert await ctl.acquire("interactive") == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        ctl = _controller(capacity=1)
+        await ctl.acquire("interactive")
+        waiter = asyncio.create_task(ctl.acquire("interactive"))
+        await _settle()
+        waiter.cancel()
+        await _settle()
+        ctl.release("interactive", 0.01)
+        assert ctl.stats()["active"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.rag.analysis import PLAIN, Analyzer, Vocabulary, light_stem
+from src.rag.bm25_index import BM25Index
+from src.rag.config import settings
+from src.rag.models import Chunk
+from src.rag.postings import Postings
+from src.rag.shared_index import open_shared
+from tests.conftest import hashed_embed
+
+_TEXTS = [
+    "The databases are replicated to three regions",
+    "Configuring the café's cache policies",
+    "A guide to the query planner and its indexes",
+    "Migrations: running them against a replica",
+]
+
+
+def _chunks() -> list[Chunk]:
+    return [Chunk(chunk_id=f"c{i}", text=t, source=f"docs/f{i}.md") for i, t in enumerate(_TEXTS)]
+
+
+def test_analyzer_drops_stopwords_stems_and_folds_accents():
+    analyze = Analyzer()
+    assert analyze("The databases are replicated") == ["database", "replicated"]
+    assert analyze("Café policies, CAFÉS") == ["cafe", "policy", "cafe"]
+    assert analyze("don't") == []
+    assert PLAIN("The Café's policies") == ["the", "café", "s", "policies"]
+
+
+def test_light_stem_only_folds_plurals():
+    assert [light_stem(w) for w in ["queries", "indexes", "shards", "status", "class", "gas"]] == [
+        "query",
+        "indexe",
+        "shard",
+        "status",
+        "class",
+        "gas",
+    ]
+
+
+def test_vocabulary_interns_in_first_seen_order():
+    vocab = Vocabulary()
+    ids = vocab.intern(["b", "a", "b", "c"])
+    assert ids.dtype == np.int32
+    assert ids.tolist() == [0, 1, 0, 2]
+    assert vocab.lookup(["c", "zzz", "a"]) == [2, 1]
+    assert len(vocab) == 3
+
+
+def test_index_stores_int_ids_and_matches_inflected_queries():
+    idx = BM25Index()
+    idx.build(_chunks())
+    assert all(doc.dtype == np.int32 for doc in idx._corpus)
+    assert idx.vocab_size < len(PLAIN(" ".join(_TEXTS)))
+
+    assert [r.chunk.chunk_id for r in idx.search("which database regions")][:1] == ["c0"]
+    assert [r.chunk.chunk_id for r in idx.search("cafe caches")][:1] == ["c1"]
+    assert idx.search("the and of") == []  # nothing left after stopword removal
+
+
+def test_subset_postings_match_postings_of_the_subset():
+    idx = BM25Index(PLAIN)
+    idx.build(_chunks())
+    subset = idx.to_postings([3, 1])
+    expected = Postings.from_corpus([PLAIN(_TEXTS[3]), PLAIN(_TEXTS[1])])
+    assert set(subset.vocab) == set(expected.vocab)
+    for term, tid in expected.vocab.items():
+        got = subset.vocab[term]
+        lo, hi = subset.indptr[got], subset.indptr[got + 1]
+        elo, ehi = expected.indptr[tid], expected.indptr[tid + 1]
+        assert subset.doc_ids[lo:hi].tolist() == expected.doc_ids[elo:ehi].tolist()
+        assert subset.tfs[lo:hi].tolist() == expected.tfs[elo:ehi].tolist()
+    np.testing.assert_array_equal(subset.doc_len, expected.doc_len)
+
+
+@pytest.mark.parametrize("embed", [hashed_embed])
+def test_export_is_queried_with_the_analyzer_it_was_built_with(pipeline, tmp_path, monkeypatch):
+    pipeline.index_chunks(_chunks())
+    manifest = pipeline.export_shared(tmp_path / "shared", shards=0)
+    assert manifest["analyzer"] == Analyzer().config()
+
+    # Changing the settings afterwards must not change how the export is queried
+    monkeypatch.setattr(settings, "bm25_stemming", False)
+    gen = open_shared(tmp_path / "shared")
+    assert gen.bm25.analyzer == Analyzer()
+    assert [r.chunk.chunk_id for r in gen.bm25.search("databases")] == ["c0"]
+
+    # The analyzer is part of the manifest; one without it is not guessed at
+    del manifest["analyzer"]
+    (tmp_path / "shared" / "manifest.json").write_text(json.dumps(manifest))
+    with pytest.raises(KeyError):
+        open_shared(tmp_path / "shared")
@@ -1,8 +1,13 @@
+import asyncio
+import hashlib
+import io
 from unittest.mock import MagicMock, patch
 
 import pytest
+from fastapi import HTTPException, UploadFile
 from fastapi.testclient import TestClient
 
+from src.rag.jobs import IngestJob
 from src.rag.models import Citation, RAGResponse, ScoredChunk, Chunk
 
 
@@ -13,9 +18,10 @@ def client():
         mock_pipe.is_ready = True
         mock_pipe.chunk_count = 42
 
-        from src.rag.api import app
+        from src.rag.api import app, startup
 
         with TestClient(app, raise_server_exceptions=False) as c:
+            assert startup.wait(timeout=5)
             yield c, mock_pipe
 
 
@@ -60,3 +66,217 @@ def test_query_empty_string(client):
     c, _ = client
     resp = c.post("/query", json={"query": ""})
     assert resp.status_code == 422  # Validation error
+
+
+def test_query_gated_until_started(client):
+    c, _ = client
+    from src.rag.api import startup
+
+    startup.reset()
+    startup.advance("warming_models")
+    resp = c.post("/query", json={"query": "test"})
+    assert resp.status_code == 503
+    assert "Retry-After" in resp.headers
+
+    health = c.get("/health").json()
+    assert health["status"] == "not_ready"
+    assert health["startup"] == "warming_models"
+
+    startup.advance("ready")
+    assert c.get("/health").json()["status"] == "ready"
+
+
+def test_unknown_job_404(client):
+    c, _ = client
+    assert c.get("/jobs/does-not-exist").status_code == 404
+
+
+def test_metrics_exposes_stage_histograms(client):
+    c, _ = client
+    from src.rag.metrics import span
+
+    with span("bm25"):
+        pass
+    resp = c.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert "# TYPE documind_stage_seconds histogram" in resp.text
+    assert 'documind_stage_seconds_bucket{stage="bm25",le="+Inf"}' in resp.text
+
+
+def test_query_deadline_from_header_and_body(client):
+    c, mock_pipe = client
+    mock_pipe.query.return_value = RAGResponse(
+        answer="a", citations=[], chunks_used=[], query="q", degradations=["skipped_rerank"]
+    )
+    resp = c.post(
+        "/query",
+        json={"query": "q", "deadline_ms": 5000},
+        headers={"X-Request-Deadline-Ms": "200"},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["degradations"] == ["skipped_rerank"]
+    deadline = mock_pipe.query.call_args.kwargs["deadline"]
+    assert 0 < deadline.remaining() <= 0.2
+
+
+def test_query_deadline_exceeded_is_504(client):
+    from src.rag.deadline import DeadlineExceededError
+
+    c, mock_pipe = client
+    mock_pipe.query.side_effect = DeadlineExceededError("expired")
+    resp = c.post("/query", json={"query": "q", "deadline_ms": 1})
+    assert resp.status_code == 504
+
+
+def _busy_controller(queue: int, recent_service_s: float = 0.0):
+    """An admission controller with its single slot taken by an in-flight query."""
+    import asyncio
+
+    from src.rag.admission import AdmissionController, ClassLimits
+
+    limits = ClassLimits(max_concurrency=1, max_queue=queue, slo_s=1.0)
+    ctl = AdmissionController(1, {"interactive": limits, "batch": limits, "ingest": limits})
+    asyncio.run(ctl.acquire("interactive"))
+    if recent_service_s:
+        ctl.release("interactive", recent_service_s)
+        asyncio.run(ctl.acquire("interactive"))
+    return ctl
+
+
+def test_query_shed_with_429_when_queue_full(client):
+    c, mock_pipe = client
+    with patch("src.rag.api.admission", _busy_controller(queue=0)):
+        resp = c.post("/query", json={"query": "q"}, headers={"X-Request-Class": "batch"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    mock_pipe.query.assert_not_called()
+
+
+def test_query_shed_with_503_when_wait_exceeds_slo(client):
+    c, _ = client
+    with patch("src.rag.api.admission", _busy_controller(queue=8, recent_service_s=20.0)):
+        resp = c.post("/query", json={"query": "q"})
+        stats = c.get("/admission/stats").json()
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= 4
+    assert stats["classes"]["interactive"]["active"] == 1
+
+
+def test_unknown_request_class_rejected(client):
+    c, _ = client
+    resp = c.post("/query", json={"query": "q"}, headers={"X-Request-Class": "urgent"})
+    assert resp.status_code == 422
+
+
+def test_ingest_shed_when_job_backlog_full(client, monkeypatch):
+    from src.rag.config import settings
+
+    c, _ = client
+    monkeypatch.setattr(settings, "admission_max_ingest_jobs", 0)
+    resp = c.post("/ingest", json={})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"]
+
+
+def test_snapshot_hot_load(client, monkeypatch, tmp_path):
+    from src.rag.config import settings
+
+    c, mock_pipe = client
+    monkeypatch.setattr(settings, "snapshot_dir", tmp_path / "snaps")
+    monkeypatch.setattr(settings, "shared_index_dir", tmp_path / "shared")
+    mock_pipe.read_only = True
+    (tmp_path / "snaps").mkdir()
+    (tmp_path / "snaps" / "v2.tar").write_bytes(b"")
+    meta = {"manifest": {"generation": 2, "chunks": 7}, "created_at": 1}
+    with patch("src.rag.api.restore_snapshot", return_value=meta) as restore:
+        resp = c.post("/admin/snapshot", json={"source": "v2.tar"})
+    assert resp.status_code == 200
+    assert resp.json()["generation"] == 2
+    restore.assert_called_once_with((tmp_path / "snaps" / "v2.tar").resolve(), tmp_path / "shared")
+    mock_pipe.load_shared.assert_called_once_with(tmp_path / "shared")
+
+    assert c.post("/admin/snapshot", json={"source": "../outside.tar"}).status_code == 403
+    assert c.post("/admin/snapshot", json={"source": "https://x/s.tar"}).status_code == 400
+    assert c.post("/admin/snapshot", json={"source": "missing.tar"}).status_code == 404
+
+    # A writable index is never silently replaced by a read-only export
+    mock_pipe.read_only = False
+    assert c.post("/admin/snapshot", json={"source": "v2.tar"}).status_code == 409
+    assert mock_pipe.load_shared.call_count == 1
+
+
+def test_delete_documents(client):
+    c, mock_pipe = client
+    mock_pipe.read_only = False
+    mock_pipe.generation = 5
+    mock_pipe.delete_sources.return_value = 3
+    resp = c.delete("/documents", params={"source": ["a.md", "b.md"]})
+    assert resp.status_code == 200
+    assert resp.json() == {"removed": 3, "generation": 5}
+    mock_pipe.delete_sources.assert_called_once_with(["a.md", "b.md"])
+
+    mock_pipe.delete_sources.return_value = 0
+    assert c.delete("/documents", params={"source": "gone.md"}).status_code == 404
+    assert c.delete("/documents").status_code == 422
+
+
+def test_upload_streams_to_disk_and_queues_the_file(client, tmp_path):
+    c, mock_pipe = client
+    mock_pipe.read_only = False
+    mock_pipe.docs_dir = tmp_path
+    mock_pipe.reserve_content.return_value = None
+    queued = IngestJob(job_id="j1", kind="upload", tenant="default", paths=[], created_at=0)
+    with patch("src.rag.api.jobs.submit", return_value=queued) as submit:
+        resp = c.post("/upload", files={"file": ("../notes.md", b"# Notes\nhello")})
+    assert resp.status_code == 202
+    dest = tmp_path / "_uploads" / "notes.md"
+    assert dest.read_bytes() == b"# Notes\nhello"
+    assert [p.name for p in dest.parent.iterdir()] == ["notes.md"]
+    digest = mock_pipe.reserve_content.call_args.args[1]
+    assert digest == hashlib.sha256(b"# Notes\nhello").hexdigest()
+    submit.assert_called_once()
+
+
+def test_upload_of_indexed_content_is_skipped(client, tmp_path):
+    c, mock_pipe = client
+    mock_pipe.read_only = False
+    mock_pipe.docs_dir = tmp_path
+    mock_pipe.reserve_content.return_value = "docs/a.md"
+    with patch("src.rag.api.jobs.submit") as submit:
+        resp = c.post("/upload", files={"file": ("copy.md", b"same bytes")})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["status"] == "succeeded" and body["duplicate_of"] == "docs/a.md"
+    assert c.get(f"/jobs/{body['job_id']}").json()["duplicate_of"] == "docs/a.md"
+    assert list((tmp_path / "_uploads").iterdir()) == []
+    submit.assert_not_called()
+
+
+def test_upload_size_limit_leaves_nothing_behind(client, tmp_path, monkeypatch):
+    from src.rag import api
+
+    c, mock_pipe = client
+    mock_pipe.read_only = False
+    mock_pipe.docs_dir = tmp_path
+    monkeypatch.setattr(api, "MAX_UPLOAD_BYTES", 10)
+    monkeypatch.setattr(api, "UPLOAD_READ_BYTES", 4)
+    assert c.post("/upload", files={"file": ("big.md", b"x" * 11)}).status_code == 413
+
+    # Without a declared size the limit is enforced while streaming
+    partial = tmp_path / "big.part"
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(api._receive_upload(UploadFile(io.BytesIO(b"x" * 11)), partial))
+    assert e.value.status_code == 413
+    assert not partial.exists()
+    # Disk writes go through the thread pool, never the event loop
+    offloaded = []
+
+    async def spy(fn, *args):
+        offloaded.append(getattr(fn, "__name__", ""))
+        return fn(*args)
+
+    monkeypatch.setattr(api, "run_in_threadpool", spy)
+    upload = UploadFile(io.BytesIO(b"x" * 10))
+    assert asyncio.run(api._receive_upload(upload, partial))[1] == 10
+    assert offloaded == ["open", "write", "write", "write", "close"]
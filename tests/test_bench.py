@@ -0,0 +1,41 @@
+import numpy as np
+
+from bench.perf import compare, stub_embed, summarize, synthetic_corpus, synthetic_queries
+from src.rag.bm25_index import BM25Index
+
+
+def test_synthetic_corpus_is_deterministic():
+    a = synthetic_corpus(50, seed=3, words_per_chunk=20, vocab_size=500)
+    b = synthetic_corpus(50, seed=3, words_per_chunk=20, vocab_size=500)
+    assert [c.text for c in a] == [c.text for c in b]
+    assert len({c.chunk_id for c in a}) == 50
+    assert all(len(c.text.split()) == 20 for c in a)
+
+
+def test_synthetic_queries_hit_the_corpus():
+    chunks = synthetic_corpus(200, words_per_chunk=30, vocab_size=2000)
+    idx = BM25Index()
+    idx.build(chunks)
+    queries = synthetic_queries(chunks, 20)
+    assert sum(bool(idx.search(q, top_k=5)) for q in queries) == 20
+
+
+def test_stub_embed_is_normalized():
+    emb = stub_embed(["alpha beta", "alpha beta", "gamma"])
+    np.testing.assert_allclose(np.linalg.norm(emb, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(emb[0], emb[1])
+
+
+def test_summarize_percentiles():
+    stats = summarize([i / 1000 for i in range(1, 101)], wall_s=2.0)
+    assert stats["n"] == 100
+    assert stats["p50_ms"] == 50.5
+    assert stats["qps"] == 50.0
+
+
+def test_compare_flags_regressions():
+    baseline = {"runs": {"1000": {"bm25_search": {"p95_ms": 10.0, "qps": 100.0}}}}
+    report = {"runs": {"1000": {"bm25_search": {"p95_ms": 12.0, "qps": 95.0}}}}
+    rows = {r["metric"]: r for r in compare(report, baseline, threshold=0.10)}
+    assert rows["p95_ms"]["regression"] and rows["p95_ms"]["change_pct"] == 20.0
+    assert not rows["qps"]["regression"]  # -5% is within the threshold
@@ -0,0 +1,107 @@
+import gc
+
+import pytest
+
+from src.rag.chunk_store import ChunkStore, chunk_store_path
+from src.rag.models import Chunk
+from src.rag.segments import SegmentedBM25Index, TieredMergePolicy
+
+
+def _chunks(prefix: str, n: int, size: int = 20) -> list[Chunk]:
+    return [
+        Chunk(
+            chunk_id=f"{prefix}{i}",
+            text=f"{prefix} robot garden {i} " + "x" * size,
+            source=f"docs/{prefix}{i // 2}.md",
+            title="T",
+            page=i,
+            start_char=i * 10,
+            end_char=i * 10 + 9,
+        )
+        for i in range(n)
+    ]
+
+
+def test_rows_round_trip_in_order():
+    store = ChunkStore()
+    chunks = _chunks("a", 5)
+    ids = store.add(chunks)
+    assert ids.tolist() == [1, 2, 3, 4, 5]
+    assert store.add(_chunks("b", 2)).tolist() == [6, 7]
+    assert store.get_many(ids[::-1]) == chunks[::-1]
+    assert store.get(3) == chunks[2]
+    meta = store.metadata(ids)
+    assert [m.chunk_id for m in meta] == [c.chunk_id for c in chunks]
+    assert all(m.text == "" and m.start_char == c.start_char for m, c in zip(meta, chunks))
+    with pytest.raises(KeyError):
+        store.get_many([1, 99])
+
+
+def test_ids_are_not_reused_after_the_newest_rows_are_deleted(tmp_path):
+    store = ChunkStore(tmp_path / "chunks.db")
+    store.add(_chunks("a", 3))
+    store.collect(orphans=True)  # nothing refers to them: every row goes, the newest too
+    assert len(store) == 0
+    assert store.add(_chunks("b", 2)).tolist() == [4, 5]
+    assert ChunkStore(tmp_path / "chunks.db").add(_chunks("c", 1)).tolist() == [6]
+
+
+def test_cache_is_bounded_and_keeps_recent_chunks():
+    store = ChunkStore(cache_bytes=3 * 1500)
+    ids = store.add(_chunks("a", 10, size=1000))
+    store.get_many(ids)
+    assert store.stats()["cached_chunks"] == 3
+    assert store.cache_bytes <= 3 * 1500
+    store.get_many(ids[-3:])  # the three most recent are served from memory
+    assert store.stats()["hit_rate"] == pytest.approx(3 / 13, abs=1e-3)
+    store.get_many(ids, cache=False)
+    assert store.stats()["cached_chunks"] == 3
+
+
+def test_rows_are_deleted_once_no_segment_refers_to_them(tmp_path):
+    path = tmp_path / "bm25.json"
+    store = ChunkStore(chunk_store_path(path))
+    index = SegmentedBM25Index(store=store)
+    index.build(_chunks("a", 6))
+    index.save(path)
+    assert len(store) == 6
+
+    # Replacing a source keeps the old rows while a segment still holds them
+    index = index.updated(add=_chunks("b", 2), delete_sources=["docs/a0.md"])
+    index.save(path)
+    assert len(store) == 8
+
+    # A merge copies row ids, not text; the inputs' rows then go away
+    plan = index.plan_merge(TieredMergePolicy(segments_per_tier=2, floor_docs=100))
+    index = index.with_merge(plan, plan.run())
+    del plan
+    gc.collect()
+    index.save(path)
+    assert len(store) == 6
+    assert sorted(c.chunk_id for c in index.chunks) == ["a2", "a3", "a4", "a5", "b0", "b1"]
+
+
+def test_load_sweeps_rows_of_unsaved_segments(tmp_path):
+    path = tmp_path / "bm25.json"
+    chunks = {c.chunk_id: c for c in _chunks("a", 4)}
+    index = SegmentedBM25Index(store=ChunkStore(chunk_store_path(path)))
+    index.build(list(chunks.values()))
+    index.save(path)
+    unsaved = index.updated(add=_chunks("b", 3))  # noqa: F841 - rows written, segment never saved
+
+    loaded = SegmentedBM25Index()
+    loaded.load(path)
+    assert loaded.store.path == chunk_store_path(path)
+    assert len(loaded.store) == 4
+    hits = loaded.search("robot garden", top_k=10)
+    assert sorted(h.chunk.chunk_id for h in hits) == sorted(chunks)
+    assert all(h.chunk == chunks[h.chunk.chunk_id] for h in hits)
+
+
+def test_segments_do_not_hold_chunk_text():
+    chunks = _chunks("a", 200, size=2000)
+    index = SegmentedBM25Index(store=ChunkStore(cache_bytes=0))
+    index.build(chunks)
+    assert index.memory_bytes < sum(len(c.text) for c in chunks) / 5
+    hit = index.search("robot", top_k=1)[0]
+    assert hit.chunk == next(c for c in chunks if c.chunk_id == hit.chunk.chunk_id)
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from src.rag.analysis import Analyzer
+from src.rag.codec import BLOCK_SIZE, CompressedPostings, vbyte_decode, vbyte_encode
+from src.rag.config import settings
+from src.rag.models import Chunk, QueryFilters
+from src.rag.postings import Postings, bm25l_scores
+from src.rag.segments import SegmentedBM25Index, segments_dir
+
+
+def _postings(docs: int = 600, seed: int = 0) -> Postings:
+    rng = np.random.default_rng(seed)
+    corpus = [
+        [f"t{int(w)}" for w in rng.zipf(1.4, size=rng.integers(1, 40)) if w < 3000]
+        for _ in range(docs)
+    ]
+    return Postings.from_corpus(corpus)
+
+
+def test_vbyte_round_trip():
+    values = np.array([0, 1, 127, 128, 16383, 16384, 2**21, 2**28 - 1, 2**32 - 1])
+    encoded = vbyte_encode(values)
+    assert len(encoded) == 1 + 1 + 1 + 2 + 2 + 3 + 4 + 4 + 5
+    assert vbyte_decode(encoded).tolist() == values.tolist()
+    assert vbyte_decode(vbyte_encode(np.zeros(0, np.int64))).tolist() == []
+
+
+def test_every_term_decodes_to_the_raw_postings():
+    raw = _postings()
+    packed = CompressedPostings.from_postings(raw)
+    assert packed.df.max() > 2 * BLOCK_SIZE  # some terms span several blocks
+    for tid in range(len(raw.vocab)):
+        docs, tfs = packed.term_postings(tid)
+        want_docs, want_tfs = raw.term_postings(tid)
+        np.testing.assert_array_equal(docs, want_docs)
+        np.testing.assert_array_equal(tfs, want_tfs)
+    full = packed.decode()
+    np.testing.assert_array_equal(full.indptr, raw.indptr)
+    np.testing.assert_array_equal(full.doc_ids, raw.doc_ids)
+    np.testing.assert_array_equal(full.tfs, raw.tfs)
+    assert packed.nbytes < (raw.indptr.nbytes + raw.doc_ids.nbytes + raw.tfs.nbytes) / 1.5
+
+
+def test_candidates_decode_only_their_blocks():
+    raw = _postings()
+    packed = CompressedPostings.from_postings(raw)
+    tid = int(np.argmax(packed.df))
+    candidates = np.array([3, 7, 11], dtype=np.int64)
+    docs, _ = packed.term_postings(tid, candidates)
+    assert len(docs) <= BLOCK_SIZE < packed.df[tid]
+    all_docs, _ = raw.term_postings(tid)
+    assert set(np.intersect1d(all_docs, candidates)) <= set(docs.tolist())
+    assert packed.term_postings(tid, np.zeros(0, dtype=np.int64))[0].tolist() == []
+
+
+def test_scores_match_uncompressed_and_survive_save_load(tmp_path):
+    raw = _postings()
+    packed = CompressedPostings.from_postings(raw)
+    packed.save(tmp_path / "p.npz")
+    loaded = CompressedPostings.load(tmp_path / "p.npz")
+    np.testing.assert_array_equal(loaded.block_last, packed.block_last)
+    query = ["t1", "t2", "t7", "t40", "missing"]
+    np.testing.assert_allclose(bm25l_scores(loaded, query), bm25l_scores(raw, query))
+
+    raw.save(tmp_path / "raw")
+    raw_bytes = sum(f.stat().st_size for f in (tmp_path / "raw").iterdir())
+    assert (tmp_path / "p.npz").stat().st_size < raw_bytes / 4
+
+
+def _chunks(n: int) -> list[Chunk]:
+    words = ["python", "pasta", "robot", "garden", "shard", "tomato"]
+    return [
+        Chunk(
+            chunk_id=f"c{i}",
+            text=f"{words[i % 6]} {words[(i * 5) % 6]} gardens note {i}",
+            source=f"docs/f{i // 4}.md",
+        )
+        for i in range(n)
+    ]
+
+
+def test_segments_load_postings_with_their_analyzer(tmp_path, monkeypatch):
+    path = tmp_path / "bm25.json"
+    index = SegmentedBM25Index()
+    index.build(_chunks(300))
+    index.save(path)
+    names = sorted(p.name.split(".", 1)[1] for p in segments_dir(path).iterdir())
+    assert names == ["ids.npy", "postings.npz"]
+
+    # Changing the analyzer settings must not change how stored postings are queried
+    monkeypatch.setattr(settings, "bm25_stemming", False)
+    loaded = SegmentedBM25Index()
+    loaded.load(path)
+    assert loaded.analyzer == Analyzer()
+    assert [r.chunk.chunk_id for r in loaded.search("gardens robot")] == [
+        r.chunk.chunk_id for r in index.search("gardens robot")
+    ]
+
+
+def test_filtered_search_scores_like_unfiltered(tmp_path):
+    index = SegmentedBM25Index()
+    index.build(_chunks(800))
+    filters = QueryFilters(source_prefix="docs/f1")  # f1.md, f10.md .. f199.md
+    hits = index.search("python garden", top_k=1000, filters=filters)
+    everything = {r.chunk.chunk_id: r.score for r in index.search("python garden", top_k=1000)}
+    assert hits and all(r.chunk.source.startswith("docs/f1") for r in hits)
+    for r in hits:
+        assert r.score == pytest.approx(everything[r.chunk.chunk_id])
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from src.rag import deadline as deadline_mod
+from src.rag import pipeline as pipeline_mod
+from src.rag.config import settings
+from src.rag.deadline import Deadline, DeadlineExceededError
+from src.rag.models import Chunk
+from src.rag.resilience import LLMDeadlineExceededError
+
+# Typical stage costs the degradation policy plans against
+COSTS = {"retrieve": 0.05, "rerank": 0.2, "generate": 1.0}
+
+
+@pytest.fixture
+def pipeline(pipeline, monkeypatch):
+    monkeypatch.setattr(settings, "context_packing", False)
+    monkeypatch.setattr(
+        deadline_mod, "expected_seconds", lambda *stages: sum(COSTS.get(s, 0) for s in stages)
+    )
+    calls: dict[str, object] = {}
+
+    def fake_rerank(q, c, top_k):
+        calls["rerank"] = True
+        return c[:top_k]
+
+    def fake_generate(q, c, deadline=None):
+        calls["context"] = c
+        return "answer [1]", []
+
+    monkeypatch.setattr(pipeline_mod, "rerank", fake_rerank)
+    monkeypatch.setattr(pipeline_mod, "generate", fake_generate)
+    pipeline.index_chunks(
+        [Chunk(chunk_id=f"c{i}", text=f"alpha doc {i}", source=f"{i}.md") for i in range(12)]
+    )
+    return pipeline, calls
+
+
+def test_no_deadline_runs_every_stage(pipeline):
+    pipe, calls = pipeline
+    response = pipe.query("alpha", top_k=4)
+    assert response.degradations == []
+    assert calls["rerank"] and len(calls["context"]) == 4
+
+
+def test_generous_deadline_degrades_nothing(pipeline):
+    pipe, calls = pipeline
+    response = pipe.query("alpha", top_k=4, deadline=Deadline.after_ms(10_000))
+    assert response.degradations == []
+    assert calls["rerank"]
+
+
+def test_tight_deadline_reduces_depth_and_skips_rerank(pipeline):
+    pipe, calls = pipeline
+    # Enough for retrieval + generation, not for the cross-encoder as well
+    response = pipe.query("alpha", top_k=4, deadline=Deadline.after_ms(1150))
+    assert response.degradations == ["reduced_depth", "skipped_rerank"]
+    assert "rerank" not in calls
+    assert len(calls["context"]) == 4
+
+
+def test_very_tight_deadline_degrades_in_order(pipeline, monkeypatch):
+    pipe, calls = pipeline
+
+    def too_slow(q, c, deadline=None):
+        calls["context"] = c
+        raise LLMDeadlineExceededError("slow")
+
+    monkeypatch.setattr(pipeline_mod, "generate", too_slow)
+    response = pipe.query("alpha", top_k=4, deadline=Deadline.after_ms(100))
+    assert response.degradations == [
+        "reduced_depth",
+        "skipped_rerank",
+        "shortened_context",
+        "no_answer",
+    ]
+    assert len(calls["context"]) == 2
+    assert len(response.citations) == 2  # sources still returned
+    assert "time budget" in response.answer
+
+
+def test_expired_deadline_raises(pipeline):
+    pipe, _ = pipeline
+    expired = Deadline(time.monotonic() - 1)
+    with pytest.raises(DeadlineExceededError):
+        pipe.query("alpha", deadline=expired)
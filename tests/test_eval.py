@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from eval.dataset import GoldenExample, save_golden_set
+from eval.metrics import JudgeCache, _llm_judge
+from eval.runner import run_evaluation
+from src.rag import llm
+from src.rag.config import settings
+from src.rag.llm import LLMRequest, StubBackend
+from src.rag.models import Chunk, Citation, RAGResponse, ScoredChunk
+
+
+class _RateLimitError(Exception):
+    code = 429
+
+
+class _CountingStub(StubBackend):
+    def __init__(self) -> None:
+        super().__init__(latency_ms=0, tokens_per_s=0)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, request: LLMRequest) -> str:
+        with self._lock:
+            self.calls += 1
+        return super().complete(request)
+
+
+class _SlowPipeline:
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+
+    def query(self, question: str) -> RAGResponse:
+        time.sleep(self.delay_s)
+        chunk = Chunk(chunk_id="c", text="text", source="docs/a.md", title="A")
+        return RAGResponse(
+            answer=f"Answer to {question} [1].",
+            citations=[Citation(ref_id=1, source="docs/a.md", title="A")],
+            chunks_used=[ScoredChunk(chunk=chunk, score=1.0)],
+            query=question,
+        )
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(settings, "eval_retry_base_delay_s", 0.0)
+    stub = _CountingStub()
+    llm.set_backend(stub)
+    yield stub
+    llm.set_backend(None)
+
+
+@pytest.fixture
+def golden(tmp_path):
+    path = tmp_path / "golden.jsonl"
+    examples = [
+        GoldenExample(question=f"q{i}", expected_answer="a", expected_sources=["docs/a.md"])
+        for i in range(8)
+    ]
+    save_golden_set(examples, path)
+    return path
+
+
+class _FlakyJudge(StubBackend):
+    def __init__(self, errors: list[Exception]) -> None:
+        super().__init__(latency_ms=0, tokens_per_s=0)
+        self.errors = errors
+        self.calls = 0
+
+    def complete(self, request: LLMRequest) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "0.8"
+
+
+@pytest.fixture
+def no_fallback(monkeypatch):
+    monkeypatch.setattr(settings, "eval_retry_base_delay_s", 0.0)
+    monkeypatch.setattr(settings, "llm_fallback_model", "")
+    monkeypatch.setattr(settings, "llm_hedge", False)
+    yield
+    llm.set_backend(None)
+
+
+def test_judge_retries_rate_limits_then_succeeds(no_fallback):
+    judge = _FlakyJudge([_RateLimitError("429 RESOURCE_EXHAUSTED")] * 2)
+    llm.set_backend(judge)
+    assert _llm_judge("Rate this.", api_key="") == 0.8
+    assert judge.calls == 3
+
+
+def test_judge_does_not_retry_other_errors(no_fallback):
+    judge = _FlakyJudge([ValueError("bad request")])
+    llm.set_backend(judge)
+    with pytest.raises(ValueError):
+        _llm_judge("Rate this.", api_key="")
+    assert judge.calls == 1
+
+
+def test_judge_never_falls_back_to_another_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "eval_max_retries", 0)
+    monkeypatch.setattr(settings, "llm_fallback_model", "fallback-model")
+    monkeypatch.setattr(settings, "llm_hedge", True)
+    monkeypatch.setattr(settings, "llm_hedge_after_ms", 0)
+    models: list[str] = []
+
+    class _Judge(StubBackend):
+        def complete(self, request: LLMRequest) -> str:
+            models.append(request.model)
+            raise _RateLimitError("429 RESOURCE_EXHAUSTED")
+
+    llm.set_backend(_Judge(latency_ms=0, tokens_per_s=0))
+    cache = JudgeCache(tmp_path / "judge.json")
+    try:
+        with pytest.raises(_RateLimitError):
+            _llm_judge("Rate this.", api_key="", cache=cache)
+    finally:
+        llm.set_backend(None)
+    assert models == ["gemini-2.5-flash"]  # neither hedged nor re-asked elsewhere
+    assert len(cache) == 0
+
+
+def test_judge_cache_skips_repeat_calls(backend, tmp_path):
+    cache = JudgeCache(tmp_path / "judge.json")
+    first = _llm_judge("Rate this.", api_key="", cache=cache)
+    assert _llm_judge("Rate this.", api_key="", cache=cache) == first
+    assert backend.calls == 1
+    _llm_judge("Rate this.", api_key="", model="other-judge", cache=cache)
+    assert backend.calls == 2
+
+    cache.save()
+    reloaded = JudgeCache(tmp_path / "judge.json")
+    assert len(reloaded) == 2
+    assert reloaded.get("Rate this.", "gemini-2.5-flash") == first
+
+
+def test_run_evaluation_is_concurrent_and_cached(backend, golden, tmp_path):
+    cache_path = tmp_path / "judge.json"
+    pipeline = _SlowPipeline(delay_s=0.05)
+
+    report = run_evaluation(
+        pipeline, golden_path=golden, concurrency=8, cache=JudgeCache(cache_path)
+    )
+    assert [s.question for s in report.scores] == [f"q{i}" for i in range(8)]
+    assert report.wall_clock_s < 8 * 0.05
+    assert backend.calls == 16  # faithfulness + relevance per example
+
+    rerun = run_evaluation(
+        pipeline, golden_path=golden, concurrency=8, cache=JudgeCache(cache_path)
+    )
+    assert backend.calls == 16
+    assert rerun.judge_cache_hits == 16
+    summary = rerun.summary()
+    assert summary["judge_cache"] == {"hits": 16, "misses": 0}
+    assert summary["avg_faithfulness"] == report.summary()["avg_faithfulness"]
@@ -0,0 +1,66 @@
+import numpy as np
+
+from src.rag.fusion import comb_scores, fuse, minmax_normalize, rrf_scores, top_k_indices
+from src.rag.models import Chunk, ScoredChunk
+
+
+def _scored(ids: list[str], scores: list[float], origin: str) -> list[ScoredChunk]:
+    return [
+        ScoredChunk(
+            chunk=Chunk(chunk_id=cid, text=f"doc {cid}", source="s"), score=s, origin=origin
+        )
+        for cid, s in zip(ids, scores)
+    ]
+
+
+def test_rrf_scores_scatter_add():
+    scores = rrf_scores([np.array([0, 1]), np.array([1, 2])], num_docs=3, k=60)
+    assert scores[1] == 1 / 61 + 1 / 62
+    assert scores[0] == 1 / 61
+    assert scores[2] == 1 / 62
+
+
+def test_rrf_weights():
+    scores = rrf_scores([np.array([0]), np.array([1])], num_docs=2, k=60, weights=[1.0, 3.0])
+    assert scores[1] > scores[0]
+
+
+def test_minmax_constant():
+    assert minmax_normalize(np.array([2.0, 2.0])).tolist() == [1.0, 1.0]
+
+
+def test_combmnz_rewards_overlap():
+    rankings = [np.array([0, 1]), np.array([1, 2])]
+    raw = [np.array([10.0, 5.0]), np.array([0.9, 0.1])]
+    total = comb_scores(rankings, raw, num_docs=3)
+    mnz = comb_scores(rankings, raw, num_docs=3, mnz=True)
+    assert mnz[1] == 2 * total[1]
+    assert mnz[0] == total[0]
+
+
+def test_top_k_indices_order_and_ties():
+    scores = np.array([0.5, 0.9, 0.5, 0.1])
+    assert top_k_indices(scores, 3).tolist() == [1, 0, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 0, 2, 3]
+
+
+def test_top_k_indices_ties_at_the_cut_keep_lower_index():
+    scores = np.array([1.0] * 50 + [2.0])
+    assert top_k_indices(scores, 4).tolist() == [50, 0, 1, 2]
+    candidates = np.array([40, 7, 3, 50])
+    assert top_k_indices(scores, 2, candidates).tolist() == [50, 3]
+
+
+def test_fuse_matches_rank_order():
+    bm25 = _scored(["a", "b"], [3.0, 1.0], "bm25")
+    vector = _scored(["b", "c"], [0.9, 0.2], "vector")
+    fused = fuse([bm25, vector], method="rrf", k=60)
+    assert [sc.chunk.chunk_id for sc in fused] == ["b", "a", "c"]
+    assert all(sc.origin == "rrf" for sc in fused)
+
+
+def test_fuse_combsum_top_k():
+    bm25 = _scored(["a", "b", "c"], [3.0, 2.0, 1.0], "bm25")
+    fused = fuse([bm25, []], method="combsum", top_k=2)
+    assert [sc.chunk.chunk_id for sc in fused] == ["a", "b"]
+    assert fused[0].origin == "combsum"
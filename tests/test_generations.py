@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+
+from src.rag import vector_store
+from src.rag.bm25_index import BM25Index
+from src.rag.generations import GenerationHolder, IndexGeneration
+from src.rag.models import Chunk
+from src.rag.pipeline import RAGPipeline
+
+
+class _FakeVector:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.dropped = False
+
+    def drop(self) -> None:
+        self.dropped = True
+
+
+def _generation(number: int) -> IndexGeneration:
+    bm25 = BM25Index()
+    bm25.build([Chunk(chunk_id=f"g{number}", text="hello", source="s")])
+    return IndexGeneration(number, bm25, _FakeVector(f"c{number}"))  # type: ignore[arg-type]
+
+
+def test_old_generation_reclaimed_after_readers_finish():
+    holder = GenerationHolder()
+    first = _generation(1)
+    holder.publish(first)
+
+    with holder.reader() as pinned:
+        assert pinned is first
+        holder.publish(_generation(2))
+        # Swap is visible immediately, but the pinned generation stays alive
+        assert holder.current.number == 2
+        assert not first.vector.dropped
+    assert first.vector.dropped
+    assert first.readers == 0
+
+
+def test_retire_without_readers_reclaims_immediately():
+    holder = GenerationHolder()
+    first = _generation(1)
+    holder.publish(first)
+    holder.publish(_generation(2))
+    assert first.vector.dropped
+
+
+def test_reader_without_generation():
+    with GenerationHolder().reader() as gen:
+        assert gen is None
+
+
+def test_reindex_publishes_new_generation(pipeline, tmp_path):
+    pipeline.index_chunks([Chunk(chunk_id="a", text="alpha doc", source="a.md")])
+    assert pipeline.generation == 1
+
+    doc = tmp_path / "b.txt"
+    doc.write_text("beta document", encoding="utf-8")
+    assert pipeline.ingest_files([doc]) == 1
+    assert pipeline.generation == 2
+    assert pipeline.chunk_count == 2  # kept "a" + embedded "b"
+
+    reloaded = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
+    reloaded.load_indexes()
+    assert reloaded.generation == 2
+    assert reloaded.chunk_count == 2
+    assert Path(tmp_path / "bm25.json").exists()
+
+
+def test_publish_writes_only_the_changed_vector_rows(pipeline, tmp_path):
+    pipeline.index_chunks(
+        [
+            Chunk(chunk_id="a", text="alpha doc", source="a.md"),
+            Chunk(chunk_id="b", text="beta doc", source="b.md"),
+        ]
+    )
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "b.md").write_text("beta rewritten", encoding="utf-8")
+    store = pipeline._vectors
+
+    with pipeline._generations.reader() as pinned:
+        pipeline.ingest_files([tmp_path / "docs" / "b.md"])
+        # One collection: the old row is marked deleted, not copied around
+        assert store.count == 3
+        old = {r.chunk.chunk_id for r in pinned.vector.search("doc", top_k=10)}
+        current = pipeline._generations.current.vector.search("doc", top_k=10)
+        assert old == {"a", "b"}
+        assert len(current) == 2 and "b" not in {r.chunk.chunk_id for r in current}
+    # The old generation is gone, so nothing can see the deleted row any more
+    assert store.count == pipeline.chunk_count == 2
+
+
+def test_load_discards_vector_rows_of_an_unpublished_build(pipeline, tmp_path):
+    pipeline.index_chunks([Chunk(chunk_id="a", text="alpha doc", source="a.md")])
+    staged = pipeline._vectors.stage(2, base=pipeline._generations.current.vector)
+    staged.delete_sources(["a.md"])
+    staged.add_chunks([Chunk(chunk_id="z", text="zeta doc", source="z.md")])
+
+    reloaded = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
+    reloaded.load_indexes()
+    hits = reloaded._generations.current.vector.search("doc", top_k=10)
+    assert [r.chunk.chunk_id for r in hits] == ["a"]
+    assert reloaded.chunk_count == reloaded._vectors.count == 1
+
+
+def test_load_adopts_vectors_stored_without_generations(pipeline, embed, tmp_path):
+    # What an index saved before generations existed looks like on disk
+    chunk = Chunk(chunk_id="a", text="alpha doc", source="a.md")
+    (tmp_path / "bm25.json").write_text(json.dumps({"chunks": [chunk.model_dump()]}))
+    legacy = vector_store.VectorStore()
+    legacy._collection.add(
+        ids=["a"],
+        documents=[chunk.text],
+        metadatas=[{"source": chunk.source}],
+        embeddings=embed([chunk.text]).tolist(),
+    )
+
+    pipeline.load_indexes()
+    hits = pipeline._generations.current.vector.search("doc", top_k=10)
+    assert [(r.chunk.chunk_id, r.chunk.source) for r in hits] == [("a", "a.md")]
+    assert pipeline.chunk_count == 1
+
+
+def test_closed_pipeline_reopens_chroma_on_next_use(pipeline):
+    pipeline.index_chunks([Chunk(chunk_id="a", text="alpha doc", source="a.md")])
+    pipeline.close()
+    hits = pipeline._generations.current.vector.search("doc", top_k=10)
+    assert [r.chunk.chunk_id for r in hits] == ["a"]
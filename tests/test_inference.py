@@ -0,0 +1,171 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.rag import embeddings, inference, reranker
+from src.rag.config import settings
+from src.rag.inference import DynamicBatcher, InferenceClient, InferenceServer
+
+
+def _fake_embed(texts: list[str]) -> np.ndarray:
+    return np.asarray([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def _fake_score(pairs: list[tuple[str, str]]) -> np.ndarray:
+    return np.asarray([len(set(q.split()) & set(p.split())) for q, p in pairs], np.float32)
+
+
+def test_batcher_coalesces_concurrent_calls():
+    calls: list[int] = []
+
+    def fn(items: list[int]) -> list[int]:
+        calls.append(len(items))
+        return [i * 2 for i in items]
+
+    batcher = DynamicBatcher("test", fn, max_batch=64, max_wait_ms=50)
+    results: dict[int, list[int]] = {}
+    start = threading.Barrier(8)
+
+    def worker(n: int) -> None:
+        start.wait()
+        results[n] = batcher.run([n])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+
+    assert results == {n: [n * 2] for n in range(8)}
+    assert sum(calls) == 8
+    assert len(calls) < 8  # at least some requests shared a forward pass
+    assert batcher.batch_sizes.snapshot()["count"] == len(calls)
+
+
+def test_batcher_respects_max_batch():
+    calls: list[int] = []
+
+    def fn(items: list[int]) -> list[int]:
+        calls.append(len(items))
+        return items
+
+    batcher = DynamicBatcher("test", fn, max_batch=4, max_wait_ms=20)
+    assert batcher.run(list(range(10))) == list(range(10))
+    batcher.stop()
+    assert max(calls) <= 4
+
+
+def test_batcher_propagates_errors():
+    def fn(items: list[int]) -> list[int]:
+        raise ValueError("boom")
+
+    batcher = DynamicBatcher("test", fn, max_batch=8, max_wait_ms=1)
+    with pytest.raises(ValueError, match="boom"):
+        batcher.run([1])
+    batcher.stop()
+
+
+def test_batcher_fails_items_without_results():
+    batcher = DynamicBatcher("test", lambda items: items[:1], max_batch=8, max_wait_ms=20)
+    futures = batcher.submit_many([1, 2, 3])
+    assert futures[0].result(timeout=1) == 1
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError, match="1 results for 3 items"):
+            future.result(timeout=1)
+    batcher.stop()
+
+
+@pytest.fixture
+def server(tmp_path):
+    srv = InferenceServer(
+        tmp_path / "inference.sock", _fake_embed, _fake_score, max_batch=32, max_wait_ms=20
+    )
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+def test_client_roundtrip(server):
+    client = InferenceClient(server.socket_path)
+    emb = client.embed(["a", "abc"])
+    np.testing.assert_array_equal(emb, _fake_embed(["a", "abc"]))
+    scores = client.score([("red fox", "a red fox"), ("red fox", "blue whale")])
+    np.testing.assert_array_equal(scores, [2.0, 0.0])
+    assert client.embed([]).shape[0] == 0
+
+    stats = client.stats()
+    client.close()
+    assert stats["embed"]["batch_size"]["count"] >= 1
+    assert stats["score"]["queue_depth"] == 0
+
+
+def test_concurrent_clients_share_batches(server):
+    client = InferenceClient(server.socket_path)
+    out: dict[int, np.ndarray] = {}
+
+    def worker(n: int) -> None:
+        out[n] = client.embed(["x" * n])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    client.close()
+
+    assert {n: float(v[0, 0]) for n, v in out.items()} == {n: float(n) for n in range(1, 9)}
+    hist = server.embedder.batch_sizes.snapshot()
+    assert hist["sum"] == 8
+    assert hist["count"] < 8
+
+
+def test_client_reconnects_after_server_restart(tmp_path):
+    path = tmp_path / "inference.sock"
+    srv = InferenceServer(path, _fake_embed, _fake_score, max_wait_ms=0)
+    srv.start()
+    client = InferenceClient(path)
+    client.embed(["a"])
+    srv.stop()
+
+    srv = InferenceServer(path, _fake_embed, _fake_score, max_wait_ms=0)
+    srv.start()
+    try:
+        time.sleep(0.05)
+        np.testing.assert_array_equal(client.embed(["ab"]), _fake_embed(["ab"]))
+    finally:
+        client.close()
+        srv.stop()
+
+
+def test_timed_out_call_does_not_leave_a_stale_reply(tmp_path):
+    def slow_embed(texts: list[str]) -> np.ndarray:
+        if texts == ["slow"]:
+            time.sleep(0.8)
+        return _fake_embed(texts)
+
+    srv = InferenceServer(tmp_path / "inference.sock", slow_embed, _fake_score, max_wait_ms=0)
+    srv.start()
+    client = InferenceClient(srv.socket_path, timeout_s=0.5)
+    try:
+        with pytest.raises(TimeoutError):
+            client.embed(["slow"])
+        np.testing.assert_array_equal(client.embed(["ab"]), _fake_embed(["ab"]))
+        time.sleep(0.4)  # the abandoned reply is ready by now
+        np.testing.assert_array_equal(client.embed(["abc"]), _fake_embed(["abc"]))
+    finally:
+        client.close()
+        srv.stop()
+
+
+def test_models_route_through_server(server, monkeypatch):
+    monkeypatch.setattr(settings, "inference_socket", server.socket_path)
+    monkeypatch.setattr(inference, "_client", None)
+    monkeypatch.setattr(embeddings, "_get_model", lambda: pytest.fail("model loaded locally"))
+    monkeypatch.setattr(reranker, "_get_model", lambda: pytest.fail("model loaded locally"))
+
+    np.testing.assert_array_equal(embeddings.embed_query("abcd"), [4.0, 1.0])
+    np.testing.assert_array_equal(reranker.score_pairs([("red fox", "the red fox")]), [2.0])
+    inference.get_client().close()
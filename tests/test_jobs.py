@@ -0,0 +1,103 @@
+import time
+from pathlib import Path
+
+from src.rag.jobs import IngestJobQueue
+
+
+class _FakePipeline:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list[Path]]] = []
+
+    def ingest(self, docs_dir, progress=None):
+        self.calls.append(("directory", [docs_dir]))
+        progress.file_done(docs_dir / "a.md", 3)
+        progress.chunks_embedded(3)
+        return 3
+
+    def ingest_files(self, paths, progress=None):
+        self.calls.append(("upload", list(paths)))
+        for p in paths:
+            progress.file_done(p, 2)
+        progress.chunks_embedded(2 * len(paths))
+        return 2 * len(paths)
+
+
+def _drain(queue: IngestJobQueue, job_ids: list[str]) -> None:
+    queue.start()
+    try:
+        for _ in range(200):
+            if all(queue.get(j).status in ("succeeded", "failed") for j in job_ids):
+                return
+            time.sleep(0.01)
+        raise AssertionError("jobs did not finish")
+    finally:
+        queue.stop()
+
+
+def test_uploads_are_coalesced():
+    pipe = _FakePipeline()
+    queue = IngestJobQueue()
+    a = queue.submit(pipe, "upload", [Path("docs/_uploads/a.md")])
+    b = queue.submit(pipe, "upload", [Path("docs/_uploads/b.md")])
+    _drain(queue, [a.job_id, b.job_id])
+
+    assert pipe.calls == [("upload", [Path("docs/_uploads/a.md"), Path("docs/_uploads/b.md")])]
+    job = queue.get(a.job_id)
+    assert job.status == "succeeded"
+    assert job.files_processed == 2
+    assert job.chunks_embedded == 4
+    assert job.coalesced_with == [b.job_id]
+
+
+def test_directory_jobs_run_in_order():
+    pipe = _FakePipeline()
+    other = _FakePipeline()
+    queue = IngestJobQueue()
+    d = queue.submit(pipe, "directory", [Path("docs")])
+    u1 = queue.submit(pipe, "upload", [Path("docs/_uploads/x.md")])
+    u2 = queue.submit(other, "upload", [Path("t/_uploads/y.md")])
+    _drain(queue, [d.job_id, u1.job_id, u2.job_id])
+
+    assert [c[0] for c in pipe.calls] == ["directory", "upload"]
+    assert len(other.calls) == 1
+    assert queue.get(d.job_id).chunks_indexed == 3
+
+
+def test_uploads_after_a_directory_job_are_not_coalesced_past_it():
+    pipe = _FakePipeline()
+    other = _FakePipeline()
+    queue = IngestJobQueue()
+    u1 = queue.submit(pipe, "upload", [Path("docs/_uploads/a.md")])
+    o = queue.submit(other, "upload", [Path("t/_uploads/o.md")])
+    u2 = queue.submit(pipe, "upload", [Path("docs/_uploads/b.md")])
+    d = queue.submit(pipe, "directory", [Path("docs")])
+    u3 = queue.submit(pipe, "upload", [Path("docs/_uploads/c.md")])
+    _drain(queue, [u1.job_id, o.job_id, u2.job_id, d.job_id, u3.job_id])
+
+    assert pipe.calls == [
+        ("upload", [Path("docs/_uploads/a.md"), Path("docs/_uploads/b.md")]),
+        ("directory", [Path("docs")]),
+        ("upload", [Path("docs/_uploads/c.md")]),
+    ]
+    assert len(other.calls) == 1
+
+
+def test_failed_job_reports_error():
+    class _Broken(_FakePipeline):
+        def ingest_files(self, paths, progress=None):
+            raise OSError("disk full")
+
+    queue = IngestJobQueue()
+    job = queue.submit(_Broken(), "upload", [Path("x.md")])
+    _drain(queue, [job.job_id])
+    assert queue.get(job.job_id).status == "failed"
+    assert "disk full" in queue.get(job.job_id).error
+
+
+def test_pending_jobs_are_tracked_per_tenant():
+    queue = IngestJobQueue()
+    job = queue.submit(_FakePipeline(), "upload", [Path("t/_uploads/a.md")], tenant="team-a")
+    assert queue.has_pending("team-a")
+    assert not queue.has_pending("team-b")
+    _drain(queue, [job.job_id])
+    assert not queue.has_pending("team-a")
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from eval.metrics import _llm_judge
+from src.rag import llm
+from src.rag.config import settings
+from src.rag.generator import generate
+from src.rag.llm import LLMCacheMissError, LLMRequest, RecordReplayBackend, StubBackend
+from src.rag.models import Chunk, ScoredChunk
+
+
+class _Counting:
+    name = "counting"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def complete(self, request: LLMRequest) -> str:
+        self.calls += 1
+        return f"answer {self.calls}"
+
+
+def _chunks(n: int) -> list[ScoredChunk]:
+    return [
+        ScoredChunk(
+            chunk=Chunk(chunk_id=f"c{i}", text=f"text {i}", source=f"doc{i}.md", title=f"Doc {i}"),
+            score=1.0,
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def stub():
+    llm.set_backend(StubBackend(latency_ms=0, tokens_per_s=0))
+    yield
+    llm.set_backend(None)
+
+
+def test_request_key_covers_all_fields():
+    base = LLMRequest(model="m", prompt="p", system="s", temperature=0.1)
+    assert base.key() == LLMRequest(model="m", prompt="p", system="s", temperature=0.1).key()
+    assert base.key() != LLMRequest(model="m", prompt="p", system="s", temperature=0.2).key()
+    assert base.key() != LLMRequest(model="other", prompt="p", system="s", temperature=0.1).key()
+
+
+def test_stub_cites_references_deterministically():
+    backend = StubBackend(latency_ms=0, tokens_per_s=0)
+    request = LLMRequest(model="m", prompt="References:\n[1] a\n\n[2] b\n\nQuestion: q")
+    answer = backend.complete(request)
+    assert "[1]" in answer and "[2]" in answer
+    assert backend.complete(request) == answer
+
+
+def test_stub_answers_judge_prompts_with_a_score():
+    backend = StubBackend(latency_ms=0, tokens_per_s=0)
+    request = LLMRequest(model="m", prompt="x", system="Score on a scale of 0.0 to 1.0.")
+    assert 0.7 <= float(backend.complete(request)) <= 1.0
+
+
+def test_stub_simulates_latency():
+    backend = StubBackend(latency_ms=30, tokens_per_s=0)
+    start = time.perf_counter()
+    backend.complete(LLMRequest(model="m", prompt="q"))
+    assert time.perf_counter() - start >= 0.03
+
+
+def test_record_then_replay(tmp_path):
+    inner = _Counting()
+    request = LLMRequest(model="m", prompt="q")
+    recorder = RecordReplayBackend(inner, tmp_path, "record")
+    assert recorder.complete(request) == "answer 1"
+
+    replayer = RecordReplayBackend(None, tmp_path, "replay")
+    assert replayer.complete(request) == "answer 1"
+    assert (replayer.hits, inner.calls) == (1, 1)
+    with pytest.raises(LLMCacheMissError):
+        replayer.complete(LLMRequest(model="m", prompt="unseen"))
+
+
+def test_auto_mode_records_misses(tmp_path):
+    inner = _Counting()
+    backend = RecordReplayBackend(inner, tmp_path, "auto")
+    request = LLMRequest(model="m", prompt="q")
+    assert backend.complete(request) == backend.complete(request) == "answer 1"
+    assert (backend.hits, backend.misses, inner.calls) == (1, 1, 1)
+
+
+def test_get_backend_follows_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "llm_backend", "stub")
+    monkeypatch.setattr(settings, "llm_cache_mode", "auto")
+    monkeypatch.setattr(settings, "llm_cache_dir", tmp_path)
+    backend = llm.get_backend()
+    assert isinstance(backend, RecordReplayBackend)
+    assert backend.name == "auto:stub"
+    assert llm.get_backend() is backend
+
+
+def test_generate_with_stub_backend(stub):
+    answer, citations = generate("what?", _chunks(2))
+    assert {c.ref_id for c in citations} == {1, 2}
+    assert "[1]" in answer
+
+
+def test_llm_judge_with_stub_backend(stub):
+    assert 0.7 <= _llm_judge("Rate this answer.", api_key="") <= 1.0
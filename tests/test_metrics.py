@@ -0,0 +1,74 @@
+import pytest
+
+from src.rag import pipeline as pipeline_mod
+from src.rag.config import settings
+from src.rag.metrics import STAGE_SECONDS, Histogram, LabeledHistogram, span, trace
+from src.rag.models import Chunk, Citation
+
+
+def test_histogram_is_cumulative():
+    h = Histogram([1, 4, 16])
+    for v in (1, 2, 3, 20):
+        h.observe(v)
+    snap = h.snapshot()
+    assert snap["buckets"] == {"1": 1, "4": 3, "16": 3, "+Inf": 4}
+    assert snap["count"] == 4
+    assert snap["sum"] == 26
+
+
+def test_labeled_histogram_renders_prometheus_text():
+    family = LabeledHistogram("x_seconds", "Test.", "stage", buckets=[0.1, 1.0])
+    family.observe("b", 0.5)
+    family.observe("a", 0.05)
+    lines = family.render()
+    assert lines[:2] == ["# HELP x_seconds Test.", "# TYPE x_seconds histogram"]
+    assert 'x_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'x_seconds_bucket{stage="b",le="0.1"} 0' in lines
+    assert 'x_seconds_bucket{stage="b",le="+Inf"} 1' in lines
+    assert 'x_seconds_count{stage="b"} 1' in lines
+    assert lines.index('x_seconds_count{stage="a"} 1') < lines.index('x_seconds_count{stage="b"} 1')
+
+
+def test_spans_feed_trace_and_histogram():
+    before = STAGE_SECONDS.labels("test_stage").snapshot()["count"]
+    with trace() as t:
+        with span("test_stage"):
+            pass
+        with span("test_stage"):
+            pass
+    with span("test_stage"):  # outside a trace: histogram only
+        pass
+    assert list(t.timings_ms()) == ["test_stage"]
+    assert STAGE_SECONDS.labels("test_stage").snapshot()["count"] == before + 3
+
+
+@pytest.fixture
+def pipeline(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline_mod, "rerank", lambda q, c, top_k: c[:top_k])
+    citation = Citation(ref_id=1, source="a.md", title="A")
+    monkeypatch.setattr(pipeline_mod, "generate", lambda q, c, **_: ("answer [1]", [citation]))
+    pipeline.index_chunks([Chunk(chunk_id="a", text="alpha doc", source="a.md")])
+    return pipeline
+
+
+def test_query_timings_only_in_debug(pipeline, monkeypatch):
+    assert pipeline.query("alpha").timings is None
+
+    monkeypatch.setattr(settings, "debug", True)
+    timings = pipeline.query("alpha").timings
+    assert timings is not None
+    for stage in ("query", "retrieve", "bm25", "embed_query", "vector_search", "fusion", "rerank"):
+        assert stage in timings
+    assert timings["query"] >= timings["retrieve"] >= timings["bm25"]
+
+
+def test_histogram_quantile():
+    hist = Histogram([0.01, 0.1, 1.0])
+    assert hist.quantile(0.5) == 0.0
+    for v in (0.005, 0.05, 0.05, 0.5):
+        hist.observe(v)
+    assert hist.quantile(0.25) == 0.01
+    assert hist.quantile(0.5) == 0.1
+    assert hist.quantile(0.95) == 1.0
+    hist.observe(5.0)  # +Inf bucket reports the largest finite bound
+    assert hist.quantile(1.0) == 1.0
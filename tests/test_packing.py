@@ -0,0 +1,120 @@
+import pytest
+
+from src.rag import packing
+from src.rag import pipeline as pipeline_mod
+from src.rag.analysis import PLAIN, Analyzer
+from src.rag.chunker import chunk_text
+from src.rag.citations import build_citation_map
+from src.rag.config import settings
+from src.rag.models import Chunk, ScoredChunk
+from src.rag.packing import estimate_tokens, merge_adjacent, pack_context, select_sentences
+
+TEXT = " ".join(
+    f"Sentence number {i} talks about {'rate limiting' if i == 7 else 'other topics'}."
+    for i in range(20)
+)
+
+
+def _scored(chunks: list[Chunk], order: list[int]) -> list[ScoredChunk]:
+    return [ScoredChunk(chunk=chunks[i], score=1.0 - r / 10) for r, i in enumerate(order)]
+
+
+def test_merges_overlapping_chunks_without_duplicate_text():
+    chunks = chunk_text(TEXT, source="a.md", title="A", chunk_size=120, chunk_overlap=30)
+    assert len(chunks) >= 3
+    merged = merge_adjacent(_scored(chunks, [1, 0, 2]))
+    assert len(merged) == 1
+    assert merged[0].score == 1.0  # best member's score
+    text = merged[0].chunk.text
+    # Every sentence of the three chunks appears exactly once
+    for i in range(20):
+        sentence = f"Sentence number {i} "
+        if sentence in chunks[0].text + chunks[1].text + chunks[2].text:
+            assert text.count(sentence) == 1
+    assert len(text) < sum(len(c.text) for c in chunks[:3])
+
+
+def test_keeps_distant_chunks_and_other_sources_apart():
+    chunks = chunk_text(TEXT, source="a.md", title="A", chunk_size=120, chunk_overlap=30)
+    other = Chunk(chunk_id="b", text="Unrelated text from another file.", source="b.md")
+    scored = [*_scored(chunks, [3, 0]), ScoredChunk(chunk=other, score=0.5)]
+    merged = merge_adjacent(scored)
+    assert [sc.chunk.chunk_id for sc in merged] == [chunks[3].chunk_id, chunks[0].chunk_id, "b"]
+
+
+def test_select_sentences_respects_budget_and_keeps_every_reference():
+    big = ScoredChunk(chunk=Chunk(chunk_id="a", text=TEXT, source="a.md"), score=1.0)
+    small = ScoredChunk(
+        chunk=Chunk(chunk_id="b", text="First point. Second point.", source="b.md"), score=0.5
+    )
+    packed = select_sentences("how is rate limiting configured", [big, small], budget=40)
+    assert len(packed) == 2
+    assert "rate limiting" in packed[0].chunk.text
+    assert "…" in packed[0].chunk.text
+    assert packed[1].chunk.text  # every [N] keeps at least one sentence
+    assert sum(estimate_tokens(sc.chunk.text) for sc in packed) <= 40 + 5
+    cmap = build_citation_map(packed)
+    assert sorted(cmap) == [1, 2]
+    assert cmap[1].source == "a.md"
+
+
+def test_pack_context_reports_tokens_saved():
+    chunks = chunk_text(TEXT, source="a.md", chunk_size=120, chunk_overlap=30)
+    scored = _scored(chunks, list(range(len(chunks))))
+    unlimited = pack_context("rate limiting", scored, budget=0)
+    assert unlimited.tokens_saved > 0  # overlap removed
+    tight = pack_context("rate limiting", scored, budget=30)
+    assert tight.tokens_after < unlimited.tokens_after
+    assert tight.tokens_saved == tight.tokens_before - tight.tokens_after
+
+
+def test_sentences_are_matched_with_the_given_analyzer():
+    chunk = Chunk(chunk_id="a", text="Alpha beta gamma. The limits apply here.", source="a.md")
+    blocks = [ScoredChunk(chunk=chunk, score=1.0)]
+    stemmed = select_sentences("limit", blocks, budget=1, analyzer=Analyzer(stem=True))
+    assert "limits" in stemmed[0].chunk.text
+    plain = select_sentences("limit", blocks, budget=1, analyzer=PLAIN)
+    assert "limits" not in plain[0].chunk.text
+
+
+@pytest.fixture
+def pipeline(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline_mod, "rerank", lambda q, c, top_k: c[:top_k])
+    seen: list[list[ScoredChunk]] = []
+
+    def fake_generate(query, chunks, **_):
+        seen.append(chunks)
+        return "answer [1]", [build_citation_map(chunks)[1]]
+
+    monkeypatch.setattr(pipeline_mod, "generate", fake_generate)
+    pipeline.index_chunks(chunk_text(TEXT, source="a.md", chunk_size=120, chunk_overlap=30))
+    return pipeline, seen
+
+
+def test_pipeline_generates_from_packed_context(pipeline, monkeypatch):
+    pipeline, seen = pipeline
+    monkeypatch.setattr(settings, "debug", True)
+    response = pipeline.query("rate limiting", top_k=10)
+    assert response.chunks_used == seen[-1]
+    assert response.context_tokens is not None
+    assert response.context_tokens["saved"] > 0
+
+    monkeypatch.setattr(settings, "context_packing", False)
+    response = pipeline.query("rate limiting", top_k=10)
+    assert response.context_tokens is None
+    assert len(response.chunks_used) > len(seen[0])
+
+
+def test_pipeline_packs_with_the_index_analyzer(pipeline, monkeypatch):
+    pipeline, _ = pipeline
+    analyzers = []
+
+    def spy(query, chunks, budget=None, analyzer=None):
+        analyzers.append(analyzer)
+        return packing.pack_context(query, chunks, budget, analyzer)
+
+    monkeypatch.setattr(pipeline_mod, "pack_context", spy)
+    monkeypatch.setattr(settings, "bm25_stemming", not settings.bm25_stemming)
+    pipeline.query("rate limiting", top_k=10)
+    assert analyzers == [pipeline._generations.current.bm25.analyzer]
+    assert analyzers[0].stem != settings.bm25_stemming
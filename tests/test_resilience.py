@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from src.rag import resilience
+from src.rag.config import settings
+from src.rag.llm import LLMRequest, StubBackend
+from src.rag.metrics import LLM_EVENTS
+from src.rag.resilience import LLMDeadlineExceededError, complete_resilient, hedge_delay
+
+
+class _TransientError(Exception):
+    code = 503
+
+
+class _Scripted:
+    """Each call pops the next (delay_s, result) step; results that are exceptions are raised."""
+
+    name = "scripted"
+
+    def __init__(self, steps: dict[str, list[tuple[float, object]]]) -> None:
+        self._steps = steps
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def complete(self, request: LLMRequest) -> str:
+        with self._lock:
+            self.calls.append(request.model)
+            delay, result = self._steps[request.model].pop(0)
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return str(result)
+
+
+@pytest.fixture(autouse=True)
+def _config(monkeypatch):
+    monkeypatch.setattr(resilience, "_windows", {})
+    monkeypatch.setattr(resilience, "_RETRY_BASE_DELAY_S", 0.01)
+    monkeypatch.setattr(settings, "llm_timeout_s", 2.0)
+    monkeypatch.setattr(settings, "llm_hedge", True)
+    monkeypatch.setattr(settings, "llm_hedge_after_ms", 50.0)
+    monkeypatch.setattr(settings, "llm_max_retries", 2)
+    monkeypatch.setattr(settings, "llm_fallback_model", "small")
+    monkeypatch.setattr(settings, "llm_fallback_timeout_s", 1.0)
+
+
+REQUEST = LLMRequest(model="big", prompt="q")
+
+
+def test_fast_answer_needs_no_hedge():
+    backend = _Scripted({"big": [(0.0, "ok")]})
+    assert complete_resilient(backend, REQUEST) == "ok"
+    assert backend.calls == ["big"]
+
+
+def test_slow_call_is_hedged():
+    before = LLM_EVENTS.get("hedge_won")
+    backend = _Scripted({"big": [(0.5, "slow"), (0.0, "fast")]})
+    start = time.monotonic()
+    assert complete_resilient(backend, REQUEST) == "fast"
+    assert time.monotonic() - start < 0.3
+    assert backend.calls == ["big", "big"]
+    assert LLM_EVENTS.get("hedge_won") == before + 1
+
+
+def test_transient_errors_are_retried():
+    backend = _Scripted({"big": [(0.0, _TransientError()), (0.0, "ok")]})
+    assert complete_resilient(backend, REQUEST) == "ok"
+    assert backend.calls == ["big", "big"]
+
+
+def test_falls_back_when_primary_times_out(monkeypatch):
+    monkeypatch.setattr(settings, "llm_timeout_s", 0.1)
+    monkeypatch.setattr(settings, "llm_hedge", False)
+    backend = _Scripted({"big": [(0.5, "late")], "small": [(0.0, "fallback answer")]})
+    assert complete_resilient(backend, REQUEST) == "fallback answer"
+    assert backend.calls == ["big", "small"]
+
+
+def test_falls_back_once_retries_are_exhausted():
+    backend = _Scripted({"big": [(0.0, _TransientError())] * 3, "small": [(0.0, "ok")]})
+    assert complete_resilient(backend, REQUEST) == "ok"
+    assert backend.calls == ["big", "big", "big", "small"]
+
+
+def test_request_errors_do_not_fall_back():
+    # A bad request or rejected key would fail the same way on the fallback model
+    backend = _Scripted({"big": [(0.0, ValueError("bad"))], "small": [(0.0, "ok")]})
+    with pytest.raises(ValueError, match="bad"):
+        complete_resilient(backend, REQUEST)
+    assert backend.calls == ["big"]
+
+
+def test_pool_fits_every_admitted_request_and_its_hedge(monkeypatch):
+    monkeypatch.setattr(resilience, "_executor", None)
+    monkeypatch.setattr(settings, "admission_max_concurrency", 6)
+    assert resilience._pool()._max_workers == 12
+    resilience._pool().shutdown()
+
+
+def test_error_without_fallback_is_raised(monkeypatch):
+    monkeypatch.setattr(settings, "llm_fallback_model", "")
+    backend = _Scripted({"big": [(0.0, ValueError("bad"))]})
+    with pytest.raises(ValueError, match="bad"):
+        complete_resilient(backend, REQUEST)
+
+
+def test_deadline_bounds_the_whole_call(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge", False)
+    backend = _Scripted({"big": [(0.5, "late")], "small": [(0.5, "late")]})
+    start = time.monotonic()
+    with pytest.raises(LLMDeadlineExceededError):
+        complete_resilient(backend, REQUEST, deadline=start + 0.15)
+    assert time.monotonic() - start < 0.3
+
+
+def test_hedge_delay_tracks_observed_p95(monkeypatch):
+    assert hedge_delay("big") == 0.05
+    window = resilience.latency_window("big")
+    for i in range(100):
+        window.add(i / 1000)
+    assert hedge_delay("big") == pytest.approx(0.095)
+    monkeypatch.setattr(settings, "llm_hedge", False)
+    assert hedge_delay("big") is None
+
+
+def test_stub_backend_stands_in_for_the_model():
+    backend = StubBackend(latency_ms=0, tokens_per_s=0)
+    answer = complete_resilient(backend, LLMRequest(model="big", prompt="[1] (Source: a)\ntext"))
+    assert "[1]" in answer
@@ -0,0 +1,164 @@
+import math
+
+import numpy as np
+import pytest
+
+from eval import retrieval
+from eval.dataset import GoldenExample
+from eval.retrieval import (
+    evaluate_retrieval,
+    expand_grid,
+    format_table,
+    ndcg_at_k,
+    override_settings,
+    recall_at_k,
+    reciprocal_rank,
+    relevant_ranks,
+    run_sweep,
+)
+from src.rag import reranker
+from src.rag.config import settings
+from src.rag.models import Chunk, ScoredChunk
+from src.rag.reranker import rerank, rerank_many
+
+DOCS = {
+    "auth.md": "# Auth\n\nThe API uses JWT tokens for authentication and refresh tokens.",
+    "limits.md": "# Limits\n\nRate limiting is configured per minute with a token bucket.",
+    "db.md": "# Database\n\nMigrations run with Alembic against PostgreSQL or SQLite.",
+}
+
+
+def _keyword_embed(texts: list[str]) -> np.ndarray:
+    vocab = ["jwt", "auth", "rate", "limit", "migration", "alembic", "token"]
+    return np.asarray(
+        [[float(w in t.lower()) for w in vocab] + [0.1] for t in texts], dtype=np.float32
+    )
+
+
+def _fake_score(pairs) -> np.ndarray:
+    return np.asarray(
+        [len(set(q.lower().split()) & set(p.lower().split())) for q, p in pairs], np.float32
+    )
+
+
+@pytest.fixture
+def embed():
+    return _keyword_embed
+
+
+@pytest.fixture
+def pipeline(pipeline, monkeypatch):
+    monkeypatch.setattr(reranker, "score_pairs", _fake_score)
+    pipeline.docs_dir.mkdir()
+    for name, text in DOCS.items():
+        (pipeline.docs_dir / name).write_text(text, encoding="utf-8")
+    pipeline.ingest()
+    return pipeline
+
+
+def _golden() -> list[GoldenExample]:
+    return [
+        GoldenExample(
+            question="How does JWT auth work?",
+            expected_answer="",
+            expected_sources=["auth.md"],
+        ),
+        GoldenExample(
+            question="How is rate limiting configured?",
+            expected_answer="",
+            expected_sources=["limits.md"],
+        ),
+        GoldenExample(question="No sources listed", expected_answer=""),
+    ]
+
+
+def test_rank_metrics():
+    ranks = relevant_ranks(["docs/a.md", "docs/c.md"], ["docs/b.md", "docs/a.md", "docs/c.md"])
+    assert ranks == [2, 3]
+    assert recall_at_k(ranks, 2, 1) == 0.0
+    assert recall_at_k(ranks, 2, 2) == 0.5
+    assert recall_at_k(ranks, 2, 3) == 1.0
+    assert reciprocal_rank(ranks) == 0.5
+    ideal = 1 + 1 / math.log2(3)
+    assert ndcg_at_k(ranks, 2, 3) == pytest.approx((1 / math.log2(3) + 0.5) / ideal)
+    assert ndcg_at_k([1], 1, 5) == 1.0
+    assert reciprocal_rank([]) == 0.0
+
+
+def test_expand_grid():
+    assert expand_grid({}) == [{}]
+    grid = expand_grid({"bm25_top_k": [10, 25], "rrf_k": [60]})
+    assert grid == [{"bm25_top_k": 10, "rrf_k": 60}, {"bm25_top_k": 25, "rrf_k": 60}]
+
+
+def test_override_settings_validates_and_restores():
+    before = settings.rrf_k
+    with override_settings({"rrf_k": "30"}):
+        assert settings.rrf_k == 30
+    assert settings.rrf_k == before
+    with pytest.raises(ValueError, match="Unknown settings"):
+        with override_settings({"no_such_knob": 1}):
+            pass
+
+
+def test_rerank_many_matches_rerank(monkeypatch):
+    monkeypatch.setattr(reranker, "score_pairs", _fake_score)
+    cands = [
+        ScoredChunk(chunk=Chunk(chunk_id=str(i), text=t, source="s"), score=0.0)
+        for i, t in enumerate(["red fox", "blue whale", "red fox jumps"])
+    ]
+    queries = ["red fox", "blue whale"]
+    batched = rerank_many(queries, [cands, cands[:2]], top_k=2)
+    assert [[sc.chunk.chunk_id for sc in r] for r in batched] == [
+        [sc.chunk.chunk_id for sc in rerank(q, c, top_k=2)]
+        for q, c in zip(queries, [cands, cands[:2]])
+    ]
+
+
+def test_retrieve_many_matches_single_queries(pipeline):
+    questions = ["How does JWT auth work?", "alembic migrations"]
+    batched = pipeline.retrieve_many(questions, use_reranker=False)
+    with pipeline._generations.reader() as gen:
+        single = [gen.retriever.retrieve(q) for q in questions]
+    assert [[sc.chunk.chunk_id for sc in r] for r in batched] == [
+        [sc.chunk.chunk_id for sc in r] for r in single
+    ]
+
+
+def test_evaluate_retrieval(pipeline):
+    report = evaluate_retrieval(pipeline, _golden(), ks=(1, 3))
+    summary = report.summary()
+    assert summary["num_examples"] == 2  # the example without sources is skipped
+    assert summary["recall@1"] == 1.0
+    assert summary["mrr"] == 1.0
+    assert summary["ndcg@3"] == 1.0
+    assert {"embed_queries", "retrieve", "rerank", "bm25"} <= set(summary["stage_ms"])
+
+
+def test_sweep_over_query_and_index_settings(pipeline):
+    chroma_dir, chunk_size = settings.chroma_dir, settings.chunk_size
+    configs = expand_grid({"bm25_weight": [0.0, 1.0]}) + [{"chunk_size": 64}]
+    reports = run_sweep(pipeline, _golden(), configs, ks=(1,))
+    assert [r.config for r in reports] == configs
+    assert all(r.summary()["recall@1"] == 1.0 for r in reports)
+    assert (settings.chroma_dir, settings.chunk_size) == (chroma_dir, chunk_size)
+
+    table = format_table(reports)
+    assert "bm25_weight=0.0" in table and "chunk_size=64" in table
+    assert len(table.splitlines()) == 2 + len(configs)
+
+
+def test_sweeping_the_analyzer_reindexes(pipeline, monkeypatch):
+    analyzed_with: list[bool] = []
+    evaluate = retrieval.evaluate_retrieval
+
+    def spy(pipe, *args, **kwargs):
+        analyzed_with.append(pipe._generations.current.bm25.analyzer.stem)
+        return evaluate(pipe, *args, **kwargs)
+
+    monkeypatch.setattr(retrieval, "evaluate_retrieval", spy)
+    configs = [{"bm25_stemming": True}, {"bm25_stemming": False}]
+    reports = run_sweep(pipeline, _golden(), configs, ks=(1,))
+    assert [r.config for r in reports] == configs
+    # The pipeline's stemmed index would ignore the override; a fresh index must not
+    assert analyzed_with == [True, False]
@@ -1,8 +1,17 @@
+from datetime import UTC, datetime
+
 import pytest
 
 from src.rag.bm25_index import BM25Index
-from src.rag.hybrid_retriever import reciprocal_rank_fusion
-from src.rag.models import Chunk, ScoredChunk
+from src.rag.config import settings
+from src.rag.filters import to_chroma_where
+from src.rag.hybrid_retriever import (
+    HybridRetriever,
+    choose_candidate_depth,
+    reciprocal_rank_fusion,
+)
+from src.rag.models import Chunk, QueryFilters, ScoredChunk
+from src.rag.segments import SegmentedBM25Index
 
 
 def _make_chunks(texts: list[str]) -> list[Chunk]:
@@ -86,3 +95,119 @@ class TestRRF:
         results = [ScoredChunk(chunk=c, score=1.0, origin="bm25")]
         fused = reciprocal_rank_fusion([results], k=60)
         assert len(fused) == 1
+
+
+class TestAdaptiveDepth:
+    @staticmethod
+    def _ranked(prefix: str, scores: list[float]) -> list[ScoredChunk]:
+        return [
+            ScoredChunk(chunk=Chunk(chunk_id=f"{prefix}{i}", text="t", source="s"), score=s)
+            for i, s in enumerate(scores)
+        ]
+
+    def test_easy_query_is_shallow(self):
+        bm25 = self._ranked("c", [10.0] + [0.5] * 24)
+        vector = self._ranked("c", [0.9] + [0.05] * 24)
+        depth = choose_candidate_depth("jwt auth", bm25, vector, min_k=5, max_k=25)
+        assert depth <= 8
+
+    def test_hard_query_is_deep(self):
+        bm25 = self._ranked("b", [1.0] * 25)
+        vector = self._ranked("v", [0.5] * 25)
+        query = " ".join(["word"] * 20)
+        depth = choose_candidate_depth(query, bm25, vector, min_k=5, max_k=25)
+        assert depth == 25
+
+    def test_depth_within_bounds(self):
+        depth = choose_candidate_depth("q", [], [], min_k=5, max_k=25)
+        assert 5 <= depth <= 25
+
+
+class _Leg:
+    """A retrieval leg returning a fixed ranking and recording the depth asked for."""
+
+    def __init__(self, results: list[ScoredChunk]) -> None:
+        self.results = results
+        self.depths: list[int | None] = []
+
+    @property
+    def sources(self) -> list[str]:
+        return ["s"]
+
+    def search(self, query, top_k=None, filters=None, where=None, query_embedding=None):
+        self.depths.append(top_k)
+        return self.results[:top_k]
+
+
+class TestAdaptiveRetrieve:
+    def test_legs_are_pulled_deep_and_trimmed_to_the_chosen_depth(self, monkeypatch):
+        monkeypatch.setattr(settings, "adaptive_min_k", 5)
+        monkeypatch.setattr(settings, "adaptive_max_k", 25)
+        bm25 = _Leg(TestAdaptiveDepth._ranked("c", [10.0] + [0.5] * 29))
+        vector = _Leg(TestAdaptiveDepth._ranked("c", [0.9] + [0.05] * 29))
+        retriever = HybridRetriever(bm25, vector)
+
+        fused = retriever.retrieve("jwt auth", adaptive=True)
+        assert bm25.depths == vector.depths == [25]
+        depth = choose_candidate_depth("jwt auth", bm25.results[:25], vector.results[:25])
+        assert 5 <= depth < 25
+        assert {sc.chunk.chunk_id for sc in fused} == {f"c{i}" for i in range(depth)}
+
+    def test_fixed_depth_when_adaptive_is_off(self, monkeypatch):
+        bm25 = _Leg(TestAdaptiveDepth._ranked("b", [1.0] * 30))
+        vector = _Leg(TestAdaptiveDepth._ranked("v", [1.0] * 30))
+        fused = HybridRetriever(bm25, vector).retrieve(
+            "q", bm25_top_k=20, vector_top_k=10, adaptive=False
+        )
+        assert bm25.depths == [20] and vector.depths == [10]
+        assert len(fused) == 30
+
+
+class TestFilters:
+    @staticmethod
+    def _index() -> SegmentedBM25Index:
+        chunks = [
+            Chunk(chunk_id="a", text="install guide", source="docs/a.md", title="Setup"),
+            Chunk(chunk_id="b", text="install manual", source="manuals/b.pdf", page=3),
+            Chunk(chunk_id="c", text="install notes", source="manuals/c.pdf", page=9),
+            Chunk(chunk_id="d", text="install faq", source="docs/d.txt", ingested_at=2_000_000_000),
+        ]
+        idx = SegmentedBM25Index()
+        idx.build(chunks)
+        return idx
+
+    def test_source_prefix(self):
+        results = self._index().search("install", filters=QueryFilters(source_prefix="manuals/"))
+        assert {r.chunk.chunk_id for r in results} == {"b", "c"}
+
+    def test_page_range_and_file_type(self):
+        filters = QueryFilters(file_types=["pdf"], page_min=1, page_max=5)
+        results = self._index().search("install", filters=filters)
+        assert [r.chunk.chunk_id for r in results] == ["b"]
+
+    def test_title_and_ingest_date(self):
+        idx = self._index()
+        results = idx.search("install", filters=QueryFilters(title="Setup"))
+        assert [r.chunk.chunk_id for r in results] == ["a"]
+        after = datetime(2030, 1, 1, tzinfo=UTC)
+        results = idx.search("install", filters=QueryFilters(ingested_after=after))
+        assert [r.chunk.chunk_id for r in results] == ["d"]
+
+    def test_naive_dates_are_utc(self):
+        # d was ingested at 2033-05-18T03:33:20Z; a naive bound one second later excludes it
+        idx = self._index()
+        naive = datetime(2033, 5, 18, 3, 33, 21)
+        assert idx.search("install", filters=QueryFilters(ingested_after=naive)) == []
+        before = idx.search("install", filters=QueryFilters(ingested_before=naive))
+        assert "d" in {r.chunk.chunk_id for r in before}
+        where = to_chroma_where(QueryFilters(ingested_after=naive), [])
+        assert where == {"ingested_at": {"$gte": 2_000_000_001}}
+
+    def test_no_match(self):
+        assert self._index().search("install", filters=QueryFilters(title="Nope")) == []
+
+    def test_chroma_where(self):
+        filters = QueryFilters(source_prefix="manuals/", page_min=2)
+        where = to_chroma_where(filters, ["docs/a.md", "manuals/b.pdf"])
+        assert where == {"$and": [{"source": {"$in": ["manuals/b.pdf"]}}, {"page": {"$gte": 2}}]}
+        assert to_chroma_where(QueryFilters(), []) is None
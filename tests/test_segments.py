@@ -0,0 +1,326 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from src.rag import pipeline as pipeline_mod
+from src.rag.bm25_index import BM25Index
+from src.rag.config import settings
+from src.rag.ingest import file_sha256
+from src.rag.models import Chunk, QueryFilters
+from src.rag.pipeline import RAGPipeline
+from src.rag.segments import SegmentedBM25Index, TieredMergePolicy, segments_dir
+from src.rag.shared_index import open_shared
+from tests.conftest import hashed_embed
+
+_WORDS = ["python", "pasta", "robot", "garden", "shard", "tomato", "engine", "river"]
+_QUERIES = ["python pasta", "robot garden engine", "tomato river", "shard note"]
+
+
+def _chunks(prefix: str, n: int, per_source: int = 3) -> list[Chunk]:
+    return [
+        Chunk(
+            chunk_id=f"{prefix}{i}",
+            text=" ".join(_WORDS[(i * k) % len(_WORDS)] for k in (1, 3, 5)) + f" note {prefix}",
+            source=f"docs/{prefix}{i // per_source}.md",
+        )
+        for i in range(n)
+    ]
+
+
+def _scores(index, query: str) -> dict[str, float]:
+    return {r.chunk.chunk_id: r.score for r in index.search(query, top_k=1000)}
+
+
+def _assert_matches_rebuild(index: SegmentedBM25Index) -> None:
+    """A segmented index must score exactly like a fresh index over its live chunks."""
+    rebuilt = BM25Index()
+    rebuilt.build(index.chunks)
+    for query in _QUERIES:
+        got, want = _scores(index, query), _scores(rebuilt, query)
+        assert got.keys() == want.keys()
+        for cid, score in want.items():
+            assert got[cid] == pytest.approx(score)
+
+
+def test_updates_share_segments_and_score_like_a_rebuild():
+    base = SegmentedBM25Index()
+    base.build(_chunks("a", 30))
+    added = base.updated(add=_chunks("b", 6))
+    assert added.segment_sizes == [30, 6]
+    assert added._view.segments[0] is base._view.segments[0]
+    assert base.num_docs == 30  # the old index is untouched
+    _assert_matches_rebuild(added)
+
+    deleted = added.updated(delete_sources=["docs/a0.md", "docs/b1.md"], delete_ids=["a10"])
+    assert deleted.num_docs == 36 - 3 - 3 - 1
+    assert "docs/a0.md" not in deleted.sources
+    assert not any(c.source == "docs/a0.md" for c in deleted.chunks)
+    _assert_matches_rebuild(deleted)
+
+    # Re-adding an id replaces the live chunk rather than duplicating it
+    upserted = deleted.updated(add=[Chunk(chunk_id="a20", text="zeppelin", source="docs/a6.md")])
+    assert [c.text for c in upserted.chunks if c.chunk_id == "a20"] == ["zeppelin"]
+    assert upserted.num_docs == deleted.num_docs
+    _assert_matches_rebuild(upserted)
+
+    # A segment with nothing live left is dropped
+    emptied = upserted.updated(delete_sources=[f"docs/b{i}.md" for i in range(2)])
+    assert len(emptied.segment_sizes) == len(upserted.segment_sizes) - 1
+
+
+def test_filters_skip_deleted_documents():
+    index = SegmentedBM25Index()
+    index.build(_chunks("a", 9))
+    index = index.updated(add=_chunks("b", 3), delete_ids=["a1"])
+    hits = index.search("note", top_k=100, filters=QueryFilters(source_prefix="docs/a0"))
+    assert sorted(r.chunk.chunk_id for r in hits) == ["a0", "a2"]
+
+
+def test_policy_merges_full_tiers_and_rewrites_deleted_segments():
+    policy = TieredMergePolicy(segments_per_tier=3, floor_docs=10, max_deleted_ratio=0.3)
+    assert [policy.tier(n) for n in (1, 29, 30, 89, 90)] == [0, 0, 1, 1, 2]
+    assert policy.select([5, 5], [5, 5]) == []
+    assert policy.select([50, 4, 2, 3, 1], [50, 4, 2, 3, 1]) == [2, 3, 4]
+    assert policy.select([50, 4, 2], [20, 4, 2]) == [0]
+
+
+def test_merge_preserves_results_and_keeps_concurrent_deletes():
+    index = SegmentedBM25Index()
+    index.build(_chunks("a", 12))
+    for i in range(4):
+        index = index.updated(add=_chunks(f"n{i}", 3))
+    before = {q: _scores(index, q) for q in _QUERIES}
+
+    policy = TieredMergePolicy(segments_per_tier=4, floor_docs=10)
+    plan = index.plan_merge(policy)
+    assert plan is not None and len(plan.segments) == 4
+    merged = plan.run()
+    index = index.with_merge(plan, merged)
+    assert index.segment_sizes == [12, 12]
+    for q in _QUERIES:
+        assert _scores(index, q) == pytest.approx(before[q])
+
+    # A delete that lands while a merge runs survives the install
+    plan = index.plan_merge(TieredMergePolicy(segments_per_tier=2, floor_docs=100))
+    merged = plan.run()
+    index = index.updated(delete_ids=["a0", "n32"]).with_merge(plan, merged)
+    assert index.segment_sizes == [22]
+    assert {"a0", "n32"}.isdisjoint(c.chunk_id for c in index.chunks)
+    _assert_matches_rebuild(index)
+
+    # Plans whose inputs were merged away by someone else are refused
+    stale = index.plan_merge(TieredMergePolicy(max_deleted_ratio=0.0))
+    merged_index = index.with_merge(stale, stale.run())
+    assert merged_index is not None
+    assert merged_index.with_merge(stale, stale.run()) is None
+    assert index.segment_sizes == [22]  # the input index is never modified
+
+
+def test_save_load_round_trip_with_tombstones(tmp_path):
+    path = tmp_path / "bm25.json"
+    index = SegmentedBM25Index()
+    index.build(_chunks("a", 9))
+    index = index.updated(add=_chunks("b", 3), delete_ids=["a4"])
+    index.save(path, meta={"generation": 3})
+
+    loaded = SegmentedBM25Index()
+    assert loaded.load(path) == {"generation": 3}
+    assert loaded.segment_sizes == [8, 3]
+    assert [c.chunk_id for c in loaded.chunks] == [c.chunk_id for c in index.chunks]
+    for q in _QUERIES:
+        assert _scores(loaded, q) == pytest.approx(_scores(index, q))
+
+    # Segments no longer referenced are garbage-collected on the next save
+    plan = index.plan_merge(TieredMergePolicy(segments_per_tier=2, floor_docs=100))
+    index = index.with_merge(plan, plan.run())
+    index.save(path)
+    assert len(list(segments_dir(path).glob("*.postings.npz"))) == 1
+
+
+def test_loads_single_file_index_written_before_segments(tmp_path):
+    path = tmp_path / "bm25.json"
+    chunks = _chunks("a", 6)
+    path.write_text(json.dumps({"chunks": [c.model_dump() for c in chunks], "meta": {"x": 1}}))
+    index = SegmentedBM25Index()
+    assert index.load(path) == {"x": 1}
+    assert index.segment_sizes == [6]
+
+
+@pytest.fixture
+def embed():
+    return hashed_embed
+
+
+@pytest.fixture
+def pipeline(pipeline, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_background_merge", False)
+    pipeline.index_chunks(_chunks("a", 30))
+    return pipeline
+
+
+def _ingest(pipe: RAGPipeline, tmp_path, monkeypatch, name: str, chunks: list[Chunk]) -> int:
+    path = tmp_path / "docs" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("x")
+    monkeypatch.setattr(pipeline_mod, "ingest_file", lambda p, root: chunks)
+    return pipe.ingest_files([path])
+
+
+def test_pipeline_adds_and_deletes_without_rebuilding(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_segments_per_tier", 3)
+    monkeypatch.setattr(settings, "bm25_merge_floor_docs", 100)
+    first = pipeline._generations.current.bm25._view.segments[0]
+    new = [c.model_copy(update={"source": "new.md"}) for c in _chunks("b", 4, per_source=4)]
+    assert _ingest(pipeline, tmp_path, monkeypatch, "new.md", new) == 4
+
+    bm25 = pipeline._generations.current.bm25
+    assert bm25.segment_sizes == [30, 4]
+    assert bm25._view.segments[0] is first
+    assert pipeline.chunk_count == 34
+
+    # A path to the file names the same source
+    assert pipeline.delete_sources([str(tmp_path / "docs" / "new.md"), "docs/a0.md"]) == 7
+    assert pipeline.delete_sources(["docs/unknown.md"]) == 0
+    bm25 = pipeline._generations.current.bm25
+    assert bm25.num_docs == pipeline.chunk_count == 27
+    assert "new.md" not in bm25.sources
+
+    # Reloading from disk serves the same index
+    fresh = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
+    fresh.load_indexes()
+    assert [c.chunk_id for c in fresh._generations.current.bm25.chunks] == [
+        c.chunk_id for c in bm25.chunks
+    ]
+
+
+def test_pipeline_tracks_content_of_indexed_files(pipeline, tmp_path, monkeypatch):
+    path = tmp_path / "docs" / "new.md"
+    chunks = [c.model_copy(update={"source": "new.md"}) for c in _chunks("b", 2)]
+    _ingest(pipeline, tmp_path, monkeypatch, "new.md", chunks)
+    digest = file_sha256(path)
+    other = tmp_path / "docs" / "copy.md"
+    assert pipeline.duplicate_of(path, digest) == "new.md"
+    assert pipeline.duplicate_of(other, digest) == "new.md"
+    assert pipeline.duplicate_of(path, "0" * 64) is None  # changed content is re-indexed
+
+    fresh = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
+    fresh.load_indexes()
+    assert fresh.duplicate_of(other, digest) == "new.md"
+
+    pipeline.delete_sources(["new.md"])
+    assert pipeline.duplicate_of(other, digest) is None
+
+
+def test_reuploaded_file_replaces_its_directory_chunks(pipeline, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    uploads = tmp_path / "docs" / "_uploads"
+    uploads.mkdir(parents=True)
+    (uploads / "notes.md").write_text("# Notes\n\nThe robot waters the garden.\n")
+    (tmp_path / "docs" / "guide.md").write_text("# Guide\n\nA zeppelin over the harbor.\n")
+    pipe = RAGPipeline(Path("docs"), tmp_path / "up.json", collection_name="uploads")
+    pipe.ingest(docs_dir=Path("docs").resolve())  # what POST /ingest passes
+    count = pipe.chunk_count
+
+    (uploads / "notes.md").write_text("# Notes\n\nThe robot paints the fence.\n")
+    pipe.ingest_files([pipe.docs_dir / "_uploads" / "notes.md"])  # what /upload passes
+    assert pipe.chunk_count == count
+    digest = file_sha256(uploads / "notes.md")
+    assert sorted(pipe._generations.current.bm25.sources) == ["_uploads/notes.md", "guide.md"]
+    assert pipe.duplicate_of(Path("docs/_uploads/notes.md"), digest) == "_uploads/notes.md"
+    assert pipe.delete_sources(["docs/_uploads/notes.md"]) == 1
+    assert pipe.chunk_count == count - 1
+
+
+def test_directory_ingest_records_content_hashes(pipeline, tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir(exist_ok=True)
+    (docs / "guide.md").write_text("# Guide\n\nA zeppelin over the harbor.\n")
+    pipeline.ingest()
+    digest = file_sha256(docs / "guide.md")
+    assert pipeline.duplicate_of(docs / "copy.md", digest) == "guide.md"
+
+
+def test_reserved_uploads_count_as_indexed_until_ingested(pipeline, tmp_path, monkeypatch):
+    first, second = tmp_path / "docs" / "one.md", tmp_path / "docs" / "two.md"
+    assert pipeline.reserve_content(first, "d" * 64) is None
+    assert pipeline.reserve_content(second, "d" * 64) == "one.md"
+
+    chunks = [c.model_copy(update={"source": "one.md"}) for c in _chunks("b", 2)]
+    _ingest(pipeline, tmp_path, monkeypatch, "one.md", chunks)
+    assert pipeline._pending_hashes == {}
+    assert pipeline.duplicate_of(second, file_sha256(first)) == "one.md"
+    assert pipeline.duplicate_of(second, "d" * 64) is None
+
+    # A failed ingest releases the reservation too
+    assert pipeline.reserve_content(second, "e" * 64) is None
+    pipeline.ingest_files([tmp_path / "docs" / "missing.md", second])
+    assert pipeline.reserve_content(tmp_path / "docs" / "three.md", "e" * 64) is None
+
+
+def test_pipeline_memory_counts_vectors(pipeline, tmp_path):
+    gen = pipeline._generations.current
+    assert gen.vector.memory_bytes >= 30 * 8 * 4
+    assert pipeline.memory_bytes == gen.bm25.memory_bytes + gen.vector.memory_bytes
+
+    # A reopened store learns the dimension from the collection
+    fresh = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "bm25.json")
+    fresh.load_indexes()
+    assert fresh._generations.current.vector.memory_bytes == gen.vector.memory_bytes
+
+
+def test_pipeline_merges_small_segments(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_segments_per_tier", 3)
+    monkeypatch.setattr(settings, "bm25_merge_floor_docs", 10)
+    for i in range(3):
+        _ingest(pipeline, tmp_path, monkeypatch, f"n{i}.md", _chunks(f"n{i}", 2))
+    bm25 = pipeline._generations.current.bm25
+    assert bm25.segment_sizes == [30, 6]  # the three 2-chunk segments were merged
+    assert len(list(segments_dir(tmp_path / "bm25.json").glob("*.postings.npz"))) == 2
+
+
+def test_merge_publishes_a_successor_and_leaves_pinned_reads_alone(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_merge_floor_docs", 10)
+    for i in range(3):
+        _ingest(pipeline, tmp_path, monkeypatch, f"n{i}.md", _chunks(f"n{i}", 2))
+    with pipeline._generations.reader() as pinned:
+        view = pinned.bm25._view
+        before = {q: _scores(pinned.bm25, q) for q in _QUERIES}
+        hits = pinned.retriever.retrieve("note n1", final_top_k=5)
+        assert pipeline.merge_segments(TieredMergePolicy(segments_per_tier=3)) == 1
+
+        current = pipeline._generations.current
+        assert current is not pinned
+        assert current.number == pinned.number and current.vector is pinned.vector
+        assert current.bm25.segment_sizes == [30, 6]
+        # The pinned generation still reads exactly what it started with
+        assert pinned.bm25._view is view and pinned.bm25.segment_sizes == [30, 2, 2, 2]
+        assert {q: _scores(pinned.bm25, q) for q in _QUERIES} == before
+        assert pinned.retriever.retrieve("note n1", final_top_k=5) == hits
+    # Retiring the pre-merge generation must not drop the collection still in use
+    assert pipeline.chunk_count == 36
+    assert len(current.retriever.retrieve("note n1", final_top_k=5)) == 5
+
+
+def test_background_merge_runs_off_the_write_path(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bm25_background_merge", True)
+    monkeypatch.setattr(settings, "bm25_segments_per_tier", 2)
+    monkeypatch.setattr(settings, "bm25_merge_floor_docs", 10)
+    for i in range(2):
+        _ingest(pipeline, tmp_path, monkeypatch, f"n{i}.md", _chunks(f"n{i}", 2))
+    deadline = time.monotonic() + 5
+    while pipeline._merging and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pipeline._generations.current.bm25.segment_sizes == [30, 4]
+
+
+def test_segmented_generation_exports(pipeline, tmp_path, monkeypatch):
+    pipeline.delete_sources(["docs/a1.md"])
+    pipeline.export_shared(tmp_path / "shared", shards=0)
+    gen = open_shared(tmp_path / "shared")
+    live = pipeline._generations.current.bm25
+    assert len(gen.bm25.chunks) == live.num_docs == 27
+    for q in _QUERIES:
+        got = {r.chunk.chunk_id: r.score for r in gen.bm25.search(q, top_k=100)}
+        assert got == pytest.approx(_scores(live, q))
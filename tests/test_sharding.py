@@ -0,0 +1,178 @@
+import json
+import random
+import time
+
+import pytest
+
+from src.rag import sharding
+from src.rag.config import settings
+from src.rag.filters import to_chroma_where
+from src.rag.models import Chunk, QueryFilters
+from src.rag.pipeline import RAGPipeline
+from src.rag.sharding import (
+    Shard,
+    ShardClient,
+    ShardedRetriever,
+    ShardServer,
+    ShardSet,
+    shard_dir,
+)
+from src.rag.shared_index import open_shared
+from tests.conftest import hashed_embed
+
+_WORDS = (
+    "python java pasta pizza tomato basil garden robot language cooking sauce "
+    "index shard query vector token corpus"
+).split()
+QUERIES = ["python language", "pasta tomato sauce", "shard query corpus", "robot", "missing"]
+
+
+def _chunks(n: int = 40) -> list[Chunk]:
+    rng = random.Random(7)
+    return [
+        Chunk(
+            chunk_id=f"c{i}",
+            text=" ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 15))),
+            source=f"docs/{'a' if i % 3 else 'b'}/f{i // 4}.md",
+            page=i % 5,
+        )
+        for i in range(n)
+    ]
+
+
+def _ids(results):
+    return [r.chunk.chunk_id for r in results]
+
+
+@pytest.fixture
+def embed():
+    return hashed_embed
+
+
+@pytest.fixture
+def pipeline(pipeline):
+    pipeline.index_chunks(_chunks())
+    return pipeline
+
+
+@pytest.fixture
+def shard_set(pipeline, tmp_path):
+    """A 3-shard export served by in-process shard servers."""
+    out = tmp_path / "sharded"
+    manifest = pipeline.export_shared(out, shards=3)
+    sockets = tmp_path / "sockets"
+    servers = [
+        ShardServer(
+            sockets / f"shard-{i:02d}.sock",
+            Shard(shard_dir(out, i), manifest["num_docs"], manifest["avgdl"]),
+        )
+        for i in range(3)
+    ]
+    for server in servers:
+        server.start()
+    shards = ShardSet(out, sockets)
+    shards.wait_ready(timeout_s=5)
+    yield shards
+    shards.close()
+    for server in servers:
+        server.stop()
+
+
+def test_export_partitions_every_chunk_once(pipeline, tmp_path):
+    out = tmp_path / "sharded"
+    manifest = pipeline.export_shared(out, shards=3)
+    assert manifest["shards"] == 3
+    assert sum(manifest["shard_chunks"]) == manifest["chunks"] == 40
+    assert all(n > 0 for n in manifest["shard_chunks"])
+    seen = []
+    for i in range(3):
+        meta = json.loads((shard_dir(out, i) / "chunks" / "meta.json").read_text())
+        seen.extend(m["chunk_id"] for m in meta)
+    assert sorted(seen) == sorted(c.chunk_id for c in _chunks())
+
+
+@pytest.mark.parametrize("filters", [None, QueryFilters(source_prefix="docs/b", page_max=3)])
+def test_sharded_legs_match_unsharded_index(pipeline, shard_set, filters, embed, tmp_path):
+    # The unsharded memory-mapped export uses the same arithmetic, so even ties agree
+    pipeline.export_shared(tmp_path / "unsharded", shards=0)
+    local = open_shared(tmp_path / "unsharded")
+    where = to_chroma_where(filters, local.bm25.sources) if filters else None
+    for query in QUERIES:
+        emb = embed([query])[0]
+        bm25, vector = shard_set.search(query, 6, 5, filters, where, emb)
+
+        expected = local.bm25.search(query, top_k=6, filters=filters)
+        assert _ids(bm25) == _ids(expected)
+        assert [r.score for r in bm25] == pytest.approx([r.score for r in expected])
+
+        expected = local.vector.search(query, top_k=5, where=where, query_embedding=emb)
+        assert _ids(vector) == _ids(expected)
+        assert [r.score for r in vector] == pytest.approx([r.score for r in expected], abs=1e-5)
+
+
+class _SlowFirstServer(ShardServer):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.slow = True
+
+    def _handle(self, header, payload, conn) -> None:
+        if header.get("op") == "search" and self.slow:
+            self.slow = False
+            time.sleep(0.5)
+        super()._handle(header, payload, conn)
+
+
+def test_timed_out_shard_call_does_not_leave_a_stale_reply(pipeline, tmp_path):
+    out = tmp_path / "sharded"
+    manifest = pipeline.export_shared(out, shards=2)
+    shard = Shard(shard_dir(out, 0), manifest["num_docs"], manifest["avgdl"])
+    server = _SlowFirstServer(tmp_path / "shard.sock", shard)
+    server.start()
+    client = ShardClient(server.socket_path, timeout_s=0.3)
+    try:
+        with pytest.raises(TimeoutError):
+            client.search("robot", 5, 0, None, None, None)
+        time.sleep(0.3)  # the abandoned reply is ready by now
+        reply = client.search("pasta tomato sauce", 5, 0, None, None, None)
+        assert reply["bm25"] == shard.search("pasta tomato sauce", 5, 0, None, None, None)["bm25"]
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_close_shuts_down_the_shard_executor(shard_set):
+    assert shard_set._executor._max_workers == shard_set.num_shards
+    shard_set.close()
+    with pytest.raises(RuntimeError):
+        shard_set._executor.submit(lambda: None)
+
+
+def test_sharded_retriever_matches_hybrid_retrieval(pipeline, shard_set):
+    local = pipeline._generations.current
+    sharded = ShardedRetriever(
+        sharding.ShardedBM25(shard_set), sharding.ShardedVector(shard_set), shard_set
+    )
+    assert sharded._bm25.sources == local.bm25.sources
+    for query in QUERIES:
+        assert _ids(sharded.retrieve(query)) == _ids(local.retriever.retrieve(query))
+
+
+def test_load_shared_spawns_shard_processes(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "shard_socket_dir", None)
+    out = tmp_path / "sharded"
+    pipeline.export_shared(out, shards=2)
+
+    served = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "unused.json")
+    served.load_shared(out)
+    gen = served._generations.current
+    processes = list(gen.retriever._shards._processes)
+    assert len(processes) == 2
+    try:
+        assert served.read_only
+        assert served.chunk_count == 40
+        local = pipeline._generations.current
+        for query in QUERIES[:3]:
+            assert _ids(gen.retriever.retrieve(query)) == _ids(local.retriever.retrieve(query))
+    finally:
+        gen.vector.drop()
+    assert not any(p.is_alive() for p in processes)
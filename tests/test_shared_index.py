@@ -0,0 +1,135 @@
+from datetime import UTC, datetime
+
+import numpy as np
+import pytest
+
+from src.rag.analysis import default_analyzer
+from src.rag.bm25_index import BM25Index
+from src.rag.filters import FieldIndex, to_chroma_where
+from src.rag.models import Chunk, QueryFilters
+from src.rag.pipeline import RAGPipeline
+from src.rag.postings import Postings, bm25l_scores
+from tests.conftest import hashed_embed
+
+_TEXTS = [
+    "Python is a programming language",
+    "Java is also a programming language, like Python",
+    "Cooking recipes for pasta and pizza",
+    "Pasta sauce with tomato and basil",
+    "Programming pasta: a language for cooking robots",
+    "Gardening tips for tomato plants",
+]
+
+
+def _chunks() -> list[Chunk]:
+    return [
+        Chunk(
+            chunk_id=f"c{i}",
+            text=t,
+            source=f"docs/{'code' if i < 2 else 'food'}/f{i}.{'pdf' if i % 2 else 'md'}",
+            title="Code" if i < 2 else "Food",
+            page=i,
+            ingested_at=1_700_000_000 + i * 86_400,
+        )
+        for i, t in enumerate(_TEXTS)
+    ]
+
+
+def test_postings_scores_match_rank_bm25():
+    idx = BM25Index()
+    idx.build(_chunks())
+    postings = idx.to_postings()
+    for query in ["python programming", "pasta pasta tomato", "language", "unknownword"]:
+        tokens = idx.analyzer(query)
+        expected = idx._bm25.get_scores(idx._vocab.lookup(tokens))
+        np.testing.assert_allclose(bm25l_scores(postings, tokens), expected)
+
+
+def test_postings_roundtrip_mmap(tmp_path):
+    postings = Postings.from_corpus([default_analyzer()(t) for t in _TEXTS])
+    postings.save(tmp_path)
+    loaded = Postings.load(tmp_path)
+    assert isinstance(loaded.doc_ids, np.memmap)
+    assert loaded.vocab == postings.vocab
+    np.testing.assert_array_equal(loaded.indptr, postings.indptr)
+    np.testing.assert_array_equal(loaded.tfs, postings.tfs)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        QueryFilters(source_prefix="docs/food"),
+        QueryFilters(title="Code", page_max=0),
+        QueryFilters(file_types=["pdf"], page_min=2),
+        QueryFilters(ingested_after=datetime.fromtimestamp(1_700_200_000, tz=UTC)),
+    ],
+)
+def test_where_ids_matches_filter_ids(filters):
+    chunks = _chunks()
+    fields = FieldIndex(chunks)
+    where = to_chroma_where(filters, fields.sources)
+    np.testing.assert_array_equal(fields.where_ids(where), fields.filter_ids(filters))
+
+
+@pytest.fixture
+def embed():
+    return hashed_embed
+
+
+@pytest.fixture
+def pipeline(pipeline):
+    pipeline.index_chunks(_chunks())
+    return pipeline
+
+
+def _ids(results):
+    return [r.chunk.chunk_id for r in results]
+
+
+def test_shared_export_serves_same_results(pipeline, tmp_path):
+    out = tmp_path / "shared"
+    manifest = pipeline.export_shared(out)
+    assert manifest["chunks"] == len(_TEXTS)
+    assert manifest["dim"] == 8
+
+    shared = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "unused.json")
+    shared.load_shared(out)
+    assert shared.generation == pipeline.generation
+    assert shared.chunk_count == len(_TEXTS)
+
+    local_gen = pipeline._generations.current
+    shared_gen = shared._generations.current
+    filters = QueryFilters(source_prefix="docs/food")
+    for query in ["python programming", "pasta tomato", "cooking language"]:
+        for f in (None, filters):
+            expected = local_gen.bm25.search(query, top_k=4, filters=f)
+            got = shared_gen.bm25.search(query, top_k=4, filters=f)
+            assert _ids(got) == _ids(expected)
+            assert [r.score for r in got] == pytest.approx([r.score for r in expected])
+            assert got and got[0].chunk.text == expected[0].chunk.text
+
+        where = to_chroma_where(filters, local_gen.bm25.sources)
+        for w in (None, where):
+            expected = local_gen.vector.search(query, top_k=3, where=w)
+            got = shared_gen.vector.search(query, top_k=3, where=w)
+            assert _ids(got) == _ids(expected)
+            assert [r.score for r in got] == pytest.approx([r.score for r in expected], abs=1e-5)
+
+
+def test_shared_pipeline_is_read_only(pipeline, tmp_path):
+    out = tmp_path / "shared"
+    pipeline.export_shared(out)
+    shared = RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "unused.json")
+    shared.load_shared(out)
+    assert shared.read_only
+    with pytest.raises(RuntimeError, match="read-only"):
+        shared.index_chunks(_chunks())
+
+
+def test_reexport_replaces_in_place(pipeline, tmp_path):
+    out = tmp_path / "shared"
+    pipeline.export_shared(out)
+    pipeline.index_chunks(_chunks()[:3])
+    manifest = pipeline.export_shared(out)
+    assert manifest["chunks"] == 3
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("shared")) == ["shared"]
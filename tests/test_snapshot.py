@@ -0,0 +1,148 @@
+import json
+import tarfile
+
+import pytest
+
+from src.rag import startup
+from src.rag.config import settings
+from src.rag.models import Chunk
+from src.rag.pipeline import RAGPipeline
+from src.rag.snapshot import SnapshotError, create_snapshot, file_sha256, restore_snapshot
+from tests.conftest import hashed_embed
+
+
+def _chunks(prefix: str, n: int) -> list[Chunk]:
+    words = ["python", "pasta", "robot", "garden", "shard", "tomato"]
+    return [
+        Chunk(
+            chunk_id=f"{prefix}{i}",
+            text=f"{words[i % len(words)]} {words[(i * 5) % len(words)]} {prefix} note {i}",
+            source=f"docs/{prefix}{i // 3}.md",
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def embed():
+    return hashed_embed
+
+
+@pytest.fixture
+def pipeline(pipeline):
+    pipeline.index_chunks(_chunks("a", 12))
+    return pipeline
+
+
+def _served(tmp_path) -> RAGPipeline:
+    return RAGPipeline(docs_dir=tmp_path / "docs", bm25_path=tmp_path / "unused.json")
+
+
+def test_round_trip_serves_the_same_results(pipeline, tmp_path):
+    archive = tmp_path / "snaps" / "docs.tar.gz"
+    meta = create_snapshot(pipeline, archive, shards=0)
+    assert archive.exists()
+    sidecar = (tmp_path / "snaps" / "docs.tar.gz.sha256").read_text().split()
+    assert sidecar == [file_sha256(archive), "docs.tar.gz"]
+    assert "manifest.json" in meta["files"]
+
+    target = tmp_path / "replica"
+    restored = restore_snapshot(archive, target)
+    assert restored["manifest"]["chunks"] == 12
+    assert json.loads((target / "snapshot.json").read_text())["files"] == meta["files"]
+    assert not list(tmp_path.glob("replica.tmp-*"))
+
+    served = _served(tmp_path)
+    served.load_shared(target)
+    local = pipeline._generations.current.retriever
+    for query in ("python pasta", "robot garden", "note 7"):
+        got = served._generations.current.retriever.retrieve(query)
+        assert [r.chunk.chunk_id for r in got] == [r.chunk.chunk_id for r in local.retrieve(query)]
+
+
+def test_corrupt_archive_is_rejected_and_target_kept(pipeline, tmp_path):
+    archive = tmp_path / "docs.tar"
+    create_snapshot(pipeline, archive, shards=0)
+    target = tmp_path / "replica"
+    restore_snapshot(archive, target)
+    before = (target / "manifest.json").read_bytes()
+
+    data = bytearray(archive.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    archive.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError, match="checksum"):
+        restore_snapshot(archive, target)
+    assert (target / "manifest.json").read_bytes() == before
+    assert not list(tmp_path.glob("replica.tmp-*"))
+
+
+def test_tampered_file_fails_per_file_checksum(pipeline, tmp_path):
+    archive = tmp_path / "docs.tar"
+    create_snapshot(pipeline, archive, shards=0)
+    unpacked = tmp_path / "unpacked"
+    with tarfile.open(archive) as tar:
+        tar.extractall(unpacked)
+    (unpacked / "index" / "chunks" / "texts.bin").write_bytes(b"tampered")
+    repacked = tmp_path / "repacked.tar"  # no sidecar: only the manifest can catch it
+    with tarfile.open(repacked, "w") as tar:
+        tar.add(unpacked / "snapshot.json", arcname="snapshot.json")
+        tar.add(unpacked / "index", arcname="index")
+    with pytest.raises(SnapshotError, match="texts.bin"):
+        restore_snapshot(repacked, tmp_path / "replica")
+    assert not (tmp_path / "replica").exists()
+
+
+def test_unsafe_archive_entries_are_rejected(tmp_path):
+    evil = tmp_path / "evil.tar"
+    payload = tmp_path / "payload"
+    payload.write_text("x")
+    with tarfile.open(evil, "w") as tar:
+        tar.add(payload, arcname="../escaped")
+    with pytest.raises(SnapshotError, match="Unsafe"):
+        restore_snapshot(evil, tmp_path / "replica")
+    assert not (tmp_path.parent / "escaped").exists()
+
+
+def test_embedding_model_mismatch_is_rejected(pipeline, tmp_path, monkeypatch):
+    archive = tmp_path / "docs.tar"
+    create_snapshot(pipeline, archive, shards=0)
+    monkeypatch.setattr(settings, "embedding_model", "other/model")
+    with pytest.raises(SnapshotError, match="embedded with"):
+        restore_snapshot(archive, tmp_path / "replica")
+
+
+def test_fresh_node_provisions_from_snapshot_source(pipeline, tmp_path, monkeypatch):
+    archive = tmp_path / "docs.tar.gz"
+    create_snapshot(pipeline, archive, shards=0)
+    monkeypatch.setattr(settings, "snapshot_source", str(archive))
+    monkeypatch.setattr(settings, "shared_index_dir", None)
+    monkeypatch.setattr(settings, "data_dir", tmp_path / "node")
+
+    served = _served(tmp_path)
+    startup.load_or_ingest(served)
+    assert served.read_only
+    assert served.chunk_count == 12
+    assert settings.shared_index_dir == tmp_path / "node" / "shared"
+
+
+def test_hot_load_replaces_served_generation(pipeline, tmp_path):
+    old, new = tmp_path / "old.tar", tmp_path / "new.tar"
+    create_snapshot(pipeline, old, shards=0)
+    pipeline.index_chunks(_chunks("a", 12) + _chunks("b", 6))
+    create_snapshot(pipeline, new, shards=2)
+
+    target = tmp_path / "replica"
+    restore_snapshot(old, target)
+    served = _served(tmp_path)
+    served.load_shared(target)
+    assert served.chunk_count == 12
+
+    restore_snapshot(new, target)
+    served.load_shared(target)
+    gen = served._generations.current
+    try:
+        assert served.chunk_count == 18
+        ids = [r.chunk.chunk_id for r in gen.retriever.retrieve("note b")]
+        assert any(i.startswith("b") for i in ids)
+    finally:
+        gen.vector.drop()
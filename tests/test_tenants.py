@@ -0,0 +1,96 @@
+import pytest
+
+from src.rag.tenants import TenantRegistry, validate_tenant
+
+
+class _FakePipeline:
+    def __init__(self, name: str, size: int) -> None:
+        self.name = name
+        self.memory_bytes = size
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _registry(
+    budget: int, sizes: dict[str, int], loads: list[str], busy: set[str] | None = None
+) -> TenantRegistry:
+    def loader(name: str) -> _FakePipeline:
+        loads.append(name)
+        return _FakePipeline(name, sizes.get(name, 10))
+
+    return TenantRegistry(
+        budget_bytes=budget,
+        loader=loader,  # type: ignore[arg-type]
+        busy=(busy or set()).__contains__,
+    )
+
+
+def test_lazy_load_once():
+    loads: list[str] = []
+    reg = _registry(100, {}, loads)
+    assert reg.loaded == []
+    first = reg.get("team-a")
+    assert reg.get("team-a") is first
+    assert loads == ["team-a"]
+
+
+def test_lru_eviction_over_budget():
+    loads: list[str] = []
+    reg = _registry(100, {"a": 40, "b": 40, "c": 40}, loads)
+    reg.get("a")
+    reg.get("b")
+    reg.get("a")  # "b" is now least recently used
+    reg.get("c")
+    assert reg.loaded == ["a", "c"]
+    assert reg.memory_bytes == 80
+
+    reg.get("b")  # reloaded from disk on demand
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_single_tenant_over_budget_stays_loaded():
+    reg = _registry(10, {"big": 500}, [])
+    reg.get("big")
+    assert reg.loaded == ["big"]
+
+
+@pytest.mark.parametrize("name", ["", "Team", "../etc", "a" * 60, "-x"])
+def test_invalid_tenant_names(name):
+    with pytest.raises(ValueError):
+        validate_tenant(name)
+
+
+def test_eviction_closes_the_pipeline_and_reuses_it_while_referenced():
+    loads: list[str] = []
+    reg = _registry(50, {"a": 40, "b": 40}, loads)
+    a = reg.get("a")
+    reg.get("b")
+    assert reg.loaded == ["b"]
+    assert a.closed
+    # Still referenced (say by a running request), so no second pipeline is built
+    assert reg.get("a") is a
+    assert loads == ["a", "b"]
+
+
+def test_busy_tenants_are_not_evicted():
+    busy = {"a"}
+    reg = _registry(50, {"a": 40, "b": 40, "c": 40}, [], busy=busy)
+    reg.get("a")
+    reg.get("b")
+    reg.get("c")
+    assert reg.loaded == ["a", "c"]  # "a" has a job in flight; "b" went instead
+
+    busy.clear()
+    reg.refresh("c")  # the job finished
+    assert reg.loaded == ["c"]
+
+
+def test_memory_is_estimated_once_per_load_or_refresh():
+    reg = _registry(1000, {"a": 40}, [])
+    pipe = reg.get("a")
+    pipe.memory_bytes = 400  # not seen until the tenant is re-accounted
+    assert reg.memory_bytes == 40
+    reg.refresh("a")
+    assert reg.memory_bytes == 400